@@ -0,0 +1,102 @@
+"""
+Benchmark: IMAP FETCH header parsing.
+Compares the old email.message_from_bytes path with header_parser.parse_fetch_response.
+
+Usage (from backend/):
+    python bench/bench_header_parser.py                  # synthetic fixture, 50k messages
+    python bench/bench_header_parser.py -n 200000
+    python bench/bench_header_parser.py --fixture fetch.pickle
+
+A captured fixture is just the msg_data list returned by imaplib, pickled:
+    status, msg_data = mail.fetch('1:5000', '(BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE)])')
+    pickle.dump(msg_data, open('fetch.pickle', 'wb'))
+"""
+import argparse
+import email
+import os
+import pickle
+import random
+import sys
+import time
+from email.header import decode_header
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from header_parser import parse_fetch_response
+
+SENDERS = [
+    b'"Amazon.com" <store-news@amazon.com>',
+    b'=?UTF-8?B?TcO8bGxlciBHbWJI?= <info@mueller.de>',
+    b'=?UTF-8?Q?Caf=C3=A9?= =?UTF-8?Q?_du_Monde?= <hello@cafe.fr>',
+    b'LinkedIn <messages-noreply@linkedin.com>',
+    b'no-reply@accounts.google.com',
+    b'"Doe, John" <john.doe@example.com>',
+]
+SUBJECTS = [
+    b'Your order has shipped',
+    b'=?UTF-8?B?V2Vla2x5IGRpZ2VzdCDwn5OI?=',
+    b'Big sale this weekend only -\r\n 50% off everything',
+]
+
+
+def synthetic_fixture(n):
+    rnd = random.Random(42)
+    data = []
+    for seq in range(1, n + 1):
+        block = (b'From: ' + rnd.choice(SENDERS) + b'\r\n'
+                 b'Subject: ' + rnd.choice(SUBJECTS) + b'\r\n'
+                 b'Date: Mon, 6 Jan 2025 10:00:00 +0000\r\n\r\n')
+        prefix = b'%d (UID %d BODY[HEADER.FIELDS (FROM SUBJECT DATE)] {%d}' % (seq, seq + 1000, len(block))
+        data.append((prefix, block))
+        data.append(b')')
+    return data
+
+
+def legacy_parse(msg_data):
+    out = []
+    for part in msg_data:
+        if isinstance(part, tuple):
+            msg = email.message_from_bytes(part[1])
+            subject, encoding = decode_header(msg.get("Subject", "(No Subject)"))[0]
+            if isinstance(subject, bytes):
+                subject = subject.decode(encoding if encoding else "utf-8")
+            out.append((part[0].decode('utf-8').split(' ')[0], msg.get("From"), subject, msg.get("Date")))
+    return out
+
+
+def timed(fn, data, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=50000, help='messages in the synthetic fixture')
+    parser.add_argument('--fixture', help='pickled imaplib FETCH response to use instead')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.fixture:
+        with open(args.fixture, 'rb') as f:
+            data = pickle.load(f)
+    else:
+        data = synthetic_fixture(args.n)
+
+    fields = ('FROM', 'SUBJECT', 'DATE')
+    legacy_s, legacy = timed(legacy_parse, data, args.rounds)
+    fast_s, fast = timed(lambda d: parse_fetch_response(d, fields), data, args.rounds)
+
+    count = len(fast)
+    print(f"messages:     {count}")
+    print(f"legacy:       {legacy_s * 1e6 / max(len(legacy), 1):8.2f} us/msg  ({legacy_s:.3f}s)")
+    print(f"header_parser:{fast_s * 1e6 / max(count, 1):8.2f} us/msg  ({fast_s:.3f}s)")
+    print(f"speedup:      {legacy_s / fast_s:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark: memory per message of the scan state.
+Compares the old representation (list of bytes for ImapService.cached_ids, dicts with lists of
+str ids per sender) with the compact one (array('I') and SenderAggregate/IdList). The "+ dates"
+rows add each message's received time, as real scans do (kept per id for the search index).
+
+Usage (from backend/):
+    python bench/bench_memory.py                 # 500k messages, 500 senders
+    python bench/bench_memory.py -n 1000000
+
+Sizes are retained bytes measured with tracemalloc after the input data has been dropped.
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sender_aggregate import SenderAggregate
+
+
+def retained(build):
+    """Bytes still allocated by build()'s result once it returns."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def search_response(n):
+    # What imaplib hands back for SEARCH UNSEEN: one line of space separated numbers
+    return b' '.join(b'%d' % i for i in range(1, n + 1))
+
+
+def legacy_cached_ids(data):
+    return data.split()[::-1]
+
+
+def compact_cached_ids(data):
+    ids = array('I', map(int, data.split()))
+    ids.reverse()
+    return ids
+
+
+def sender_of(i, senders):
+    return f"Sender {(i * 2654435761) % senders}"
+
+
+def legacy_aggregates(ids, senders):
+    sender_map = {}
+    for i, msg_id in enumerate(ids):
+        name = sender_of(i, senders)
+        if name not in sender_map:
+            sender_map[name] = {'sender': name, 'email': '', 'domain': '', 'count': 0, 'ids': [], 'category': 'Unknown'}
+        sender_map[name]['count'] += 1
+        sender_map[name]['ids'].append(msg_id)
+    return sender_map
+
+
+def compact_aggregates(ids, senders, base, dates=False):
+    sender_map = {}
+    start = 1700000000
+    for i, msg_id in enumerate(ids):
+        name = sender_of(i, senders)
+        if name not in sender_map:
+            sender_map[name] = SenderAggregate(name, '', '', 'Unknown', id_base=base)
+        sender_map[name].add(msg_id, received=start + i * 60 if dates else None)
+    return sender_map
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scan state memory per message')
+    parser.add_argument('-n', type=int, default=500000, help='messages')
+    parser.add_argument('--senders', type=int, default=500)
+    args = parser.parse_args()
+    n = args.n
+
+    data = search_response(n)
+    rows = [
+        ("IMAP cached_ids", lambda: legacy_cached_ids(data), lambda: compact_cached_ids(data)),
+        # Ids as they come out of the parser / API response (fresh str objects)
+        ("IMAP sender ids", lambda: legacy_aggregates((str(i) for i in range(1, n + 1)), args.senders),
+         lambda: compact_aggregates((str(i) for i in range(1, n + 1)), args.senders, 10)),
+        ("Gmail sender ids", lambda: legacy_aggregates((f"{i + 0x18c0000000000:x}" for i in range(n)), args.senders),
+         lambda: compact_aggregates((f"{i + 0x18c0000000000:x}" for i in range(n)), args.senders, 16)),
+        ("IMAP + dates", lambda: legacy_aggregates((str(i) for i in range(1, n + 1)), args.senders),
+         lambda: compact_aggregates((str(i) for i in range(1, n + 1)), args.senders, 10, dates=True)),
+        ("Gmail + dates", lambda: legacy_aggregates((f"{i + 0x18c0000000000:x}" for i in range(n)), args.senders),
+         lambda: compact_aggregates((f"{i + 0x18c0000000000:x}" for i in range(n)), args.senders, 16, dates=True)),
+    ]
+
+    print(f"{n} messages, {args.senders} senders")
+    print(f"{'structure':<18} {'before':>12} {'after':>12} {'B/msg before':>13} {'B/msg after':>12} {'saved':>7}")
+    for label, before_fn, after_fn in rows:
+        before = retained(before_fn)
+        after = retained(after_fn)
+        print(f"{label:<18} {before / 1e6:>10.1f}MB {after / 1e6:>10.1f}MB {before / n:>13.1f} {after / n:>12.1f} "
+              f"{1 - after / before:>6.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+End-to-end check and timing of the one-click unsubscribe pipeline (unsubscribe_executor.py).
+Both providers run against their fake servers; the mailbox's List-Unsubscribe URLs point at
+fake_unsubscribe.py, served under two host names (127.0.0.1 and localhost) so per-host limits
+are visible. Checks that exactly one well-formed POST went out per one-click list and that
+no host saw more than --per-host concurrent requests.
+
+Usage (from backend/):
+    python bench/bench_unsubscribe.py
+    python bench/bench_unsubscribe.py --size 50000 --senders 2000 --latency-ms 100 --fail-rate 0.05
+"""
+import argparse
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import fake_gmail
+import fake_imap
+import fake_unsubscribe
+from synthetic import SyntheticMailbox
+from unsubscribe_executor import UnsubscribeExecutor, parse_list_unsubscribe
+
+
+def make_service(provider, mailbox, latency_ms):
+    if provider == 'gmail':
+        from gmail_service import GmailApiService
+        _, _, url = fake_gmail.serve(mailbox, latency_ms=latency_ms)
+        service = GmailApiService()
+        service.service = fake_gmail.make_gmail_service(url)
+        return service, [mailbox.message_id(i) for i in range(mailbox.size)]
+
+    import imap_service
+    _, _, (host, port) = fake_imap.serve(mailbox, latency_ms=latency_ms)
+    imap_service.IMAP_HOST, imap_service.IMAP_PORT, imap_service.IMAP_SSL = host, port, False
+    service = imap_service.ImapService()
+    service.authenticate('bench@example.com', 'bench')
+    return service, [str(mailbox.uids[i]) for i in range(mailbox.size)]
+
+
+def expected_one_click_lists(mailbox):
+    lists = set()
+    for i in range(mailbox.size):
+        headers = dict(mailbox.list_headers(i))
+        options = parse_list_unsubscribe(headers.get('List-Unsubscribe'), headers.get('List-Unsubscribe-Post'))
+        if options['oneClick']:
+            lists.add(headers['List-Id'])
+    return len(lists)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='One-click unsubscribe pipeline check')
+    parser.add_argument('--provider', choices=('gmail', 'imap', 'both'), default='both')
+    parser.add_argument('--size', type=int, default=5000, help='selected messages')
+    parser.add_argument('--senders', type=int, default=300)
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='per unsubscribe POST')
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--per-host', type=int, default=2)
+    parser.add_argument('--host-interval', type=float, default=0.01)
+    args = parser.parse_args()
+
+    _, unsub, url = fake_unsubscribe.serve(latency_ms=args.latency_ms, fail_rate=args.fail_rate)
+    port = url.rsplit(':', 1)[1]
+    urls = [url, f"http://localhost:{port}"]
+
+    ok = True
+    providers = ('gmail', 'imap') if args.provider == 'both' else (args.provider,)
+    for provider in providers:
+        mailbox = SyntheticMailbox(args.size, senders=args.senders, unsubscribe_urls=urls)
+        service, ids = make_service(provider, mailbox, 0.0)
+        expected = expected_one_click_lists(mailbox)
+        unsub.reset_stats()
+
+        start = time.perf_counter()
+        headers = service.get_unsubscribe_headers(ids)
+        fetched = time.perf_counter()
+        executor = UnsubscribeExecutor(workers=args.workers, per_host=args.per_host,
+                                       host_interval=args.host_interval, allow_private=True)
+        report = executor.run(headers)
+        done = time.perf_counter()
+
+        stats = unsub.stats()
+        statuses = {}
+        for entry in report['lists']:
+            statuses[entry['status']] = statuses.get(entry['status'], 0) + 1
+        print(f"== {provider} ==")
+        print(f"messages {report['messages']}  lists {len(report['lists'])}  one-click lists {expected}  "
+              f"outcomes {statuses}")
+        print(f"headers {fetched - start:.2f}s  unsubscribe {done - fetched:.2f}s  POSTs {stats['requests']}  "
+              f"duplicates {stats['duplicates']}  bad bodies {stats['badBodies']}  max in flight {stats['maxInFlight']}")
+
+        checks = {
+            "one POST per one-click list": stats['requests'] == expected and stats['duplicates'] == 0,
+            "RFC 8058 body": stats['badBodies'] == 0,
+            "per-host limit": all(n <= args.per_host for n in stats['maxInFlight'].values()),
+            "every message accounted for": sum(e['messages'] for e in report['lists']) + report['skipped'] == report['messages'],
+        }
+        for name, passed in checks.items():
+            print(f"  {'ok  ' if passed else 'FAIL'} {name}")
+            ok = ok and passed
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+Local fake of the Gmail REST API (the subset this app uses) including the /batch endpoint.
+Serves a SyntheticMailbox with injectable latency and 429 rate.
+
+    python bench/fake_gmail.py --port 8765 --size 100000 --latency-ms 20 --rate-429 0.02
+
+Clients are pointed at it with make_gmail_service(url), which builds a googleapiclient
+service from the bundled discovery document with rootUrl rewritten.
+"""
+import argparse
+import email
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from synthetic import SyntheticMailbox
+
+API_PREFIX = '/gmail/v1/users/me'
+BATCH_PATH = '/batch'  # bundled discovery doc uses 'batch'; Google also serves /batch/gmail/v1
+
+_RATE_LIMIT_ERROR = {
+    "error": {"code": 429, "message": "Too many concurrent requests for user", "status": "RESOURCE_EXHAUSTED"}
+}
+
+
+class FakeGmail:
+    """Request routing and state, independent of the HTTP transport."""
+
+    def __init__(self, mailbox, latency_ms=0.0, per_item_ms=0.0, rate_429=0.0, seed=7):
+        self.mailbox = mailbox
+        self.latency = latency_ms / 1000.0
+        self.per_item = per_item_ms / 1000.0
+        self.rate_429 = rate_429
+        self.history_id = 1000
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._rnd = random.Random(seed)
+
+    def _count(self, name, status):
+        with self._lock:
+            key = f"{name}:{status}"
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.calls)
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = {}
+
+    def _throttled(self):
+        if not self.rate_429:
+            return False
+        with self._lock:
+            return self._rnd.random() < self.rate_429
+
+    def _message_resource(self, i, header_names=None):
+        mb = self.mailbox
+        labels = ['INBOX'] + (['UNREAD'] if mb.unread[i] else [])
+        return {
+            "id": mb.message_id(i),
+            "threadId": mb.thread_id(i),
+            "labelIds": labels,
+            "snippet": f"{mb.subject(i)} - synthetic message {i}",
+            "internalDate": str(mb.internal_date(i) * 1000),
+            "sizeEstimate": 2048,
+            "payload": {"headers": [{"name": k, "value": v} for k, v in mb.headers(i, header_names)]},
+        }
+
+    def handle(self, method, target, body, in_batch=False):
+        """Returns (status, json_dict). Counts the call."""
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+        path = url.path
+        if not path.startswith(API_PREFIX):
+            return 404, {"error": {"code": 404, "message": f"Unknown path {path}"}}
+        path = path[len(API_PREFIX):]
+
+        name, status, result = self._route(method, path, params, body, in_batch)
+        self._count(name, status)
+        return status, result
+
+    def _route(self, method, path, params, body, in_batch):
+        mb = self.mailbox
+        first = lambda key, default=None: params.get(key, [default])[0]
+
+        if in_batch and self._throttled():
+            return 'throttled', 429, _RATE_LIMIT_ERROR
+
+        if path == '/profile':
+            return 'users.getProfile', 200, {"emailAddress": "bench@example.com", "historyId": str(self.history_id)}
+
+        if path == '/labels/INBOX':
+            unread = mb.unread_count()
+            return 'labels.get', 200, {
+                "id": "INBOX", "messagesUnread": unread,
+                "threadsUnread": (unread + mb.thread_size - 1) // mb.thread_size,
+            }
+
+        if path == '/history':
+            return 'history.list', 200, {"historyId": str(self.history_id)}
+
+        if path == '/messages' and method == 'GET':
+            limit = min(int(first('maxResults', 100)), 500)
+            token = first('pageToken')
+            indexes, next_start = mb.unread_page(int(token) if token else None, limit)
+            result = {"messages": [{"id": mb.message_id(i), "threadId": mb.thread_id(i)} for i in indexes],
+                      "resultSizeEstimate": len(indexes)}
+            if next_start is not None and indexes:
+                result["nextPageToken"] = str(next_start)
+            return 'messages.list', 200, result
+
+        if path in ('/messages/batchModify', '/messages/batchDelete'):
+            payload = json.loads(body or b'{}')
+            for mid in payload.get('ids', []):
+                i = mb.index_of(mid)
+                if path.endswith('batchDelete') or 'TRASH' in payload.get('addLabelIds', []):
+                    mb.mark_deleted(i)
+                if 'UNREAD' in payload.get('removeLabelIds', []):
+                    mb.unread[i] = 0
+            self.history_id += 1
+            return 'messages.' + path.rsplit('/', 1)[1], 204, None
+
+        match = re.match(r'^/messages/([0-9a-f]+)$', path)
+        if match:
+            i = mb.index_of(match.group(1))
+            if not 0 <= i < mb.size or mb.deleted[i]:
+                return 'messages.get', 404, {"error": {"code": 404, "message": "Not Found"}}
+            return 'messages.get', 200, self._message_resource(i, params.get('metadataHeaders'))
+
+        if path == '/threads':
+            limit = min(int(first('maxResults', 100)), 500)
+            token = first('pageToken')
+            # Walk unread messages newest first and collect distinct threads
+            start = int(token) if token else None
+            threads, seen = [], set()
+            while len(threads) < limit:
+                indexes, start = mb.unread_page(start, limit)
+                for i in indexes:
+                    tid = mb.thread_id(i)
+                    if tid not in seen:
+                        seen.add(tid)
+                        threads.append({"id": tid})
+                if start is None:
+                    break
+            result = {"threads": threads[:limit]}
+            if start is not None:
+                result["nextPageToken"] = str(start)
+            return 'threads.list', 200, result
+
+        match = re.match(r'^/threads/([0-9a-f]+)$', path)
+        if match:
+            names = params.get('metadataHeaders')
+            messages = [self._message_resource(i, names) for i in mb.thread_messages(match.group(1))
+                        if not mb.deleted[i]]
+            return 'threads.get', 200, {"id": match.group(1), "messages": messages}
+
+        return 'unknown', 404, {"error": {"code": 404, "message": f"Unknown path {path}"}}
+
+    def handle_batch(self, content_type, body):
+        """Parses a multipart/mixed batch and returns (content_type, body) of the response."""
+        message = email.message_from_bytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+        parts = message.get_payload() if message.is_multipart() else []
+        if self.latency or self.per_item:
+            time.sleep(self.latency + self.per_item * len(parts))
+        self._count('batch', 200)
+
+        boundary = f"batch_{uuid.uuid4().hex}"
+        out = []
+        for part in parts:
+            content_id = (part.get('Content-ID') or '').strip('<>')
+            raw = part.get_payload(decode=False)
+            if isinstance(raw, list):
+                raw = raw[0].as_string()
+            head, _, sub_body = raw.partition('\r\n\r\n') if '\r\n\r\n' in raw else raw.partition('\n\n')
+            request_line = head.splitlines()[0]
+            method, target, _ = request_line.split(' ', 2)
+            status, result = self.handle(method, target, sub_body.encode(), in_batch=True)
+            payload = json.dumps(result) if result is not None else ''
+            out.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n"
+                f"Content-Length: {len(payload.encode())}\r\n\r\n{payload}\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        return f"multipart/mixed; boundary={boundary}", ''.join(out).encode()
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body, content_type='application/json; charset=UTF-8'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        def _dispatch(self, method):
+            body = self._body()
+            if self.path == '/_stats':
+                return self._send(200, json.dumps(fake.stats()).encode())
+            if self.path == '/_reset':
+                fake.reset_stats()
+                return self._send(200, b'{}')
+            if self.path.startswith(BATCH_PATH):
+                content_type, payload = fake.handle_batch(self.headers.get('Content-Type', ''), body)
+                return self._send(200, payload, content_type)
+            if fake.latency:
+                time.sleep(fake.latency)
+            status, result = fake.handle(method, self.path, body)
+            self._send(status, json.dumps(result).encode() if result is not None else b'')
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+    return Handler
+
+
+def serve(mailbox, host='127.0.0.1', port=0, **options):
+    """Starts the server in a background thread; returns (server, fake, base_url)."""
+    fake = FakeGmail(mailbox, **options)
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, fake, f"http://{host}:{server.server_address[1]}/"
+
+
+def make_gmail_service(base_url):
+    """googleapiclient Gmail service whose REST and batch calls go to base_url."""
+    import httplib2
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+
+    doc = json.loads(get_static_doc('gmail', 'v1'))
+    doc['rootUrl'] = base_url
+    doc['baseUrl'] = base_url + doc['servicePath']
+    return build_from_document(doc, http=httplib2.Http())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Gmail API server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--size', type=int, default=10000, help='messages in the mailbox')
+    parser.add_argument('--senders', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='per HTTP round trip')
+    parser.add_argument('--per-item-ms', type=float, default=0.0, help='extra per batch sub-request')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='probability per batch sub-request')
+    args = parser.parse_args()
+
+    server, _, url = serve(SyntheticMailbox(args.size, senders=args.senders), args.host, args.port,
+                           latency_ms=args.latency_ms, per_item_ms=args.per_item_ms, rate_429=args.rate_429)
+    print(f"Fake Gmail API listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
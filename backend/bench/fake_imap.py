@@ -0,0 +1,324 @@
+"""
+Local fake IMAP server (plaintext, the subset this app uses) over a SyntheticMailbox.
+
+    python bench/fake_imap.py --port 1143 --size 100000 --latency-ms 5
+
+Point the app at it with IMAP_HOST=127.0.0.1 IMAP_PORT=1143 IMAP_SSL=0; any login is accepted.
+Sequence number n is message index n-1 and its UID is mailbox.uids[n-1]. Messages are never
+expunged, so sequence numbers stay stable for the whole run (Gmail's auto-expunge is not modelled).
+"""
+import argparse
+import re
+import socketserver
+import threading
+import time
+from email.header import Header
+
+from synthetic import SyntheticMailbox
+
+CAPABILITIES = "IMAP4rev1 IDLE UIDPLUS X-GM-EXT-1"
+_LITERAL_RE = re.compile(rb'\{(\d+)\+?\}\r\n$')
+_HEADER_FIELDS_RE = re.compile(r'BODY(?:\.PEEK)?\[HEADER\.FIELDS \(([^)]*)\)\]', re.I)
+_GM_TERM_RE = re.compile(r'(-?)(\w+):("[^"]*"|\S+)|(\S+)')
+
+
+def _parse_set(text, maximum):
+    """'1,3:5,*' -> sorted list of ints within 1..maximum."""
+    result = set()
+    for part in text.split(','):
+        if ':' in part:
+            a, b = part.split(':', 1)
+            a = maximum if a == '*' else int(a)
+            b = maximum if b == '*' else int(b)
+            result.update(range(min(a, b), min(max(a, b), maximum) + 1))
+        else:
+            n = maximum if part == '*' else int(part)
+            if n <= maximum:
+                result.add(n)
+    return sorted(n for n in result if n >= 1)
+
+
+def _tokenize(text):
+    """Splits command arguments, keeping quoted strings and parenthesised lists whole."""
+    tokens, i = [], 0
+    while i < len(text):
+        c = text[i]
+        if c == ' ':
+            i += 1
+        elif c == '"':
+            j, buf = i + 1, []
+            while j < len(text) and text[j] != '"':
+                if text[j] == '\\':
+                    j += 1
+                buf.append(text[j])
+                j += 1
+            tokens.append(''.join(buf))
+            i = j + 1
+        else:
+            # Atoms run to the next space outside () and [], so a parenthesised list or
+            # 'BODY.PEEK[HEADER.FIELDS (FROM)]' stays one token
+            depth, j = 0, i
+            while j < len(text) and (depth or text[j] != ' '):
+                if text[j] in '([':
+                    depth += 1
+                elif text[j] in ')]':
+                    depth -= 1
+                j += 1
+            tokens.append(text[i:j])
+            i = j
+    return tokens
+
+
+def _encode_header(value):
+    return value if value.isascii() else Header(value, 'utf-8').encode()
+
+
+class FakeImap:
+    """Mailbox operations and call counting shared by all connections."""
+
+    def __init__(self, mailbox, latency_ms=0.0, gm_ext=True):
+        self.mailbox = mailbox
+        self.latency = latency_ms / 1000.0
+        self.capabilities = CAPABILITIES if gm_ext else CAPABILITIES.replace(' X-GM-EXT-1', '')
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def count(self, command, status):
+        with self._lock:
+            key = f"{command}:{status}"
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.calls)
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = {}
+
+    def search(self, criteria):
+        """Returns matching sequence numbers for UNSEEN / ALL / X-GM-RAW <query>."""
+        mb = self.mailbox
+        upper = [c.upper() for c in criteria]
+        if 'X-GM-RAW' in upper:
+            return self._gm_raw(criteria[upper.index('X-GM-RAW') + 1])
+        if 'UNSEEN' in upper:
+            return [i + 1 for i in range(mb.size) if mb.unread[i]]
+        return [i + 1 for i in range(mb.size) if not mb.deleted[i]]
+
+    def _gm_raw(self, query):
+        # Enough of Gmail's search syntax for benchmarks: is:unread, from:, older_than:/newer_than:
+        mb = self.mailbox
+        tests = []
+        for negate, key, value, bare in _GM_TERM_RE.findall(query):
+            value = value.strip('"').lower()
+            if bare:
+                needle = bare.lower()
+                test = lambda i, n=needle: n in mb.from_header(i).lower() or n in mb.subject(i).lower()
+            elif key == 'is' and value == 'unread':
+                test = lambda i: mb.unread[i]
+            elif key == 'from':
+                test = lambda i, n=value: n in mb.from_header(i).lower()
+            elif key in ('older_than', 'newer_than'):
+                units = {'d': 86400, 'm': 30 * 86400, 'y': 365 * 86400}
+                cutoff = time.time() - int(value[:-1]) * units.get(value[-1], 86400)
+                if key == 'older_than':
+                    test = lambda i, c=cutoff: mb.internal_date(i) < c
+                else:
+                    test = lambda i, c=cutoff: mb.internal_date(i) >= c
+            else:
+                continue
+            tests.append((bool(negate), test))
+        return [i + 1 for i in range(mb.size)
+                if not mb.deleted[i] and all(bool(t(i)) != neg for neg, t in tests)]
+
+    def fetch_item(self, i, item):
+        """One FETCH data item for message index i; returns bytes (literal payload last)."""
+        mb = self.mailbox
+        name = item.upper()
+        if name == 'UID':
+            return f"UID {mb.uids[i]}".encode()
+        if name == 'FLAGS':
+            flags = [] if mb.unread[i] else ['\\Seen']
+            if mb.deleted[i]:
+                flags.append('\\Deleted')
+            return f"FLAGS ({' '.join(flags)})".encode()
+        if name == 'INTERNALDATE':
+            stamp = time.strftime("%d-%b-%Y %H:%M:%S +0000", time.gmtime(mb.internal_date(i)))
+            return f'INTERNALDATE "{stamp}"'.encode()
+        if name == 'X-GM-MSGID':
+            return f"X-GM-MSGID {int(mb.message_id(i), 16)}".encode()
+        if name == 'X-GM-THRID':
+            return f"X-GM-THRID {int(mb.thread_id(i), 16)}".encode()
+        if name == 'X-GM-LABELS':
+            labels = ['"\\\\Inbox"'] + (['"\\\\Important"'] if i % 7 == 0 else [])
+            return f"X-GM-LABELS ({' '.join(labels)})".encode()
+        match = _HEADER_FIELDS_RE.match(item)
+        if match:
+            names = match.group(1).split()
+            block = ''.join(f"{k}: {_encode_header(v)}\r\n" for k, v in mb.headers(i, names)) + '\r\n'
+            payload = block.encode('ascii')
+            label = f"BODY[HEADER.FIELDS ({match.group(1).upper()})]"
+            return label.encode() + b' {' + str(len(payload)).encode() + b'}\r\n' + payload
+        return b''
+
+
+class ImapHandler(socketserver.StreamRequestHandler):
+    fake = None
+
+    def send(self, line):
+        self.wfile.write(line if isinstance(line, bytes) else line.encode())
+
+    def read_command(self):
+        """Reads one command line, resolving {n} literals; returns str or None on EOF."""
+        data = b''
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return None
+            match = _LITERAL_RE.search(line)
+            if not match:
+                return (data + line).rstrip(b'\r\n').decode('utf-8')
+            if not line.rstrip().endswith(b'+}'):
+                self.send(b'+ Ready for literal\r\n')
+            size = int(match.group(1))
+            literal = self.rfile.read(size)
+            data += line[:match.start()] + b'"' + literal.replace(b'\\', b'\\\\').replace(b'"', b'\\"') + b'"'
+
+    def handle(self):
+        self.selected = False
+        self.send(f"* OK [CAPABILITY {self.fake.capabilities}] Fake IMAP ready\r\n")
+        while True:
+            line = self.read_command()
+            if line is None:
+                return
+            tag, _, rest = line.partition(' ')
+            command, _, args = rest.partition(' ')
+            command = command.upper()
+            uid = False
+            if command == 'UID':
+                uid = True
+                command, _, args = args.partition(' ')
+                command = command.upper()
+            if self.fake.latency:
+                time.sleep(self.fake.latency)
+            try:
+                status = self.dispatch(tag, command, _tokenize(args), uid)
+            except Exception as e:
+                self.send(f"{tag} BAD {e}\r\n")
+                status = 'BAD'
+            self.fake.count(('UID ' if uid else '') + command, status)
+            if command == 'LOGOUT':
+                return
+            self.wfile.flush()
+
+    def dispatch(self, tag, command, args, uid):
+        fake, mb = self.fake, self.fake.mailbox
+        if command == 'CAPABILITY':
+            self.send(f"* CAPABILITY {fake.capabilities}\r\n")
+        elif command in ('LOGIN', 'AUTHENTICATE'):
+            pass
+        elif command in ('SELECT', 'EXAMINE'):
+            self.selected = True
+            self.send(f"* {mb.size} EXISTS\r\n* 0 RECENT\r\n"
+                      f"* OK [UIDVALIDITY 1] UIDs valid\r\n* OK [UIDNEXT {mb.uids[-1] + 1 if mb.size else 1}]\r\n"
+                      "* FLAGS (\\Seen \\Deleted \\Flagged)\r\n")
+            mode = 'READ-ONLY' if command == 'EXAMINE' else 'READ-WRITE'
+            self.send(f"{tag} OK [{mode}] {command} completed\r\n")
+            return 'OK'
+        elif command == 'STATUS':
+            self.send(f'* STATUS "{args[0]}" (UNSEEN {mb.unread_count()})\r\n')
+        elif command == 'SEARCH':
+            if args and args[0].upper() == 'CHARSET':
+                args = args[2:]
+            found = fake.search(args)
+            if uid:
+                found = [mb.uids[n - 1] for n in found]
+            self.send('* SEARCH' + ''.join(f' {n}' for n in found) + '\r\n')
+        elif command == 'FETCH':
+            items = args[1].strip('()') if args[1].startswith('(') else args[1]
+            items = _tokenize(items)
+            if uid and 'UID' not in (i.upper() for i in items):
+                items.insert(0, 'UID')
+            # Literal-bearing items go last so the response stays one imaplib tuple per message
+            items.sort(key=lambda i: i.upper().startswith('BODY'))
+            out = []
+            for seq in self._resolve(args[0], uid):
+                parts = [fake.fetch_item(seq - 1, item) for item in items]
+                out.append(f"* {seq} FETCH (".encode() + b' '.join(parts) + b')\r\n')
+            self.send(b''.join(out))
+        elif command == 'STORE':
+            flags = args[2].strip('()').split()
+            add = not args[1].startswith('-')
+            for seq in self._resolve(args[0], uid):
+                i = seq - 1
+                if '\\Seen' in flags:
+                    mb.unread[i] = 0 if add else 1
+                if '\\Deleted' in flags and add:
+                    mb.mark_deleted(i)
+        elif command in ('COPY', 'MOVE'):
+            if command == 'MOVE':
+                for seq in self._resolve(args[0], uid):
+                    mb.mark_deleted(seq - 1)
+        elif command == 'IDLE':
+            self.send("+ idling\r\n")
+            self.wfile.flush()
+            while True:
+                line = self.rfile.readline()
+                if not line or line.strip().upper() == b'DONE':
+                    break
+        elif command in ('NOOP', 'EXPUNGE', 'CLOSE', 'UNSELECT', 'CHECK'):
+            pass
+        elif command == 'LOGOUT':
+            self.send("* BYE Fake IMAP logging out\r\n")
+        else:
+            self.send(f"{tag} BAD Unknown command {command}\r\n")
+            return 'BAD'
+        self.send(f"{tag} OK {command} completed\r\n")
+        return 'OK'
+
+    def _resolve(self, id_set, uid):
+        """Sequence numbers addressed by a sequence set (or UID set)."""
+        mb = self.fake.mailbox
+        if not uid:
+            return _parse_set(id_set, mb.size)
+        # UIDs are never reused and uids is ascending, so a UID is its own index + 1 here
+        top = mb.uids[-1] if mb.size else 0
+        return [u for u in _parse_set(id_set, top) if u <= mb.size and mb.uids[u - 1] == u]
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def serve(mailbox, host='127.0.0.1', port=0, **options):
+    """Starts the server in a background thread; returns (server, fake, (host, port))."""
+    fake = FakeImap(mailbox, **options)
+    handler = type('Handler', (ImapHandler,), {'fake': fake})
+    server = _Server((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, fake, (host, server.server_address[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake IMAP server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1143)
+    parser.add_argument('--size', type=int, default=10000, help='messages in the mailbox')
+    parser.add_argument('--senders', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='per command')
+    parser.add_argument('--no-gm-ext', action='store_true', help='do not advertise X-GM-EXT-1')
+    args = parser.parse_args()
+
+    server, _, (host, port) = serve(SyntheticMailbox(args.size, senders=args.senders), args.host, args.port,
+                                    latency_ms=args.latency_ms, gm_ext=not args.no_gm_ext)
+    print(f"Fake IMAP listening on {host}:{port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Local stand-in for the one-click unsubscribe endpoints of mailing lists (RFC 8058).
+Accepts POST /u/<list> and records every request: body, Host, and the concurrency seen per
+host, so tests can check that exactly one well-formed POST went out per list and that the
+executor's per-host limits hold. Latency, failures and redirects are injectable.
+
+    python bench/fake_unsubscribe.py --port 8766 --latency-ms 50 --fail-rate 0.1
+
+Point SyntheticMailbox(unsubscribe_urls=[...]) at it; run the app with
+UNSUBSCRIBE_ALLOW_PRIVATE=1 so plain http on 127.0.0.1 is allowed.
+"""
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+ONE_CLICK_BODY = b'List-Unsubscribe=One-Click'
+
+
+class FakeUnsubscribe:
+    def __init__(self, latency_ms=0.0, fail_rate=0.0, redirect_rate=0.0, seed=11):
+        self.latency = latency_ms / 1000.0
+        self.fail_rate = fail_rate
+        self.redirect_rate = redirect_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = []              # (host, path, ok body, status)
+            self.in_flight = {}
+            self.max_in_flight = {}         # host -> peak concurrent requests
+            self.starts = {}                # host -> [monotonic start times]
+
+    def enter(self, host):
+        with self._lock:
+            self.in_flight[host] = self.in_flight.get(host, 0) + 1
+            self.max_in_flight[host] = max(self.max_in_flight.get(host, 0), self.in_flight[host])
+            self.starts.setdefault(host, []).append(time.monotonic())
+
+    def leave(self, host):
+        with self._lock:
+            self.in_flight[host] -= 1
+
+    def handle(self, method, host, path, body):
+        """Returns (status, headers)."""
+        if method != 'POST' or not path.startswith('/u/'):
+            status = 405 if path.startswith('/u/') else 404
+        else:
+            with self._lock:
+                roll = self._random.random()
+            if roll < self.fail_rate:
+                status = 503
+            elif roll < self.fail_rate + self.redirect_rate:
+                status = 302
+            else:
+                status = 200
+        with self._lock:
+            self.requests.append((host, path, body == ONE_CLICK_BODY, status))
+        headers = {'Location': f"http://{host}/landing"} if status == 302 else {}
+        return status, headers
+
+    def stats(self):
+        with self._lock:
+            lists = {}
+            for _, path, _, _ in self.requests:
+                key = urlsplit(path).path
+                lists[key] = lists.get(key, 0) + 1
+            gaps = {}
+            for host, starts in self.starts.items():
+                ordered = sorted(starts)
+                gaps[host] = min((b - a for a, b in zip(ordered, ordered[1:])), default=None)
+            return {
+                "requests": len(self.requests),
+                "lists": len(lists),
+                "duplicates": sum(n - 1 for n in lists.values()),
+                "badBodies": sum(1 for r in self.requests if not r[2]),
+                "byStatus": {str(s): sum(1 for r in self.requests if r[3] == s) for s in {r[3] for r in self.requests}},
+                "maxInFlight": dict(self.max_in_flight),
+                "minStartGapSeconds": gaps,
+            }
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _dispatch(self, method):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            host = self.headers.get('Host', '')
+            fake.enter(host)
+            try:
+                if fake.latency:
+                    time.sleep(fake.latency)
+                status, headers = fake.handle(method, host, self.path, body)
+            finally:
+                fake.leave(host)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+    return Handler
+
+
+def serve(host='127.0.0.1', port=0, **options):
+    """Starts the server in a background thread; returns (server, fake, base_url)."""
+    fake = FakeUnsubscribe(**options)
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, fake, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake one-click unsubscribe endpoint')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='probability of a 503')
+    parser.add_argument('--redirect-rate', type=float, default=0.0, help='probability of a 302')
+    args = parser.parse_args()
+
+    server, _, url = serve(args.host, args.port, latency_ms=args.latency_ms, fail_rate=args.fail_rate,
+                           redirect_rate=args.redirect_rate)
+    print(f"Fake unsubscribe endpoint listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
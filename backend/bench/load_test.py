@@ -0,0 +1,402 @@
+"""
+Concurrent-session load test of the FastAPI app against the fake providers.
+
+Three processes: the fake Gmail/IMAP servers (see run_bench.py), the app under uvicorn (working
+directory in a temp dir so data/history.json is throwaway), and this load generator. Each
+simulated session is a thread with its own keep-alive connection that follows Dashboard.tsx:
+
+    GET  /api/stats
+    GET  /api/senders?limit=500[&pageToken=...]   until --pages pages or no nextPageToken,
+                                                  50 ms "breath" between pages
+    POST /api/emails/batch      first 50 ids of the top sender (SenderDetailsModal)
+    POST /api/emails/delete-all top sender's ids and {sender: count} breakdown (history.json write)
+    GET  /api/history
+
+All sessions share one synthetic mailbox per provider, so a delete-all in one session can turn
+ids another session is fetching into 404s (logged by the app, not failures). The app's output goes
+to app.log in its temp directory.
+
+IMAP sessions log in through /api/auth/imap; Gmail sessions are pre-registered in the app's
+`sessions` dict with a client pointed at the fake server (there is no OAuth to go through).
+While the test runs /api/metrics is sampled for threadpool use, in-flight requests and the
+session count; the app's RSS comes from /proc.
+
+--workers N runs `uvicorn main:app --workers N` with SHARED_STATE=1 instead (see shared_state.py):
+Gmail sessions are written to data/state.db with dummy credentials and GMAIL_API_URL points the
+workers at the fake server, so every worker restores them on first use; requests land on
+whichever worker accepts the connection. Metrics then come from one worker per scrape, so the
+sampled peaks are per worker; RSS is summed over the worker processes. Compare flowsPerSecond
+across --workers 1, 2, 4...: it can only grow with N while there are idle cores (the fake
+servers and this load generator need CPU too).
+
+Usage (from backend/):
+    python bench/load_test.py --sessions 20
+    python bench/load_test.py --sessions 100 --ramp 10 --provider imap --latency-ms 20
+    python bench/load_test.py --sessions 200 --threadpool 100 --out load.json
+    python bench/load_test.py --sessions 100 --workers 4 --latency-ms 5
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import re
+import secrets
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from run_bench import Servers, percentile, git_commit
+
+SAMPLED_METRICS = ('threadpool_threads_busy', 'threadpool_waiting', 'http_requests_in_progress',
+                   'active_sessions', 'active_unread_watchers')
+_METRIC_LINE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})? (\S+)$')
+
+
+def _app_process(port, addresses, gmail_sessions, threadpool):
+    """Child process: uvicorn serving main.app with Gmail sessions pre-registered."""
+    host, imap_port = addresses['imap']
+    os.environ.update(IMAP_HOST=host, IMAP_PORT=str(imap_port), IMAP_SSL='0')
+    if threadpool:
+        os.environ['THREADPOOL_SIZE'] = str(threadpool)
+    os.chdir(tempfile.mkdtemp(prefix='loadtest-'))
+    # The app's debug prints would drown the report; keep them next to the throwaway history
+    log = open('app.log', 'w', buffering=1)
+    sys.stdout = sys.stderr = log
+    print(f"load test app log, cwd {os.getcwd()}")
+
+    import uvicorn
+    import main
+    from fake_gmail import make_gmail_service
+    from gmail_service import GmailApiService
+
+    for token in gmail_sessions:
+        service = GmailApiService()
+        service.service = make_gmail_service(addresses['gmail'])
+        main.sessions[token] = service
+
+    config = uvicorn.Config(main.app, host='127.0.0.1', port=port, log_level='warning', access_log=False)
+    uvicorn.Server(config).run()
+
+
+def _workers_process(port, addresses, gmail_sessions, threadpool, workers):
+    """Child process: uvicorn with several workers sharing sessions through data/state.db."""
+    host, imap_port = addresses['imap']
+    os.environ.update(IMAP_HOST=host, IMAP_PORT=str(imap_port), IMAP_SSL='0', SHARED_STATE='1',
+                      GMAIL_API_URL=addresses['gmail'])
+    os.environ.setdefault('SHARED_STATE_KEY', secrets.token_hex(32))
+    if threadpool:
+        os.environ['THREADPOOL_SIZE'] = str(threadpool)
+    os.chdir(tempfile.mkdtemp(prefix='loadtest-'))
+    # Workers are spawned, not forked: redirect the file descriptors so their output lands here too
+    log = open('app.log', 'w', buffering=1)
+    os.dup2(log.fileno(), 1)
+    os.dup2(log.fileno(), 2)
+    print(f"load test app log ({workers} workers), cwd {os.getcwd()}", flush=True)
+
+    import uvicorn
+    from shared_state import SharedState
+
+    store = SharedState()
+    # An expiry far ahead, or google-auth treats the token as expired and tries to refresh it
+    credentials = {"token": "loadtest", "refresh_token": "loadtest", "client_id": "loadtest",
+                   "client_secret": "loadtest", "expiry": "2100-01-01T00:00:00Z"}
+    for token in gmail_sessions:
+        store.save_session(token, 'gmail', None, {"credentials": credentials})
+
+    uvicorn.run('main:app', host='127.0.0.1', port=port, workers=workers, log_level='warning', access_log=False)
+
+
+def free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def scrape(port):
+    """{metric name: value} for unlabelled samples of /api/metrics (histograms summed per name)."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('GET', '/api/metrics')
+    text = conn.getresponse().read().decode()
+    conn.close()
+    values = {}
+    for line in text.splitlines():
+        match = _METRIC_LINE_RE.match(line)
+        if match and not line.startswith('#'):
+            name, labels, value = match.groups()
+            if labels and (name.endswith('_sum') or name.endswith('_count')):
+                labels = None
+            if not labels:
+                values[name] = values.get(name, 0.0) + float(value)
+    return values
+
+
+def rss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def tree_rss_kb(pid):
+    """RSS of pid and all its descendants (uvicorn's supervisor and workers)."""
+    total = rss_kb(pid) or 0
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            children = [int(c) for c in f.read().split()]
+    except OSError:
+        children = []
+    return total + sum(tree_rss_kb(child) for child in children)
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}   # endpoint -> [seconds]
+        self.errors = {}    # endpoint -> {status: count}
+        self.lock = threading.Lock()
+
+    def add(self, endpoint, seconds, status):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            if status >= 400:
+                bucket = self.errors.setdefault(endpoint, {})
+                bucket[status] = bucket.get(status, 0) + 1
+
+
+class Session(threading.Thread):
+    def __init__(self, port, token, provider, args, recorder):
+        super().__init__(daemon=True)
+        self.port = port
+        self.token = token
+        self.provider = provider
+        self.args = args
+        self.recorder = recorder
+        self.conn = None
+        self.completed = 0
+        self.failed = None
+
+    def request(self, endpoint, method, path, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['X-Auth-Token'] = self.token
+        payload = json.dumps(body).encode() if body is not None else None
+        start = time.perf_counter()
+        for attempt in (1, 2):
+            try:
+                if self.conn is None:
+                    self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=self.args.timeout)
+                self.conn.request(method, path, body=payload, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # Dropped keep-alive connection: reconnect once, like a browser would
+                self.conn = None
+                if attempt == 2:
+                    raise
+        self.recorder.add(endpoint, time.perf_counter() - start, response.status)
+        if response.status >= 400:
+            raise RuntimeError(f"{endpoint} -> {response.status}: {data[:200]!r}")
+        return json.loads(data) if data else None
+
+    def run(self):
+        try:
+            if self.provider == 'imap':
+                login = self.request('auth/imap', 'POST', '/api/auth/imap',
+                                     {'email': f'{self.name}@example.com', 'password': 'bench'})
+                self.token = login['token']
+            deadline = time.time() + self.args.duration if self.args.duration else None
+            for _ in range(self.args.iterations):
+                self.dashboard()
+                self.completed += 1
+                if deadline and time.time() > deadline:
+                    break
+        except Exception as e:
+            self.failed = str(e)
+
+    def dashboard(self):
+        self.request('stats', 'GET', '/api/stats')
+        senders, token, pages = {}, None, 0
+        while True:
+            path = f'/api/senders?limit={self.args.page_size}' + (f'&pageToken={token}' if token else '')
+            result = self.request('senders', 'GET', path)
+            for s in result['stats']:
+                entry = senders.setdefault(s['sender'], [0, []])
+                entry[0] += s['count']
+                entry[1].extend(s['ids'])
+            token, pages = result.get('nextPageToken'), pages + 1
+            if not token or pages >= self.args.pages:
+                break
+            time.sleep(0.05)
+
+        if not senders:
+            return
+        top, (count, ids) = max(senders.items(), key=lambda kv: kv[1][0])
+        self.request('emails/batch', 'POST', '/api/emails/batch', ids[:50])
+        if self.args.delete:
+            self.request('delete-all', 'POST', '/api/emails/delete-all', {'ids': ids, 'senders': {top: count}})
+        self.request('history', 'GET', '/api/history')
+
+
+def summarize(recorder, elapsed):
+    endpoints = {}
+    for endpoint, samples in sorted(recorder.samples.items()):
+        errors = recorder.errors.get(endpoint, {})
+        endpoints[endpoint] = {
+            "requests": len(samples),
+            "errors": {str(k): v for k, v in errors.items()},
+            "rps": round(len(samples) / elapsed, 2),
+            "p50Ms": round(percentile(samples, 50) * 1000, 2),
+            "p95Ms": round(percentile(samples, 95) * 1000, 2),
+            "p99Ms": round(percentile(samples, 99) * 1000, 2),
+            "maxMs": round(max(samples) * 1000, 2),
+        }
+    return endpoints
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent dashboard sessions against the app + fake providers')
+    parser.add_argument('--sessions', type=int, default=20, help='concurrent dashboard sessions')
+    parser.add_argument('--provider', choices=('gmail', 'imap', 'mixed'), default='mixed')
+    parser.add_argument('--ramp', type=float, default=2.0, help='seconds over which sessions start')
+    parser.add_argument('--iterations', type=int, default=1, help='dashboard flows per session')
+    parser.add_argument('--duration', type=float, default=0, help='stop repeating flows after N seconds')
+    parser.add_argument('--pages', type=int, default=1, help='/api/senders pages per scan (Dashboard default: 1)')
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--no-delete', dest='delete', action='store_false', help='skip delete-all')
+    parser.add_argument('--size', type=int, default=50000, help='messages in the synthetic mailbox')
+    parser.add_argument('--senders', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='fake provider latency per round trip')
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--threadpool', type=int, default=0, help='override the app worker threads (default 40)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='uvicorn worker processes with shared state (default: one in-process app)')
+    parser.add_argument('--timeout', type=float, default=300.0, help='client socket timeout')
+    parser.add_argument('--out', help='write JSON results here')
+    args = parser.parse_args()
+
+    servers = Servers(args)
+    port = free_port()
+    providers = [('gmail' if args.provider == 'gmail' or (args.provider == 'mixed' and n % 2 == 0) else 'imap')
+                 for n in range(args.sessions)]
+    gmail_tokens = [f'loadtest-gmail-{n}' for n, p in enumerate(providers) if p == 'gmail']
+    if args.workers:
+        # Not a daemon: uvicorn's supervisor starts the workers as its own children
+        app = multiprocessing.Process(target=_workers_process, args=(port, servers.addresses, gmail_tokens,
+                                                                     args.threadpool, args.workers))
+    else:
+        app = multiprocessing.Process(target=_app_process, args=(port, servers.addresses, gmail_tokens,
+                                                                 args.threadpool), daemon=True)
+    app.start()
+    if not wait_until_up(port):
+        raise SystemExit("App did not start")
+
+    recorder = Recorder()
+    tokens = iter(gmail_tokens)
+    sessions = [Session(port, next(tokens) if p == 'gmail' else None, p, args, recorder) for p in providers]
+    for n, session in enumerate(sessions):
+        session.name = f'session-{n}'
+
+    peaks = {name: 0.0 for name in SAMPLED_METRICS}
+    peaks['appRssKb'] = 0
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(0.25):
+            try:
+                values = scrape(port)
+            except Exception:
+                continue
+            for name in SAMPLED_METRICS:
+                peaks[name] = max(peaks[name], values.get(name, 0.0))
+            peaks['appRssKb'] = max(peaks['appRssKb'], tree_rss_kb(app.pid))
+
+    baseline = scrape(port)
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    print(f"Starting {args.sessions} sessions ({args.provider}) over {args.ramp}s...")
+    start = time.perf_counter()
+    for session in sessions:
+        session.start()
+        time.sleep(args.ramp / max(1, args.sessions))
+    for session in sessions:
+        session.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+    final = scrape(port)
+
+    history_writes = final.get('history_write_duration_seconds_count', 0) - baseline.get(
+        'history_write_duration_seconds_count', 0)
+    history_seconds = final.get('history_write_duration_seconds_sum', 0) - baseline.get(
+        'history_write_duration_seconds_sum', 0)
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "params": {k: v for k, v in vars(args).items() if k != 'out'},
+        "seconds": round(elapsed, 3),
+        "flowsCompleted": sum(s.completed for s in sessions),
+        "flowsPerSecond": round(sum(s.completed for s in sessions) / elapsed, 3),
+        "sessionsFailed": sum(1 for s in sessions if s.failed),
+        "failures": sorted({s.failed for s in sessions if s.failed})[:5],
+        "endpoints": summarize(recorder, elapsed),
+        "peaks": peaks,
+        "threadpoolMax": final.get('threadpool_threads_max'),
+        "sessionsAtEnd": final.get('active_sessions'),
+        "historyWrites": int(history_writes),
+        "historyWriteMeanMs": round(history_seconds / history_writes * 1000, 2) if history_writes else None,
+        "appRssKbAtEnd": tree_rss_kb(app.pid),
+    }
+
+    app.terminate()
+    app.join(timeout=5)
+    servers.stop()
+
+    mode = f"{args.workers} workers, shared state" if args.workers else "single process"
+    print(f"\n[{mode}] {report['flowsCompleted']} dashboard flows in {elapsed:.1f}s "
+          f"({report['flowsPerSecond']}/s), {report['sessionsFailed']} sessions failed")
+    print(f"{'endpoint':<14} {'reqs':>6} {'err':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for endpoint, r in report['endpoints'].items():
+        print(f"{endpoint:<14} {r['requests']:>6} {sum(r['errors'].values()):>5} {r['rps']:>8.2f} "
+              f"{r['p50Ms']:>9.1f} {r['p95Ms']:>9.1f} {r['p99Ms']:>9.1f} {r['maxMs']:>9.1f}")
+    print(f"\nthreadpool busy peak {peaks['threadpool_threads_busy']:.0f}/{report['threadpoolMax']:.0f}, "
+          f"queued peak {peaks['threadpool_waiting']:.0f}, in-flight peak {peaks['http_requests_in_progress']:.0f}")
+    print(f"sessions dict at end: {report['sessionsAtEnd']:.0f}, unread watchers peak "
+          f"{peaks['active_unread_watchers']:.0f}, app RSS peak {peaks['appRssKb']} KB")
+    print(f"history.json writes: {report['historyWrites']} (mean {report['historyWriteMeanMs']} ms)")
+    for failure in report['failures']:
+        print(f"  failure: {failure}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
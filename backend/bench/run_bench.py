@@ -0,0 +1,300 @@
+"""
+Offline end-to-end benchmark of both providers against the local fake servers.
+
+The fake Gmail (REST + /batch) and fake IMAP servers run in a child process over the same
+synthetic mailbox, so their CPU time does not show up in the client numbers. For each provider
+the harness drives:
+    scan       get_sender_stats paged over every unread message (the Dashboard scan)
+    details    get_messages_details for a page of ids
+    classify   classify_sender over every sender seen by the scan
+    categories the same lookups through the persisted category cache (category_cache.py)
+    mark_read  mark_as_read in chunks of --chunk ids
+    trash      move_to_trash in chunks of --chunk ids
+and reports throughput, p50/p99 latency per call, server-side API calls and peak memory
+(process max RSS after each scenario; add --memory for tracemalloc peaks, which slows the
+allocation-heavy Gmail client several times, so don't compare timings across the two modes).
+
+Usage (from backend/):
+    python bench/run_bench.py                                   # both providers, 20k messages
+    python bench/run_bench.py --provider imap --size 200000 --latency-ms 5
+    python bench/run_bench.py --rate-429 0.02 --out after.json --compare before.json
+    python bench/run_bench.py --provider gmail --memory         # tracemalloc peaks
+
+Results are JSON tagged with the git commit, Python version and parameters, so runs from two
+commits can be compared with --compare (same parameters, same machine).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+def _server_process(conn, size, senders, latency_ms, rate_429):
+    """Child process: runs both fake servers and answers 'stats' / 'reset' / 'stop' on the pipe."""
+    import fake_gmail
+    import fake_imap
+    from synthetic import SyntheticMailbox
+
+    gmail_box = SyntheticMailbox(size, senders=senders)
+    imap_box = SyntheticMailbox(size, senders=senders)
+    _, gmail, url = fake_gmail.serve(gmail_box, latency_ms=latency_ms, rate_429=rate_429)
+    _, imap, address = fake_imap.serve(imap_box, latency_ms=latency_ms)
+    conn.send({'gmail': url, 'imap': address})
+    fakes = {'gmail': gmail, 'imap': imap}
+    while True:
+        command, provider = conn.recv()
+        if command == 'stop':
+            return
+        if command == 'stats':
+            conn.send(fakes[provider].stats())
+        elif command == 'reset':
+            fakes[provider].reset_stats()
+            conn.send(True)
+
+
+class Servers:
+    def __init__(self, args):
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_server_process, args=(child, args.size, args.senders, args.latency_ms, args.rate_429),
+            daemon=True)
+        self.process.start()
+        self.addresses = self.conn.recv()
+
+    def call(self, command, provider):
+        self.conn.send((command, provider))
+        return self.conn.recv()
+
+    def stop(self):
+        self.conn.send(('stop', None))
+        self.process.join(timeout=5)
+
+
+def make_service(provider, servers):
+    if provider == 'gmail':
+        from fake_gmail import make_gmail_service
+        from gmail_service import GmailApiService
+        service = GmailApiService()
+        service.service = make_gmail_service(servers.addresses['gmail'])
+        return service
+
+    import imap_service
+    host, port = servers.addresses['imap']
+    imap_service.IMAP_HOST, imap_service.IMAP_PORT, imap_service.IMAP_SSL = host, port, False
+    service = imap_service.ImapService()
+    service.authenticate('bench@example.com', 'bench')
+    return service
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def measure(name, provider, servers, run, track_memory):
+    """
+    Runs `run(timings)`; run appends per-call seconds to timings and returns the item count.
+    Returns the result record for the scenario.
+    """
+    servers.call('reset', provider)
+    if track_memory:
+        tracemalloc.start()
+    timings = []
+    start = time.perf_counter()
+    items = run(timings)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if track_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    calls = servers.call('stats', provider) if name not in ('classify', 'categories') else {}
+    return {
+        "items": items,
+        "calls": len(timings),
+        "seconds": round(elapsed, 4),
+        "itemsPerSecond": round(items / elapsed, 1) if elapsed else None,
+        "p50Ms": round(percentile(timings, 50) * 1000, 3),
+        "p99Ms": round(percentile(timings, 99) * 1000, 3),
+        "apiCalls": calls,
+        "apiCallsTotal": sum(v for k, v in calls.items() if not k.startswith('batch:')),
+        "peakTracedBytes": peak,
+        "maxRssKb": max_rss_kb(),
+    }
+
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def timed(timings, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    timings.append(time.perf_counter() - start)
+    return result
+
+
+def bench_provider(provider, servers, args):
+    service = make_service(provider, servers)
+    results = {}
+    # Fresh category table per provider, so its scan classifies every sender like a first scan
+    import category_cache
+    category_cache.sender_categories = category_cache.CategoryCache(
+        os.path.join(tempfile.mkdtemp(prefix='bench-'), 'categories.db'))
+    seen = {}   # sender -> (email, ids) collected by the scan, reused by later scenarios
+
+    def scan(timings):
+        total, token = 0, None
+        while True:
+            stats, token = timed(timings, service.get_sender_stats, args.page_size, token)
+            for s in stats:
+                entry = seen.setdefault(s['sender'], [s.get('email', ''), []])
+                entry[1].extend(s['ids'])
+                total += s['count']
+            if not token or (args.max_pages and len(timings) >= args.max_pages):
+                return total
+
+    def all_ids():
+        return [i for _, ids in seen.values() for i in ids]
+
+    def details(timings):
+        ids = all_ids()[:args.details]
+        count = 0
+        for _ in range(args.repeat):
+            count += len(timed(timings, service.get_messages_details, ids))
+        return count
+
+    def classify(timings):
+        from classifier import classify_sender
+        senders = [(name, email) for name, (email, _) in seen.items()]
+        for _ in range(args.repeat):
+            for name, email in senders:
+                timed(timings, classify_sender, name, email)
+        return len(timings)
+
+    def categories(timings):
+        from category_cache import sender_categories
+        senders = [(name, email) for name, (email, _) in seen.items()]
+        for _ in range(args.repeat):
+            for name, email in senders:
+                timed(timings, sender_categories.classify, name, email)
+        return len(timings)
+
+    def mutate(method, ids):
+        def run(timings):
+            for i in range(0, len(ids), args.chunk):
+                timed(timings, method, ids[i:i + args.chunk])
+            return len(ids)
+        return run
+
+    results['scan'] = measure('scan', provider, servers, scan, args.tracemalloc)
+    results['details'] = measure('details', provider, servers, details, args.tracemalloc)
+    results['classify'] = measure('classify', provider, servers, classify, args.tracemalloc)
+    results['categories'] = measure('categories', provider, servers, categories, args.tracemalloc)
+
+    # Mutations consume the scanned ids: the first half is marked read, the second half trashed
+    ids = all_ids()[:args.mutations]
+    half = len(ids) // 2
+    results['mark_read'] = measure('mark_read', provider, servers, mutate(service.mark_as_read, ids[:half]),
+                                   args.tracemalloc)
+    results['trash'] = measure('trash', provider, servers, mutate(service.move_to_trash, ids[half:]),
+                               args.tracemalloc)
+
+    if provider == 'imap':
+        try:
+            service.mail.logout()
+        except Exception:
+            pass
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def print_results(report, baseline=None):
+    for provider, scenarios in report['results'].items():
+        print(f"\n== {provider} ==")
+        print(f"{'scenario':<10} {'items':>8} {'items/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'api':>6} "
+              f"{'traced KB':>10} {'rss KB':>9}")
+        for name, r in scenarios.items():
+            peak = f"{r['peakTracedBytes'] / 1024:.0f}" if r['peakTracedBytes'] is not None else '-'
+            line = (f"{name:<10} {r['items']:>8} {r['itemsPerSecond'] or 0:>10.1f} {r['p50Ms']:>9.2f} "
+                    f"{r['p99Ms']:>9.2f} {r['apiCallsTotal']:>6} {peak:>10} {r['maxRssKb']:>9}")
+            old = (baseline or {}).get('results', {}).get(provider, {}).get(name)
+            if old and old.get('itemsPerSecond') and r['itemsPerSecond']:
+                change = r['itemsPerSecond'] / old['itemsPerSecond']
+                line += f"   {change:.2f}x vs {baseline.get('commit') or 'baseline'}"
+            print(line)
+    print(f"\nmax RSS: {report['maxRssKb']} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark against fake Gmail/IMAP servers')
+    parser.add_argument('--provider', choices=('gmail', 'imap', 'both'), default='both')
+    parser.add_argument('--size', type=int, default=20000, help='messages in the synthetic mailbox')
+    parser.add_argument('--senders', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='fake server latency per round trip')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Gmail batch sub-request 429 probability')
+    parser.add_argument('--page-size', type=int, default=500, help='get_sender_stats limit')
+    parser.add_argument('--max-pages', type=int, default=0, help='stop the scan after N pages (0 = all)')
+    parser.add_argument('--details', type=int, default=100, help='ids per get_messages_details call')
+    parser.add_argument('--mutations', type=int, default=2000, help='ids used by mark_read + trash')
+    parser.add_argument('--chunk', type=int, default=500, help='ids per bulk mutation call')
+    parser.add_argument('--repeat', type=int, default=5, help='repetitions of details and classify')
+    parser.add_argument('--memory', dest='tracemalloc', action='store_true',
+                        help='trace per-scenario peak allocations with tracemalloc (slows the run)')
+    parser.add_argument('--out', help='write JSON results here')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    servers = Servers(args)
+    providers = ('gmail', 'imap') if args.provider == 'both' else (args.provider,)
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": int(time.time()),
+        "params": {k: v for k, v in vars(args).items() if k not in ('out', 'compare')},
+        "results": {},
+    }
+    try:
+        for provider in providers:
+            print(f"Benchmarking {provider}...")
+            report["results"][provider] = bench_provider(provider, servers, args)
+    finally:
+        servers.stop()
+    report["maxRssKb"] = max_rss_kb()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('params') != report['params']:
+            print("Warning: baseline was run with different parameters")
+    print_results(report, baseline)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
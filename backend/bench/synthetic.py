@@ -0,0 +1,160 @@
+"""
+Deterministic synthetic mailbox shared by the fake Gmail and IMAP servers.
+Messages are generated from their index on demand, so a 1M-message mailbox costs a few MB
+(flags + uid array), not a million dicts.
+"""
+import random
+import time
+from array import array
+from bisect import bisect_left
+from email.header import Header
+
+NAMES = [
+    "Amazon", "Chase Bank", "LinkedIn", "Medium Daily Digest", "United Airlines", "Expedia",
+    "PayPal", "GitHub", "Spotify", "Netflix", "Uber Receipts", "Booking.com", "Substack",
+    "Twitter", "Facebook", "Alice Johnson", "Bob Smith", "Nordstrom Sale", "Weekly Newsletter",
+    "Müller GmbH", "Café du Monde", "Zoë Dupont", "Security Alert", "Order Confirmation",
+]
+DOMAINS = [
+    "amazon.com", "chase.com", "linkedin.com", "medium.com", "united.com", "expedia.com",
+    "paypal.com", "github.com", "spotify.com", "netflix.com", "uber.com", "booking.com",
+    "substack.com", "twitter.com", "facebook.com", "gmail.com", "example.org", "shop.example",
+]
+SUBJECTS = [
+    "Your order has shipped", "Weekly digest", "Security alert for your account",
+    "Big sale: 50% off everything", "Your statement is ready", "Trip itinerary",
+    "Re: lunch tomorrow?", "Ihre Rechnung für März", "Confirmez votre réservation",
+]
+
+
+class SyntheticMailbox:
+    def __init__(self, size, senders=500, thread_size=4, seed=42, unsubscribe_urls=("https://unsubscribe.example",)):
+        self.size = size
+        # One-click endpoints; sender s unsubscribes at unsubscribe_urls[s % n] (see fake_unsubscribe.py)
+        self.unsubscribe_urls = [unsubscribe_urls] if isinstance(unsubscribe_urls, str) else list(unsubscribe_urls)
+        self.thread_size = max(1, thread_size)
+        rnd = random.Random(seed)
+
+        # Sender population with a Zipf-like skew: a few senders produce most of the mail
+        self.senders = []
+        for i in range(senders):
+            name = NAMES[i % len(NAMES)]
+            if i >= len(NAMES):
+                name = f"{name} {i}"
+            address = f"{name.split()[0].lower()}{i}@{DOMAINS[i % len(DOMAINS)]}"
+            self.senders.append(self._format_from(name, address, i))
+        weights = [1.0 / (rank + 1) for rank in range(senders)]
+        total = sum(weights)
+        self._cumulative = []
+        acc = 0.0
+        for w in weights:
+            acc += w / total
+            self._cumulative.append(acc)
+        self._rnd_seed = rnd.randint(0, 2 ** 31)
+
+        # Per-message state: 1 = unread, plus IMAP UIDs (can be expunged)
+        self.unread = bytearray(b'\x01') * size
+        self.deleted = bytearray(size)
+        self.uids = array('I', range(1, size + 1))
+        self.base_time = int(time.time()) - size * 60
+
+    @staticmethod
+    def _format_from(name, address, i):
+        # Mix of plain, quoted and RFC 2047 encoded display names
+        if not name.isascii():
+            return f"{Header(name, 'utf-8').encode()} <{address}>"
+        if i % 3 == 0:
+            return f'"{name}" <{address}>'
+        return f"{name} <{address}>"
+
+    def _mix(self, i):
+        # Cheap deterministic hash in [0, 1)
+        x = (i * 2654435761 + self._rnd_seed) & 0xFFFFFFFF
+        x ^= x >> 16
+        x = (x * 0x45d9f3b) & 0xFFFFFFFF
+        x ^= x >> 16
+        return x / 2 ** 32
+
+    def sender_index(self, i):
+        return min(bisect_left(self._cumulative, self._mix(i)), len(self.senders) - 1)
+
+    def from_header(self, i):
+        return self.senders[self.sender_index(i)]
+
+    def subject(self, i):
+        return SUBJECTS[i % len(SUBJECTS)]
+
+    def internal_date(self, i):
+        """Seconds since epoch; index 0 is the oldest message."""
+        return self.base_time + i * 60
+
+    def date_header(self, i):
+        return time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime(self.internal_date(i)))
+
+    def message_id(self, i):
+        return f"{i + 0x100000000:x}"
+
+    def index_of(self, message_id):
+        return int(message_id, 16) - 0x100000000
+
+    def thread_index(self, i):
+        return i // self.thread_size
+
+    def thread_id(self, i):
+        return f"{self.thread_index(i) + 0x200000000:x}"
+
+    def thread_messages(self, thread_id):
+        t = int(thread_id, 16) - 0x200000000
+        start = t * self.thread_size
+        return range(start, min(start + self.thread_size, self.size))
+
+    def headers(self, i, names=None):
+        all_headers = [
+            ("From", self.from_header(i)),
+            ("Subject", self.subject(i)),
+            ("Date", self.date_header(i)),
+        ] + self.list_headers(i)
+        if names is None:
+            return all_headers
+        wanted = {n.lower() for n in names}
+        return [(k, v) for k, v in all_headers if k.lower() in wanted]
+
+    def list_headers(self, i):
+        """
+        List-* headers by sender: people (gmail.com) have none, every 5th list is mailto only,
+        the rest offer RFC 8058 one-click with a per-message token in the URL.
+        """
+        s = self.sender_index(i)
+        domain = DOMAINS[s % len(DOMAINS)]
+        if domain == "gmail.com":
+            return []
+        mailto = f"<mailto:unsubscribe-{s}@{domain}>"
+        if s % 5 == 4:
+            return [("List-Id", f"<list{s}.{domain}>"), ("List-Unsubscribe", mailto)]
+        url = f"{self.unsubscribe_urls[s % len(self.unsubscribe_urls)]}/u/{s}?m={i}"
+        return [
+            ("List-Id", f"Sender {s} <list{s}.{domain}>"),
+            ("List-Unsubscribe", f"{mailto}, <{url}>"),
+            ("List-Unsubscribe-Post", "List-Unsubscribe=One-Click"),
+        ]
+
+    def mark_deleted(self, i):
+        # Deleted messages leave the inbox, so they stop counting as unread too
+        self.deleted[i] = 1
+        self.unread[i] = 0
+
+    def unread_count(self):
+        return self.unread.count(1)
+
+    def unread_page(self, start, limit):
+        """
+        Newest first, like Gmail's messages.list. `start` is the index to continue from
+        (None = newest). Returns (indexes, next_start or None).
+        """
+        i = self.size - 1 if start is None else start
+        found = []
+        while i >= 0 and len(found) < limit:
+            if self.unread[i]:
+                found.append(i)
+            i -= 1
+        return found, (i if i >= 0 else None)
@@ -0,0 +1,179 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+import classifier
+
+# Persistent sender -> category table in front of classifier.classify_sender.
+# Scans look every new sender up here (a dict hit) instead of re-running the keyword rules on every
+# page of every scan. Rows are stored in data/categories.db together with the rule set they were
+# computed with; when classifier.rules_version() changes, reclassify() updates only the senders
+# whose category could change:
+#   - only keyword lists changed: senders whose "name email" text contains an added or removed
+#     keyword (no other sender's outcome of `k in text` differs)
+#   - classify_sender itself changed (or no previous rule set stored): every sender
+# New categories are written behind by a background thread, in batches (every FLUSH_EVERY new
+# senders or FLUSH_SECONDS), so classify() inside a scan page never waits on SQLite.
+
+CATEGORY_DB = "data/categories.db"
+FLUSH_EVERY = 256
+FLUSH_SECONDS = 5.0
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sender_categories (
+    sender TEXT NOT NULL,
+    email TEXT NOT NULL,
+    category TEXT NOT NULL,
+    PRIMARY KEY (sender, email)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def changed_terms(old_rules, new_rules):
+    """Keywords/domains added to or removed from any list between two rule sets."""
+    terms = set()
+    for name in set(old_rules) | set(new_rules):
+        terms |= set(old_rules.get(name, ())) ^ set(new_rules.get(name, ()))
+    return {t.lower() for t in terms}
+
+
+class CategoryCache:
+    def __init__(self, path=CATEGORY_DB):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = None
+        self._categories = None     # (sender, email) -> category
+        self._pending = {}
+        # Every use of the connection; taken after _lock, never the other way round
+        self._db_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer = None
+        self.version = None
+        self._last_result = None
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        with self._lock:
+            if self._categories is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                self._conn = conn
+                categories = {(s, e): c for s, e, c in conn.execute(
+                    "SELECT sender, email, category FROM sender_categories")}
+                self._reclassify(categories)
+                # Published only once up to date: classify() reads it without the lock
+                self._categories = categories
+                atexit.register(self.flush)
+                self._writer = threading.Thread(target=self._run, name='category-writer', daemon=True)
+                self._writer.start()
+            return self._categories
+
+    def classify(self, sender_name, sender_email=""):
+        """classify_sender, answered from the table when the sender has been seen before."""
+        categories = self._categories if self._categories is not None else self._load()
+        key = (sender_name, sender_email or "")
+        category = categories.get(key)
+        if category is not None:
+            self.hits += 1
+            return category
+
+        category = classifier.classify_sender(sender_name, sender_email)
+        with self._lock:
+            self.misses += 1
+            categories[key] = category
+            self._pending[key] = category
+            if len(self._pending) >= FLUSH_EVERY:
+                self._wake.set()
+        return category
+
+    def _run(self):
+        while True:
+            self._wake.wait(FLUSH_SECONDS)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logger.warning("Could not write sender categories: %s", e)
+
+    def _flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            rows = [(s, e, c) for (s, e), c in self._pending.items()]
+            self._pending = {}
+        # Written outside _lock: classify() keeps answering while SQLite commits
+        with self._db_lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO sender_categories (sender, email, category) VALUES (?, ?, ?)", rows)
+
+    def flush(self):
+        """Writes categories computed since the last flush."""
+        if self._conn is not None:
+            self._flush()
+
+    def reclassify(self):
+        """
+        Brings stored categories up to the current rule set (a no-op if nothing changed).
+        Returns {"version", "checked", "changed": [{sender, email, category}], "total"}.
+        """
+        with self._lock:
+            if self._categories is None:
+                # Loading reclassifies already
+                self._load()
+                return self._last_result
+            return self._reclassify(self._categories)
+
+    def _reclassify(self, categories):
+        with self._db_lock:
+            meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        version = classifier.rules_version()
+        rules = classifier.rule_set()
+        logic = classifier.logic_fingerprint()
+
+        if meta.get("version") == version:
+            candidates = []
+        elif meta.get("logic") == logic and "rules" in meta:
+            terms = changed_terms(json.loads(meta["rules"]), rules)
+            candidates = [key for key in categories
+                          if any(t in f"{key[0]} {key[1]}".lower() for t in terms)]
+        else:
+            candidates = list(categories)
+
+        changed = []
+        for key in candidates:
+            category = classifier.classify_sender(*key)
+            if category != categories[key]:
+                categories[key] = category
+                self._pending[key] = category
+                changed.append({"sender": key[0], "email": key[1], "category": category})
+
+        self._flush()
+        with self._db_lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+                ("version", version), ("rules", json.dumps(rules, sort_keys=True)), ("logic", logic)])
+        if meta.get("version") != version:
+            logger.info("Category rules %s -> %s: checked %d of %d senders, %d changed", meta.get('version'),
+                        version, len(candidates), len(categories), len(changed))
+        self.version = version
+        self._last_result = {"version": version, "checked": len(candidates), "changed": changed,
+                             "total": len(categories)}
+        return self._last_result
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self._categories) if self._categories is not None else 0}
+
+
+# Shared by both providers and the API
+sender_categories = CategoryCache()
@@ -1,3 +1,5 @@
+import hashlib
+import json
 import re
 
 class Category:
@@ -64,3 +66,27 @@ def classify_sender(sender_name: str, sender_email: str = "") -> str:
         return Category.NOTIFICATIONS
         
     return Category.PERSONAL
+
+
+def rule_set():
+    """The keyword data classify_sender decides on, by list name."""
+    return {
+        "social_domains": SOCIAL_DOMAINS,
+        "banking": BANKING_KEYWORDS,
+        "travel": TRAVEL_KEYWORDS,
+        "newsletter": NEWSLETTER_KEYWORDS,
+        "notification": NOTIFICATION_KEYWORDS,
+        "marketing": MARKETING_KEYWORDS,
+    }
+
+
+def logic_fingerprint():
+    """Hash of classify_sender itself (code and literals), i.e. everything but rule_set()."""
+    code = classify_sender.__code__
+    return hashlib.sha256(code.co_code + repr((code.co_consts, code.co_names)).encode()).hexdigest()[:16]
+
+
+def rules_version():
+    """Changes whenever a category produced by classify_sender could change."""
+    rules = json.dumps(rule_set(), sort_keys=True)
+    return hashlib.sha256((rules + logic_fingerprint()).encode()).hexdigest()[:16]
@@ -0,0 +1,179 @@
+import datetime
+import logging
+import os
+import threading
+import time
+
+from metrics import CREDENTIAL_REFRESHES, CREDENTIAL_REFRESH_SECONDS
+
+# Gmail OAuth access tokens last an hour. google-auth refreshes one when it is used within
+# ~4 minutes of expiry, i.e. inside whatever user request (or batch) happens to hit that moment.
+# This manager keeps every active account's credentials fresh from a background thread instead:
+#   - credentials are tracked per key (session token, or "default" for token.json), the very
+#     object the Gmail client uses, so a refresh here is what the next API call sends
+#   - refreshed CREDENTIAL_REFRESH_MARGIN seconds before expiry, for keys used within
+#     CREDENTIAL_IDLE_SECONDS (idle sessions aren't kept warm forever)
+#   - one refresh per key at a time; concurrent callers wait for it and reuse the result
+#   - rotated tokens are handed to persist(creds): token.json is replaced atomically, shared
+#     sessions are updated in data/state.db. reload() lets a worker adopt a token another worker
+#     already refreshed instead of refreshing again
+# A request only refreshes itself (still coalesced) if the token is already unusable, e.g. the
+# first request after a long idle period.
+
+CREDENTIAL_REFRESH_MARGIN = float(os.environ.get('CREDENTIAL_REFRESH_MARGIN', 10 * 60))
+CREDENTIAL_CHECK_SECONDS = float(os.environ.get('CREDENTIAL_CHECK_SECONDS', 30))
+CREDENTIAL_IDLE_SECONDS = float(os.environ.get('CREDENTIAL_IDLE_SECONDS', 2 * 3600))
+ERROR_BACKOFF_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+
+def seconds_left(creds):
+    """Seconds until the access token expires (None if it has no expiry, negative if expired)."""
+    if creds.expiry is None:
+        return None
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return (creds.expiry - now).total_seconds()
+
+
+def write_token_file(path, creds):
+    """Replaces an authorized-user JSON file (token.json) atomically, readable by the owner only."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(creds.to_json())
+    os.replace(tmp, path)
+
+
+class _Tracked:
+    __slots__ = ('creds', 'persist', 'reload', 'lock', 'last_used', 'retry_at')
+
+    def __init__(self, creds, persist, reload):
+        self.creds = creds
+        self.persist = persist
+        self.reload = reload
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.retry_at = 0.0
+
+
+class CredentialManager:
+    def __init__(self, margin=CREDENTIAL_REFRESH_MARGIN, interval=CREDENTIAL_CHECK_SECONDS,
+                 idle=CREDENTIAL_IDLE_SECONDS):
+        self.margin = margin
+        self.interval = interval
+        self.idle = idle
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.refreshes = 0
+        self.adopted = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    def track(self, key, creds, persist=None, reload=None):
+        """Keeps creds (google.oauth2 Credentials) fresh from now on. Needs a refresh token."""
+        if creds is None or not getattr(creds, 'refresh_token', None):
+            return
+        with self._lock:
+            self._entries[key] = _Tracked(creds, persist, reload)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='oauth-refresh', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def forget(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def tracked(self, key):
+        return key in self._entries
+
+    def touch(self, key):
+        """
+        Called on every request of the account. Marks it active; only if the token is already
+        unusable does the caller refresh (coalesced with any refresh in progress).
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry.last_used = time.monotonic()
+        if not entry.creds.valid and entry.last_used >= entry.retry_at:
+            self._refresh(key, entry, 'request')
+        elif self._due(entry):
+            self._wake.set()
+
+    def _due(self, entry):
+        left = seconds_left(entry.creds)
+        return left is not None and left < self.margin
+
+    def _refresh(self, key, entry, path):
+        with entry.lock:
+            # Whoever held the lock may just have refreshed it
+            if not self._due(entry) and entry.creds.valid:
+                self.coalesced += 1
+                return
+            if entry.reload is not None and self._adopt(entry):
+                self.adopted += 1
+                CREDENTIAL_REFRESHES.inc(path=path, outcome='adopted')
+                return
+
+            from google.auth.transport.requests import Request
+            start = time.perf_counter()
+            try:
+                entry.creds.refresh(Request())
+            except Exception as e:
+                self.failures += 1
+                entry.retry_at = time.monotonic() + ERROR_BACKOFF_SECONDS
+                CREDENTIAL_REFRESHES.inc(path=path, outcome='error')
+                logger.warning("OAuth refresh for %s failed: %s", key[:8], e)
+                return
+            finally:
+                CREDENTIAL_REFRESH_SECONDS.observe(time.perf_counter() - start, path=path)
+            self.refreshes += 1
+            CREDENTIAL_REFRESHES.inc(path=path, outcome='ok')
+            logger.debug("OAuth token for %s refreshed (%s), valid for %.0fs", key[:8], path,
+                         seconds_left(entry.creds))
+            if entry.persist is not None:
+                try:
+                    entry.persist(entry.creds)
+                except Exception as e:
+                    logger.warning("Could not persist refreshed token for %s: %s", key[:8], e)
+
+    def _adopt(self, entry):
+        """Takes over a token someone else (another worker) refreshed and stored, if fresher."""
+        try:
+            stored = entry.reload()
+        except Exception:
+            return False
+        if stored is None or not stored.token or stored.expiry is None:
+            return False
+        left = seconds_left(stored)
+        if left < self.margin or (entry.creds.expiry and stored.expiry <= entry.creds.expiry):
+            return False
+        # In place: the Gmail client holds this very object
+        entry.creds.token = stored.token
+        entry.creds.expiry = stored.expiry
+        return True
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            now = time.monotonic()
+            with self._lock:
+                entries = list(self._entries.items())
+            for key, entry in entries:
+                if now - entry.last_used > self.idle or now < entry.retry_at:
+                    continue
+                if self._due(entry):
+                    self._refresh(key, entry, 'background')
+
+    def stats(self):
+        return {"tracked": len(self._entries), "refreshes": self.refreshes, "adopted": self.adopted,
+                "coalesced": self.coalesced, "failures": self.failures}
+
+
+# Shared by the API's sessions and the token.json account
+credential_manager = CredentialManager()
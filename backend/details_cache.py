@@ -0,0 +1,161 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Message details (From/Subject/Date/snippet) cache in front of get_messages_details.
+# - TTL + LRU, keyed by (account, message id): reopening a sender costs no provider call
+# - Single-flight: concurrent requests for the same ids (two tabs, double clicks) share one fetch;
+#   a request only fetches the ids nobody else is already fetching
+# - Results come back in input order; ids that failed carry {"id", "error"} and aren't cached
+# - on_evict(account, ids) is told about LRU evictions (search_index.py forgets the same rows'
+#   subject and snippet but keeps what scans stored), on_invalidate(account, ids) about
+#   invalidations after actions (the rows are dropped); ids=None means the whole account
+# - shared (a shared_state.SharedState, multi-worker mode): second level that other workers'
+#   fetches land in, consulted before fetch; invalidations are applied there too
+
+DETAILS_CACHE_SIZE = 50000
+DETAILS_TTL_SECONDS = 10 * 60
+INFLIGHT_WAIT_SECONDS = 120
+
+
+class _Flight:
+    __slots__ = ('event', 'result')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class DetailsCache:
+    def __init__(self, maxsize=DETAILS_CACHE_SIZE, ttl=DETAILS_TTL_SECONDS, on_evict=None, shared=None,
+                 on_invalidate=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.on_invalidate = on_invalidate
+        self.shared = shared
+        self._entries = OrderedDict()   # (account, id) -> (expires, detail)
+        self._inflight = {}             # (account, id) -> _Flight
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.shared_hits = 0
+
+    def get_many(self, account, message_ids, fetch):
+        """
+        Details for message_ids, in the same order. fetch(ids) is called at most once, with
+        the ids that are neither cached nor being fetched by a concurrent request.
+        """
+        now = time.time()
+        results, owned, waiting = {}, [], {}
+        with self._lock:
+            for msg_id in dict.fromkeys(message_ids):
+                key = (account, msg_id)
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    results[msg_id] = entry[1]
+                    self.hits += 1
+                    continue
+                flight = self._inflight.get(key)
+                if flight is not None:
+                    waiting[msg_id] = flight
+                    self.coalesced += 1
+                    continue
+                self._inflight[key] = _Flight()
+                owned.append(msg_id)
+                self.misses += 1
+
+        if owned:
+            results.update(self._fetch_owned(account, owned, fetch))
+
+        for msg_id, flight in waiting.items():
+            if not flight.event.wait(INFLIGHT_WAIT_SECONDS):
+                results[msg_id] = {"id": msg_id, "error": "Timed out waiting for a concurrent fetch"}
+            else:
+                results[msg_id] = flight.result or {"id": msg_id, "error": "Concurrent fetch failed"}
+
+        return [results[msg_id] for msg_id in message_ids]
+
+    def _fetch_shared(self, account, owned, fetch):
+        fetched = self.shared.get_details(account, owned)
+        self.shared_hits += len(fetched)
+        missing = [msg_id for msg_id in owned if msg_id not in fetched]
+        if missing:
+            details = fetch(missing)
+            self.shared.put_details(account, details, self.ttl)
+            fetched.update((d["id"], d) for d in details)
+        return fetched
+
+    def _fetch_owned(self, account, owned, fetch):
+        try:
+            if self.shared is not None:
+                fetched = self._fetch_shared(account, owned, fetch)
+            else:
+                fetched = {d["id"]: d for d in fetch(owned)}
+        except Exception as e:
+            fetched = {msg_id: {"id": msg_id, "error": str(e)} for msg_id in owned}
+
+        results, flights, evicted = {}, [], []
+        expires = time.time() + self.ttl
+        with self._lock:
+            for msg_id in owned:
+                key = (account, msg_id)
+                detail = fetched.get(msg_id) or {"id": msg_id, "error": "Message not found"}
+                if "error" not in detail:
+                    self._entries[key] = (expires, detail)
+                    self._entries.move_to_end(key)
+                results[msg_id] = detail
+                flight = self._inflight.pop(key, None)
+                if flight is not None:
+                    flight.result = detail
+                    flights.append(flight)
+            while len(self._entries) > self.maxsize:
+                evicted.append(self._entries.popitem(last=False)[0])
+        # Wake waiters outside the lock
+        for flight in flights:
+            flight.event.set()
+        self._notify_evicted(evicted)
+        return results
+
+    def _notify_evicted(self, keys):
+        if not keys or self.on_evict is None:
+            return
+        by_account = {}
+        for account, msg_id in keys:
+            by_account.setdefault(account, []).append(msg_id)
+        for account, ids in by_account.items():
+            self.on_evict(account, ids)
+
+    def invalidate(self, account, message_ids=None):
+        """Drops cached details of message_ids (all of the account's if None), e.g. after an action."""
+        with self._lock:
+            if message_ids is None:
+                for key in [k for k in self._entries if k[0] == account]:
+                    del self._entries[key]
+            else:
+                for msg_id in message_ids:
+                    self._entries.pop((account, msg_id), None)
+        if self.shared is not None:
+            self.shared.drop_details(account, message_ids)
+        if self.on_invalidate is not None:
+            self.on_invalidate(account, message_ids)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                    "sharedHits": self.shared_hits, "size": len(self._entries), "maxsize": self.maxsize}
+
+
+def paginate(message_ids, cursor=None, limit=50):
+    """(page_ids, next_cursor) over a list of ids; the cursor is an opaque offset string."""
+    try:
+        start = int(cursor) if cursor else 0
+    except ValueError:
+        raise ValueError("Invalid details cursor")
+    if start < 0:
+        raise ValueError("Invalid details cursor")
+    end = start + max(1, limit)
+    return message_ids[start:end], (str(end) if end < len(message_ids) else None)
+
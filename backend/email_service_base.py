@@ -32,16 +32,53 @@ class EmailService(ABC):
         pass
 
     @abstractmethod
-    def unsubscribe(self, message_ids):
-        """Attempt to unsubscribe from the list."""
+    def get_unsubscribe_headers(self, message_ids):
+        """
+        Returns [{id, sender, list_id, list_unsubscribe, list_unsubscribe_post}] (raw header
+        values, None when absent) in the order of message_ids; failures are {"id", "error"}.
+        """
         pass
 
+    def unsubscribe(self, message_ids):
+        """
+        Unsubscribes from the lists these messages came from: one RFC 8058 one-click POST per
+        list (see unsubscribe_executor.py).
+        Returns {"count": lists unsubscribed, "messages": n, "skipped": n, "lists": [per list outcome]}.
+        """
+        from unsubscribe_executor import unsubscribe_messages
+        return unsubscribe_messages(self.get_unsubscribe_headers(message_ids))
+
     @abstractmethod
-    def get_sender_stats(self, limit: int = 500, page_token: str = None):
-        """Returns (stats_list, next_page_token)"""
+    def get_sender_stats(self, limit: int = 500, page_token: str = None, query: str = None, known=None, sample_every=None):
+        """
+        query: Gmail search syntax, defaults to 'is:unread'.
+        known / sample_every: cost hints (senders already known locally, fetch only a sample)
+        that a provider may ignore; see GmailApiService.get_sender_stats.
+        Returns (stats_list, next_page_token)
+        """
         pass
 
+    def count_matches(self, query=None):
+        """
+        How many messages (and threads, None if unknown) a scan of query would cover, for
+        planning (see scan_planner.py). Returns {"messages", "threads", "exact"}.
+        """
+        counts = self.get_unread_count()
+        return {"messages": counts.get("messagesUnread", 0), "threads": counts.get("threadsUnread"),
+                "exact": True}
+
+    def get_thread_sender_stats(self, limit: int = 100, page_token: str = None, query: str = None):
+        """
+        Same as get_sender_stats, but aggregated from thread metadata.
+        Providers without thread support fall back to message-level aggregation.
+        Returns (stats_list, next_page_token)
+        """
+        return self.get_sender_stats(limit=limit, page_token=page_token, query=query)
+
     @abstractmethod
     def get_messages_details(self, message_ids):
-        """Returns list of dicts with id, sender, subject, date, snippet"""
+        """
+        Returns list of dicts with id, sender, subject, date, snippet, in the order of message_ids.
+        Ids that couldn't be fetched are returned as {"id": ..., "error": "reason"}.
+        """
         pass
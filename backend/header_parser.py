@@ -0,0 +1,203 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+from email.header import decode_header, make_header
+
+# Fast parsing of raw IMAP FETCH responses.
+# imaplib returns FETCH results as a flat list where every message with a literal is a tuple:
+#   [(b'12 (UID 3456 BODY[HEADER.FIELDS (FROM)] {52}', b'From: ...\r\n\r\n'), b')', ...]
+# Depending on the server, data items may also trail the literal: b' UID 3456)'.
+# We only need a handful of header fields, so we skip email.message_from_bytes entirely.
+
+_SEQ_RE = re.compile(rb'^\s*(\d+)\s+\(')
+_UID_RE = re.compile(rb'\bUID\s+(\d+)')
+_INTERNALDATE_RE = re.compile(rb'INTERNALDATE\s+"([^"]+)"')
+# Gmail extensions (X-GM-EXT-1)
+_GM_MSGID_RE = re.compile(rb'X-GM-MSGID\s+(\d+)')
+_GM_THRID_RE = re.compile(rb'X-GM-THRID\s+(\d+)')
+_GM_LABELS_RE = re.compile(rb'X-GM-LABELS\s+\(')
+_QUOTED_ESCAPE_RE = re.compile(rb'\\(.)')
+_LABEL_TOKEN_RE = re.compile(rb'"((?:[^"\\]|\\.)*)"|([^\s"]+)')
+_ENCODED_WORD_MARKER = '=?'
+_LINE_BREAK_RE = re.compile(r'\r\n|\r|\n')
+
+
+@lru_cache(maxsize=8192)
+def _decode_encoded(value):
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        # Unknown charset or malformed encoded word: keep the raw value rather than dropping it
+        return value
+
+
+def decode_mime_words(value):
+    """Decodes every RFC 2047 encoded word in a header value (not only the first fragment)."""
+    if not value:
+        return value or ""
+    if _ENCODED_WORD_MARKER not in value:
+        return value
+    # Senders and subjects repeat heavily within a mailbox, so decoding is memoized
+    return _decode_encoded(value)
+
+
+def _decode_line(line):
+    try:
+        return line.decode('utf-8')
+    except UnicodeDecodeError:
+        return line.decode('latin-1')
+
+
+def parse_header_block(block, wanted=None):
+    """
+    Parses a raw header block (bytes) into {lowercase_name: raw_value}.
+    Handles folded (continuation) lines. If `wanted` is given, other fields are skipped.
+    The first occurrence of a field wins, matching Message.get().
+    Bytes are decoded as UTF-8 line by line; a line that isn't valid UTF-8 (un-encoded 8-bit
+    headers from older mailers) is decoded as Latin-1 instead of turning its 8-bit bytes into U+FFFD.
+    Lines end at CR/LF only: str.splitlines() would also cut a value at U+0085, U+2028 or U+2029.
+    """
+    if isinstance(block, bytes):
+        lines = [_decode_line(line) for line in block.splitlines()]
+    else:
+        lines = _LINE_BREAK_RE.split(block)
+
+    headers = {}
+    name = None
+    parts = None
+    for line in lines:
+        if not line:
+            continue
+        if line[0] in ' \t':
+            # Continuation of the previous header
+            if parts is not None:
+                parts.append(line.strip())
+            continue
+
+        if parts is not None:
+            headers[name] = ' '.join(parts)
+            parts = None
+
+        colon = line.find(':')
+        if colon <= 0:
+            continue
+        field = line[:colon].strip().lower()
+        if (wanted is not None and field not in wanted) or field in headers:
+            continue
+        name = field
+        parts = [line[colon + 1:].strip()]
+
+    if parts is not None:
+        headers[name] = ' '.join(parts)
+    return headers
+
+
+def parse_fetch_response(msg_data, fields=('FROM',)):
+    """
+    Parses the list returned by imaplib's fetch()/uid('FETCH') without building Message objects.
+    Returns a list of dicts: {'seq': str, 'uid': str or None, 'headers': {field: decoded value}}
+    where field names are lowercase. Values are RFC 2047 decoded.
+    If FROM was requested, the undecoded value is also kept as 'from_raw' so it can be handed
+    to sender_normalizer.normalize_sender.
+    When present, Gmail's X-GM-MSGID / X-GM-THRID / X-GM-LABELS items are returned as
+    'gm_msgid', 'gm_thrid' and 'gm_labels', and INTERNALDATE as 'internal_date' (epoch seconds).
+    """
+    wanted = {f.lower() for f in fields} if fields else None
+    results = []
+    current = None
+
+    for part in msg_data or []:
+        if isinstance(part, tuple):
+            prefix = part[0] or b''
+            match = _SEQ_RE.match(prefix)
+            if not match:
+                continue
+            raw = parse_header_block(part[1] or b'', wanted)
+            current = {
+                'seq': match.group(1).decode('ascii'),
+                'uid': None,
+                'headers': {k: decode_mime_words(v) for k, v in raw.items()},
+            }
+            if wanted is None or 'from' in wanted:
+                current['from_raw'] = raw.get('from')
+            _parse_data_items(prefix, current)
+            results.append(current)
+        elif isinstance(part, bytes) and current is not None:
+            # Trailing data items after the literal, e.g. b' UID 3456)'
+            _parse_data_items(part, current)
+
+    return results
+
+
+def parse_internal_date(value):
+    """IMAP date-time ('17-Jul-1996 02:44:25 -0700', bytes or str) -> epoch seconds, None if invalid."""
+    if isinstance(value, bytes):
+        value = value.decode('ascii', errors='replace')
+    try:
+        return int(datetime.strptime(value.strip(), '%d-%b-%Y %H:%M:%S %z').timestamp())
+    except ValueError:
+        return None
+
+
+def _find_label_list(text):
+    """
+    (start, list start, end) of the X-GM-LABELS item in text, or None; the labels are
+    text[list start:end - 1]. Quoted labels may contain ')' or '(' (e.g. "Receipts (2024)"),
+    so the list ends at the first ')' outside quotes.
+    """
+    match = _GM_LABELS_RE.search(text)
+    if not match:
+        return None
+    i, quoted = match.end(), False
+    while i < len(text):
+        c = text[i]
+        if quoted:
+            if c == 0x5C:       # backslash: the next byte is escaped
+                i += 1
+            elif c == 0x22:     # closing quote
+                quoted = False
+        elif c == 0x22:
+            quoted = True
+        elif c == 0x29:         # ')' ends the list
+            return match.start(), match.end(), i + 1
+        i += 1
+    return None
+
+
+def _parse_data_items(text, current):
+    """Fills uid, INTERNALDATE and the Gmail X-GM-* items found in a FETCH response fragment."""
+    if b'X-GM-LABELS' in text:
+        found = _find_label_list(text)
+        if found:
+            start, labels_start, end = found
+            current['gm_labels'] = parse_label_list(text[labels_start:end - 1])
+            # Label names can look like other items ("UID 5"): match the rest without them
+            text = text[:start] + text[end:]
+
+    if current['uid'] is None:
+        uid_match = _UID_RE.search(text)
+        if uid_match:
+            current['uid'] = uid_match.group(1).decode('ascii')
+
+    if b'INTERNALDATE' in text:
+        date_match = _INTERNALDATE_RE.search(text)
+        if date_match:
+            current['internal_date'] = parse_internal_date(date_match.group(1))
+
+    if b'X-GM-' not in text:
+        return
+    msgid = _GM_MSGID_RE.search(text)
+    if msgid:
+        current['gm_msgid'] = msgid.group(1).decode('ascii')
+    thrid = _GM_THRID_RE.search(text)
+    if thrid:
+        current['gm_thrid'] = thrid.group(1).decode('ascii')
+
+
+def parse_label_list(raw):
+    """Parses the contents of an X-GM-LABELS list into label names, unquoting quoted labels."""
+    labels = []
+    for quoted, atom in _LABEL_TOKEN_RE.findall(raw):
+        value = _QUOTED_ESCAPE_RE.sub(rb'\1', quoted) if quoted else atom
+        labels.append(value.decode('utf-8', errors='replace'))
+    return labels
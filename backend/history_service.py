@@ -1,17 +1,42 @@
 import json
 import os
+import threading
 import time
+from contextlib import contextmanager
 from typing import List, Dict
 
+try:
+    import fcntl
+except ImportError:     # Windows: single worker only
+    fcntl = None
+
+from metrics import HISTORY_WRITE_SECONDS
+
 DATA_FILE = "data/history.json"
+LOCK_FILE = "data/history.lock"
 
 class HistoryService:
     def __init__(self):
+        # history.json is read-modified-written per action; concurrent actions (e.g. a
+        # multi-account fan-out) would otherwise drop each other's updates. With several
+        # uvicorn workers the file is shared too, hence the file lock on top.
+        self._lock = threading.Lock()
         self.ensure_data_dir()
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(LOCK_FILE, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
         
     def ensure_data_dir(self):
-        if not os.path.exists("data"):
-            os.makedirs("data")
+        os.makedirs("data", exist_ok=True)
         if not os.path.exists(DATA_FILE):
              self.save_history({"logs": [], "stats": {"deleted": 0, "spam": 0, "unsubscribed": 0}})
 
@@ -23,10 +48,17 @@ class HistoryService:
             return {"logs": [], "stats": {"deleted": 0, "spam": 0, "unsubscribed": 0}}
 
     def save_history(self, data: Dict):
-        with open(DATA_FILE, "w") as f:
+        # Replaced atomically: another worker may be reading it for /api/history
+        tmp = f"{DATA_FILE}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
             json.dump(data, f, indent=2)
+        os.replace(tmp, DATA_FILE)
 
     def log_action(self, action_type: str, count: int, details: str, break_down: Dict[str, int] = None):
+        with self._lock, self._file_lock(), HISTORY_WRITE_SECONDS.time(action=action_type):
+            self._log_action(action_type, count, details, break_down)
+
+    def _log_action(self, action_type: str, count: int, details: str, break_down: Dict[str, int] = None):
         data = self.load_history()
         
         # Update Stats
@@ -1,13 +1,55 @@
 import imaplib
-import email
-from email.header import decode_header
+import os
+import time
+from array import array
+from bisect import bisect_left
 from email_service_base import EmailService
+from header_parser import parse_fetch_response
+from sender_normalizer import normalize_sender
+from sender_aggregate import SenderAggregate
+from metrics import IMAP_COMMANDS, IMAP_COMMAND_SECONDS, record_usage
+from tracing import span, accumulate
+
+DEFAULT_QUERY = 'is:unread'
+
+# Overridable for local IMAP servers (e.g. bench/fake_imap.py)
+IMAP_HOST = os.environ.get('IMAP_HOST', 'imap.gmail.com')
+IMAP_PORT = int(os.environ.get('IMAP_PORT', 993))
+IMAP_SSL = os.environ.get('IMAP_SSL', '1') != '0'
+
+# How long a SEARCH result stays shared with other workers (see shared_state.py)
+SHARED_SEARCH_TTL_SECONDS = 10 * 60
+
+
+def _quote(value):
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _scan_token(uidvalidity, uid):
+    """Page token of an IMAP scan: continue below `uid` while UIDVALIDITY is unchanged."""
+    return f"{uidvalidity}:{uid}"
+
+
+def _parse_scan_token(token):
+    """'<UIDVALIDITY>:<last UID>' -> (uidvalidity, uid)"""
+    try:
+        uidvalidity, uid = token.split(':')
+        return int(uidvalidity), int(uid)
+    except (AttributeError, ValueError):
+        raise ValueError("Invalid IMAP scan token")
+
 
 class ImapService(EmailService):
     def __init__(self):
         self.mail = None
         self.email_address = None
         self.password = None
+        # Gmail IMAP extensions (X-GM-RAW search, X-GM-MSGID/THRID/LABELS fetch items)
+        self.gm_ext = False
+        # Message ids handed out are UIDs, valid as long as the mailbox UIDVALIDITY doesn't change
+        self.uidvalidity = None
+        self.cached_ids = array('I')
+        self._cached_key = None
 
     def authenticate(self, email_address=None, password=None):
         if not email_address or not password:
@@ -17,9 +59,83 @@ class ImapService(EmailService):
         self.password = password
         
         # Connect to Gmail IMAP
-        self.mail = imaplib.IMAP4_SSL("imap.gmail.com")
-        self.mail.login(email_address, password)
-        self.mail.select("inbox")
+        if IMAP_SSL:
+            self.mail = imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT)
+        else:
+            self.mail = imaplib.IMAP4(IMAP_HOST, IMAP_PORT)
+        self._imap('login', email_address, password)
+        self._imap('select', "inbox")
+        _, data = self.mail.response('UIDVALIDITY')
+        self.uidvalidity = int(data[0]) if data and data[0] else 0
+        self.gm_ext = self._has_capability("X-GM-EXT-1")
+
+    def session_state(self):
+        """What another worker needs to reconnect this session (see shared_state.py)."""
+        return {"email": self.email_address, "password": self.password}
+
+    @staticmethod
+    def from_session_state(state):
+        service = ImapService()
+        service.authenticate(state["email"], state["password"])
+        return service
+
+    def _has_capability(self, name):
+        # Capabilities can change after login, so ask again rather than trusting the greeting
+        try:
+            status, data = self._imap('capability')
+            if status == "OK" and data:
+                return name.encode() in data[0].upper().split()
+        except Exception:
+            pass
+        return name in getattr(self.mail, 'capabilities', ())
+
+    def _search(self, query=None):
+        """
+        Returns the matching UIDs, ascending, as an array('I') (4 bytes each instead of a bytes
+        object per message).
+        With X-GM-EXT-1 the Gmail query (same syntax as the API provider's q=) runs server-side
+        via X-GM-RAW. Without it only the default unread selection is possible.
+        """
+        query = query or DEFAULT_QUERY
+        if self.gm_ext:
+            try:
+                query.encode('ascii')
+                status, messages = self._imap('uid', 'SEARCH', 'X-GM-RAW', _quote(query))
+            except UnicodeEncodeError:
+                # Non-ASCII queries have to be sent as a literal
+                self.mail.literal = query.encode('utf-8')
+                status, messages = self._imap('uid', 'SEARCH', 'CHARSET', 'UTF-8', 'X-GM-RAW')
+        elif query == DEFAULT_QUERY:
+            status, messages = self._imap('uid', 'SEARCH', 'UNSEEN')
+        else:
+            raise ValueError("This IMAP server does not support Gmail search queries (X-GM-EXT-1)")
+
+        if status != "OK":
+            return array('I')
+        return array('I', map(int, messages[0].split()))
+
+    def _fetch_items(self, header_fields, internal_date=False):
+        items = f"BODY.PEEK[HEADER.FIELDS ({header_fields})]"
+        if internal_date:
+            items = f"INTERNALDATE {items}"
+        if self.gm_ext:
+            # Stable ids, thread grouping and labels in the same round trip
+            items = f"X-GM-MSGID X-GM-THRID X-GM-LABELS {items}"
+        return f"({items})"
+
+    def _imap(self, command, *args):
+        """Runs an imaplib command, recording its count, status and latency."""
+        start = time.perf_counter()
+        status = 'error'
+        label = f"UID {args[0].upper()}" if command == 'uid' else command.upper()
+        try:
+            result = getattr(self.mail, command)(*args)
+            status = result[0]
+            return result
+        finally:
+            IMAP_COMMANDS.inc(command=label, status=status)
+            record_usage(label)
+            IMAP_COMMAND_SECONDS.observe(time.perf_counter() - start, command=label)
 
     def _ensure_connected(self):
         if not self.mail:
@@ -32,7 +148,7 @@ class ImapService(EmailService):
         self._ensure_connected()
         # STATUS command is faster than SEARCH for counts
         # But for unread specifically, we might need SEARCH or STATUS (UNSEEN)
-        status, response = self.mail.status("inbox", "(UNSEEN)")
+        status, response = self._imap('status', "inbox", "(UNSEEN)")
         # Response format: [b'"INBOX" (UNSEEN 123)']
         if status != "OK":
             return {"messagesUnread": 0, "threadsUnread": 0}
@@ -49,40 +165,36 @@ class ImapService(EmailService):
     def list_unread_messages(self, max_results=100):
         self._ensure_connected()
         
-        status, messages = self.mail.search(None, 'UNSEEN')
-        if status != "OK":
-            return []
-            
-        email_ids = messages[0].split()
+        email_ids = self._search()
         # Get latest first
         email_ids = email_ids[::-1][:max_results]
         
         result = []
+        if not email_ids:
+            return result
+
+        # One FETCH for the whole page instead of one round trip per message
+        id_str = ','.join(map(str, email_ids))
+        # BODY.PEEK to avoid marking as read
+        status, msg_data = self._imap('uid', 'FETCH', id_str, self._fetch_items('FROM SUBJECT'))
+        if status != "OK":
+            return result
+
+        by_uid = {p['uid']: p for p in parse_fetch_response(msg_data, ('FROM', 'SUBJECT'))}
         for e_id in email_ids:
-            # Fetch the email body (RFC822) for parsing
-            # Using '(BODY.PEEK[HEADER.FIELDS (FROM SUBJECT)])' to avoid marking as read
-            status, msg_data = self.mail.fetch(e_id, '(BODY.PEEK[HEADER.FIELDS (FROM SUBJECT)])')
-            
-            if status != "OK":
+            parsed = by_uid.get(str(e_id))
+            if not parsed:
                 continue
+            result.append({
+                "id": parsed['uid'], # IMAP UID
+                "threadId": parsed.get('gm_thrid'),
+                "gmMsgId": parsed.get('gm_msgid'), # Stable across sessions and folders
+                "labels": parsed.get('gm_labels', []),
+                "snippet": "Loading...", # Full snippet requires body fetch, keeping light
+                "subject": parsed['headers'].get('subject', '(No Subject)'),
+                "sender": parsed['headers'].get('from')
+            })
 
-            for response_part in msg_data:
-                if isinstance(response_part, tuple):
-                    msg = email.message_from_bytes(response_part[1])
-                    subject, encoding = decode_header(msg["Subject"])[0]
-                    if isinstance(subject, bytes):
-                        subject = subject.decode(encoding if encoding else "utf-8")
-                    
-                    sender = msg.get("From")
-                    
-                    result.append({
-                        "id": e_id.decode(), # IMAP ID
-                        "threadId": None,
-                        "snippet": "Loading...", # Full snippet requires body fetch, keeping light
-                        "subject": subject,
-                        "sender": sender
-                    })
-                    
         return result
 
     def batch_modify(self, message_ids, operation):
@@ -91,11 +203,11 @@ class ImapService(EmailService):
             return 0
             
         # IMAP requires comma separated list of IDs for newer versions or looping
-        # Often easier to join them: "1,2,3"
+        # Often easier to join them: "1,2,3". Ids are UIDs, so UID STORE/COPY.
         id_list = ",".join(message_ids)
         
         if operation == "READ":
-             self.mail.store(id_list, '+FLAGS', '\\Seen')
+             self._imap('uid', 'STORE', id_list, '+FLAGS', '\\Seen')
         elif operation == "TRASH":
             # Gmail IMAP Specific: Move to [Gmail]/Trash
             # This usually requires COPY then STORE \Deleted on original
@@ -107,8 +219,8 @@ class ImapService(EmailService):
             # BUT Gmail treats \Deleted as "Archive" or "Trash" depending on settings.
             # Safest "Move to Trash" is COPY to [Gmail]/Trash
             
-            self.mail.copy(id_list, '[Gmail]/Trash')
-            self.mail.store(id_list, '+FLAGS', '\\Deleted')
+            self._imap('uid', 'COPY', id_list, '[Gmail]/Trash')
+            self._imap('uid', 'STORE', id_list, '+FLAGS', '\\Deleted')
             
         return len(message_ids)
 
@@ -119,6 +231,11 @@ class ImapService(EmailService):
         # This is strictly "Delete" from inbox
         return self.batch_modify(message_ids, "TRASH")
 
+    def batch_delete_permanently(self, message_ids):
+        # Gmail IMAP only deletes for good when a message is expunged from [Gmail]/Trash,
+        # so moving to Trash is the closest safe equivalent (auto-purged after 30 days)
+        return self.batch_modify(message_ids, "TRASH")
+
     def mark_as_spam(self, message_ids):
         # Move to [Gmail]/Spam
         self._ensure_connected()
@@ -129,106 +246,115 @@ class ImapService(EmailService):
         # Try to find the Spam mailbox name (it varies by locale sometimes, but [Gmail]/Spam is standard for English)
         # For robustness, we should LIST, but assuming [Gmail]/Spam for MVP
         try:
-             self.mail.copy(id_list, '[Gmail]/Spam')
-             self.mail.store(id_list, '+FLAGS', '\\Deleted')
+             self._imap('uid', 'COPY', id_list, '[Gmail]/Spam')
+             self._imap('uid', 'STORE', id_list, '+FLAGS', '\\Deleted')
         except:
              # Fallback if copy fails (e.g. folder doesn't exist), just mark deleted
-             self.mail.store(id_list, '+FLAGS', '\\Deleted')
+             self._imap('uid', 'STORE', id_list, '+FLAGS', '\\Deleted')
              
         return len(message_ids)
 
-    def unsubscribe(self, message_ids):
-        # Alias to spam for now
-        return self.mark_as_spam(message_ids)
+    def get_unsubscribe_headers(self, message_ids):
+        """
+        From / List-Id / List-Unsubscribe / List-Unsubscribe-Post of each UID, one FETCH per 100.
+        Returns [{id, sender, list_id, list_unsubscribe, list_unsubscribe_post}] in input order;
+        ids that couldn't be fetched come back as {"id", "error"}.
+        """
+        self._ensure_connected()
+        fields = ('FROM', 'LIST-ID', 'LIST-UNSUBSCRIBE', 'LIST-UNSUBSCRIBE-POST')
+        found, errors = {}, {}
+        for i in range(0, len(message_ids), 100):
+            chunk = message_ids[i:i + 100]
+            try:
+                status, msg_data = self._imap('uid', 'FETCH', ','.join(chunk), f"(BODY.PEEK[HEADER.FIELDS ({' '.join(fields)})])")
+                if status != "OK":
+                    errors.update((mid, f"FETCH failed: {status}") for mid in chunk)
+                    continue
+                for parsed in parse_fetch_response(msg_data, fields):
+                    headers = parsed['headers']
+                    found[parsed['uid']] = {
+                        "id": parsed['uid'],
+                        "sender": parsed.get('from_raw'),
+                        "list_id": headers.get('list-id'),
+                        "list_unsubscribe": headers.get('list-unsubscribe'),
+                        "list_unsubscribe_post": headers.get('list-unsubscribe-post'),
+                    }
+            except Exception as e:
+                print(f"IMAP Fetch Error: {e}")
+                errors.update((mid, str(e)) for mid in chunk)
+        return [found.get(mid) or {"id": mid, "error": errors.get(mid, "Message not found")} for mid in message_ids]
+
+    def count_matches(self, query=None):
+        if not query or query == DEFAULT_QUERY:
+            counts = self.get_unread_count()
+            return {"messages": counts["messagesUnread"], "threads": None, "exact": True}
+        self._ensure_connected()
+        return {"messages": len(self._search(query)), "threads": None, "exact": True}
 
-    def get_sender_stats(self, limit: int = 500, page_token: str = None):
+    def get_sender_stats(self, limit: int = 500, page_token: str = None, query: str = None, known=None, sample_every=None):
         """
-        Stateful pagination for IMAP.
-        If page_token is None, we perform a new SEARCH and cache IDs.
-        If page_token is set (it's an index), we slice from there.
+        Pages through the matching messages newest first, by UID.
+        page_token is '<UIDVALIDITY>:<last UID returned>': it doesn't depend on this session's
+        state, so a scan can continue on a new connection or after a restart. The search result
+        is cached per (query, UIDVALIDITY) so following pages don't repeat the SEARCH.
+        INTERNALDATE comes in the same FETCH as From (rows get "ages").
+        known / sample_every are ignored: one FETCH covers 100 UIDs and there's no quota to save.
         """
         if not self.mail:
             raise Exception("IMAP not authenticated")
-            
-        # Initialize cache if needed
-        if not hasattr(self, 'cached_ids'):
-            self.cached_ids = []
-            
-        # New Search if no token
-        if not page_token:
-            status, messages = self.mail.search(None, 'UNSEEN')
-            if status != "OK":
-                return [], None
-            
-            all_ids = messages[0].split()
-            # Latest first
-            self.cached_ids = all_ids[::-1]
-            start_idx = 0
-        else:
-            try:
-                start_idx = int(page_token)
-            except:
-                start_idx = 0
-        
-        # Slice batch
-        end_idx = start_idx + limit
+
+        before_uid = None
+        if page_token:
+            uidvalidity, before_uid = _parse_scan_token(page_token)
+            if uidvalidity != self.uidvalidity:
+                raise ValueError("Scan cursor is no longer valid (mailbox UIDVALIDITY changed), restart the scan")
+
+        key = (query or DEFAULT_QUERY, self.uidvalidity)
+        if not page_token or self._cached_key != key:
+            self.cached_ids = (self._shared_search(key) if page_token else None) or self._search_and_share(query, key)
+            self._cached_key = key
+
+        # cached_ids is ascending; the page is the `limit` UIDs just below the cursor, latest first
+        end_idx = len(self.cached_ids) if before_uid is None else bisect_left(self.cached_ids, before_uid)
+        start_idx = max(0, end_idx - limit)
         batch_ids = self.cached_ids[start_idx:end_idx]
-        
-        # Determine next token
-        next_token = str(end_idx) if end_idx < len(self.cached_ids) else None
-        
+        batch_ids.reverse()
+
         if not batch_ids:
             return [], None
+
+        # Determine next token
+        next_token = _scan_token(self.uidvalidity, batch_ids[-1]) if start_idx > 0 else None
             
-        from classifier import classify_sender
+        from category_cache import sender_categories
         sender_map = {}
         
         # Helper to process a batch of IDs
         def process_batch(ids_batch):
              # Join IDs with comma
-             id_str = b','.join(ids_batch).decode('utf-8')
-             status, msg_data = self.mail.fetch(id_str, '(BODY.PEEK[HEADER.FIELDS (FROM)])')
+             id_str = ','.join(map(str, ids_batch))
+             with span('imap.fetch', size=len(ids_batch)):
+                 status, msg_data = self._imap('uid', 'FETCH', id_str, self._fetch_items('FROM', internal_date=True))
              if status != "OK": return
 
              # Parse the bulk response
-             for response_part in msg_data:
-                if isinstance(response_part, tuple):
-                    msg = email.message_from_bytes(response_part[1])
-                    sender_raw = msg.get("From", "(Unknown)")
-                    
-                    # Simplify name
-                    import re
-                    sender_name = sender_raw
-                    # Decode if needed (e.g. =?UTF-8?B?...)
-                    sender_name, encoding = decode_header(sender_name)[0]
-                    if isinstance(sender_name, bytes):
-                        sender_name = sender_name.decode(encoding if encoding else "utf-8")
-                    
-                    sender_email = ""
-                    # Remove <email> part if present for display
-                    match = re.search(r'(.*?)\s*<(.*)>', sender_name)
-                    if match:
-                        sender_name = match.group(1).strip().replace('"', '')
-                        sender_email = match.group(2).strip()
-                    elif '@' in sender_name:
-                        sender_email = sender_name
-                        
-                    if not sender_name: sender_name = sender_raw
+             with span('parse'):
+                 parsed_batch = parse_fetch_response(msg_data, ('FROM',))
+
+             with span('aggregate'):
+                 for parsed in parsed_batch:
+                    sender_name, sender_email, domain = normalize_sender(parsed['from_raw'])
 
                     if sender_name not in sender_map:
-                        category = classify_sender(sender_name, sender_email)
-                        sender_map[sender_name] = {'sender': sender_name, 'count': 0, 'ids': [], 'category': category}
-                    
-                    # Parse ID from prefix
-                    try:
-                        import re
-                        # Format: b'123 (BODY...'
-                        prefix = response_part[0].decode('utf-8')
-                        found_id = prefix.split(' ')[0]
-                        sender_map[sender_name]['ids'].append(found_id)
-                        sender_map[sender_name]['count'] += 1
-                    except:
-                        pass
+                        with accumulate('classify'):
+                            category = sender_categories.classify(sender_name, sender_email)
+                        sender_map[sender_name] = SenderAggregate(sender_name, sender_email, domain, category)
+
+                    entry = sender_map[sender_name]
+                    entry.add(parsed['uid'], received=parsed.get('internal_date'))
+                    if 'gm_thrid' in parsed:
+                        # Thread counts (X-GM-THRID), same shape as the API provider's thread mode
+                        entry.add_thread(parsed['gm_thrid'])
 
         # Process the batch (sub-batching if necessary, but 500 limit is fine for fetch)
         # IMAP command line length limits exist, so sticking to 100 chunks is safer
@@ -238,61 +364,73 @@ class ImapService(EmailService):
             process_batch(chunk)
 
         # Convert map to list (no need to sort globally yet, frontend will merge)
-        stats = list(sender_map.values())
+        stats = [entry.to_dict() for entry in sender_map.values()]
         return stats, next_token
 
+    def _shared_key(self, key):
+        return f"imap-search:{self.email_address}:{key[1]}:{key[0]}"
+
+    def _shared_search(self, key):
+        """SEARCH result another worker stored for this scan, if any."""
+        from shared_state import shared_state
+        if shared_state is None:
+            return None
+        blob = shared_state.get_blob(self._shared_key(key))
+        if blob is None:
+            return None
+        ids = array('I')
+        ids.frombytes(blob)
+        return ids
+
+    def _search_and_share(self, query, key):
+        from shared_state import shared_state
+        with span('imap.search'):
+            ids = self._search(query)
+        if shared_state is not None:
+            shared_state.put_blob(self._shared_key(key), ids.tobytes(), SHARED_SEARCH_TTL_SECONDS)
+        return ids
+
     def get_messages_details(self, message_ids):
+        """
+        Details for message UIDs, in input order; ids that couldn't be fetched come back as
+        {"id", "error"}.
+        """
         self._ensure_connected()
         if not message_ids:
             return []
             
         # Join IDs 
         chunk_size = 100
-        details = []
-        
-        import email
-        from email.header import decode_header
+        found = {}
+        errors = {}
         
         for i in range(0, len(message_ids), chunk_size):
             chunk = message_ids[i:i+chunk_size]
             id_str = ",".join(chunk)
             
             try:
-                status, msg_data = self.mail.fetch(id_str, '(BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE)])')
-                if status != "OK": continue
+                with span('imap.fetch', size=len(chunk)):
+                    status, msg_data = self._imap('uid', 'FETCH', id_str, self._fetch_items('FROM SUBJECT DATE'))
+                if status != "OK":
+                    errors.update((mid, f"FETCH failed: {status}") for mid in chunk)
+                    continue
                 
-                # We need to map responses back to IDs. 
                 # IMAP fetch response format: [(b'123 (BODY...', b'Header content'), b')']
-                
-                current_id = None
-                current_headers = {}
-                
-                for response_part in msg_data:
-                    if isinstance(response_part, tuple):
-                        # Extract ID
-                        try:
-                            prefix = response_part[0].decode('utf-8')
-                            current_id = prefix.split(' ')[0]
-                        except:
-                            current_id = None
-                            
-                        msg = email.message_from_bytes(response_part[1])
-                        
-                        subject, encoding = decode_header(msg.get("Subject", "(No Subject)"))[0]
-                        if isinstance(subject, bytes):
-                            subject = subject.decode(encoding if encoding else "utf-8")
-                            
-                        sender = msg.get("From", "(Unknown)")
-                        date = msg.get("Date", "")
-                        
-                        details.append({
-                            "id": current_id,
-                            "sender": sender,
-                            "subject": subject,
-                            "date": date,
-                            "snippet": "(Loading snippet requires full fetch)" 
-                        })
+                for parsed in parse_fetch_response(msg_data, ('FROM', 'SUBJECT', 'DATE')):
+                    headers = parsed['headers']
+                    found[parsed['uid']] = {
+                        "id": parsed['uid'],
+                        "threadId": parsed.get('gm_thrid'),
+                        "gmMsgId": parsed.get('gm_msgid'),
+                        "labels": parsed.get('gm_labels', []),
+                        "sender": headers.get("from", "(Unknown)"),
+                        "subject": headers.get("subject", "(No Subject)"),
+                        "date": headers.get("date", ""),
+                        "snippet": "(Loading snippet requires full fetch)" 
+                    }
             except Exception as e:
                 print(f"IMAP Fetch Error: {e}")
+                errors.update((mid, str(e)) for mid in chunk)
                 
-        return details
+        # A UID missing from the FETCH response was expunged or never existed
+        return [found.get(mid) or {"id": mid, "error": errors.get(mid, "Message not found")} for mid in message_ids]
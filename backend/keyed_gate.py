@@ -0,0 +1,40 @@
+import threading
+import time
+
+# Per-key politeness shared by the fan-out paths (unsubscribe hosts, accounts): at most `limit`
+# holders per key at once, and consecutive holders of a key start at least `interval` seconds
+# apart. Keys are independent, so a slow host or account never delays the others.
+
+
+class KeyedGate:
+    def __init__(self, limit=1, interval=0.0):
+        self.limit = limit
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._keys = {}     # key -> [semaphore, next start time]
+
+    def __call__(self, key):
+        """Context manager holding one of key's slots."""
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is None:
+                entry = self._keys[key] = [threading.Semaphore(self.limit), 0.0]
+        return _Slot(self, entry)
+
+
+class _Slot:
+    def __init__(self, gate, entry):
+        self.gate = gate
+        self.entry = entry
+
+    def __enter__(self):
+        self.entry[0].acquire()
+        with self.gate._lock:
+            start = max(time.monotonic(), self.entry[1])
+            self.entry[1] = start + self.gate.interval
+        delay = start - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def __exit__(self, *exc):
+        self.entry[0].release()
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, HTTPException, Header, Body, Depends
+from fastapi import FastAPI, HTTPException, Header, Body, Depends, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from email_service_base import EmailService
 from gmail_service import GmailApiService
@@ -6,11 +7,25 @@ from imap_service import ImapService
 from gmail_service import GmailApiService
 from imap_service import ImapService
 from history_service import HistoryService
+from unread_watcher import WatcherRegistry
+from scan_checkpoints import ScanCheckpointStore, encode_cursor, decode_cursor
+from details_cache import DetailsCache, paginate
+from search_index import SearchIndex
+from multi_account import AccountFanOut, merge_sender_stats
+from category_cache import sender_categories
+from shared_state import SessionStore, shared_state
+from credential_manager import credential_manager, write_token_file
+from scan_planner import plan_scan, plan_action, usage_report, SCAN_SAMPLE_EVERY
+from metrics import REGISTRY, HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_PROGRESS, register_cache, track_usage
+import tracing
+import logging
 import os
+import time
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 
 app = FastAPI(title="Gmail Cleanup API")
+logger = logging.getLogger(__name__)
 
 # Allow CORS for frontend
 app.add_middleware(
@@ -19,12 +34,43 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Server-Timing", "X-Trace-Id"],
 )
 
-# In-memory session store (prototype only!)
+tracing.configure_from_env()
+
+# Session store (prototype only!)
 # Map: token -> ServiceInstance
-# In production, use Redis or a proper session manager.
-sessions = {}
+# In memory by default. With SHARED_STATE=1 (several uvicorn workers) sessions are persisted in
+# data/state.db and each worker reconnects them on first use (see shared_state.py).
+def describe_session(service: EmailService):
+    return provider_name(service), account_of(service), service.session_state()
+
+def restore_session(row) -> EmailService:
+    provider = ImapService if row["provider"] == "imap" else GmailApiService
+    return provider.from_session_state(row["state"])
+
+def track_credentials(token: str, service: EmailService):
+    """Hands a Gmail account's OAuth credentials to the background refresher (see credential_manager.py)."""
+    if not isinstance(service, GmailApiService) or service.creds is None:
+        return
+    persist = reload = None
+    if token == "default":
+        persist = lambda creds: write_token_file("token.json", creds)
+    elif shared_state is not None:
+        persist = lambda creds: shared_state.update_session_state(token, service.session_state())
+        def reload():
+            row = shared_state.load_session(token)
+            return GmailApiService.credentials_from_state(row["state"]) if row else None
+    credential_manager.track(token, service.creds, persist=persist, reload=reload)
+
+def close_session(token: str):
+    """Stops what a removed session left running: its unread watcher and credential refresh."""
+    unread_watchers.remove(token)
+    credential_manager.forget(token)
+
+sessions = SessionStore(shared_state, describe=describe_session, restore=restore_session,
+                        on_open=track_credentials, on_close=close_session)
 
 # Default service for local "single user" OAuth mode (legacy support)
 default_oauth_service = GmailApiService()
@@ -32,6 +78,112 @@ default_oauth_service = GmailApiService()
 # Initialize History Service
 history_service = HistoryService()
 
+# Live unread counters, one watcher per session (see unread_watcher.py)
+unread_watchers = WatcherRegistry()
+
+# Resumable scans: opaque cursors + per-page checkpoints under data/scans (see scan_checkpoints.py)
+scan_checkpoints = ScanCheckpointStore()
+
+# Local full-text index over fetched senders/subjects/snippets (see search_index.py)
+search_index = SearchIndex()
+
+# Message details shared across sessions and tabs of the same account (see details_cache.py);
+# the search index forgets whatever the cache evicts
+details_cache = DetailsCache(on_evict=search_index.forget_details, on_invalidate=search_index.remove, shared=shared_state)
+register_cache('message_details', details_cache.stats)
+
+# Sender -> category, persisted and versioned by the classifier rule set (see category_cache.py)
+register_cache('sender_categories', sender_categories.stats)
+
+# Scans and bulk actions over several sessions at once (see multi_account.py)
+account_fanout = AccountFanOut()
+
+# Sync endpoints run on AnyIO's worker thread pool (40 threads by default); every provider call
+# blocks one of them, so this is the app's concurrency ceiling. THREADPOOL_SIZE overrides it.
+threadpool_limiter = None
+
+@app.on_event("startup")
+def configure_threadpool():
+    global threadpool_limiter
+    from anyio import to_thread
+    threadpool_limiter = to_thread.current_default_thread_limiter()
+    size = os.environ.get("THREADPOOL_SIZE")
+    if size:
+        threadpool_limiter.total_tokens = int(size)
+
+@app.on_event("startup")
+def load_sender_categories():
+    # Loads the table and reclassifies whatever a rule change affected, before the first scan
+    sender_categories.reclassify()
+
+@app.on_event("startup")
+def prune_shared_state():
+    if shared_state is not None:
+        removed = shared_state.prune()
+        logger.info("Shared state at %s (worker %d), pruned %d rows", shared_state.path, os.getpid(), removed)
+
+@app.on_event("shutdown")
+def flush_sender_categories():
+    sender_categories.flush()
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    HTTP_REQUESTS_IN_PROGRESS.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_REQUESTS_IN_PROGRESS.dec()
+        # Label by route template (/api/senders), not the raw URL, to keep cardinality bounded
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=route.path if route else "unmatched",
+            status=status
+        )
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """
+    Opt-in per request with `X-Trace: 1` (or ?trace=1); `profile` also samples the stacks.
+    The phase breakdown comes back as a Server-Timing header; the full trace is at /api/traces/{id}.
+    """
+    mode = request.headers.get("x-trace") or request.query_params.get("trace")
+    if not mode or mode == "0":
+        return await call_next(request)
+
+    trace, token = tracing.start_trace(f"{request.method} {request.url.path}", profile=(mode == "profile"))
+    try:
+        response = await call_next(request)
+    finally:
+        tracing.end_trace(trace, token)
+    response.headers["Server-Timing"] = trace.server_timing()
+    response.headers["Timing-Allow-Origin"] = "*"
+    response.headers["X-Trace-Id"] = trace.id
+    return response
+
+def collect_app_metrics():
+    families = [
+        ("active_sessions", "gauge", "Sessions live in this worker", [({}, len(sessions))]),
+        ("active_unread_watchers", "gauge", "Running live unread watchers", [({}, unread_watchers.active_count())]),
+        ("oauth_credentials_tracked", "gauge", "OAuth credentials kept fresh in the background",
+         [({}, credential_manager.stats()["tracked"])]),
+    ]
+    if threadpool_limiter is not None:
+        families.append(("threadpool_threads_busy", "gauge", "Worker threads running sync endpoints",
+                         [({}, threadpool_limiter.borrowed_tokens)]))
+        families.append(("threadpool_threads_max", "gauge", "Worker thread pool size",
+                         [({}, threadpool_limiter.total_tokens)]))
+        families.append(("threadpool_waiting", "gauge", "Requests queued for a worker thread",
+                         [({}, threadpool_limiter.statistics().tasks_waiting)]))
+    return families
+
+REGISTRY.add_collector(collect_app_metrics)
+
 class ImapLoginRequest(BaseModel):
     email: str
     password: str
@@ -40,30 +192,79 @@ class AuthResponse(BaseModel):
     token: str
     type: str
 
+def default_service() -> Optional[EmailService]:
+    """
+    The token.json account (backward compatibility / single user ease), loaded once; its token is
+    then kept fresh by the credential manager rather than re-checked per request.
+    """
+    if default_oauth_service.service is None and os.path.exists('token.json'):
+        try:
+            default_oauth_service.authenticate()
+            track_credentials("default", default_oauth_service)
+        except Exception as e:
+            logger.warning("Could not load token.json: %s", e)
+    return default_oauth_service if default_oauth_service.service else None
+
 def get_service(x_auth_token: Optional[str] = Header(None)) -> EmailService:
     # 1. Check if we have an active session for this token
-    if x_auth_token and x_auth_token in sessions:
-        return sessions[x_auth_token]
-    
-    # 2. Fallback: If no token, or token invalid, check if we have a global OAuth creds file
-    # and default to that (for backward compatibility / single user ease)
-    if os.path.exists('token.json') or os.path.exists('credentials.json'):
-         # Ensure we authenticate
-         try:
-             default_oauth_service.authenticate()
-             # CRITICAL: Check if service is actually active. 
-             # If token.json is missing, authenticate() might do nothing, leaving service as None.
-             if default_oauth_service.service or hasattr(default_oauth_service, 'mail'): # Support Imap too if we switch default
-                 return default_oauth_service
-         except:
-             pass
+    service = sessions.get(x_auth_token) if x_auth_token else None
+    if service is not None:
+        credential_manager.touch(x_auth_token)
+        return service
+
+    # 2. Fallback: If no token, or token invalid, use the global OAuth token file
+    service = default_service()
+    if service is not None:
+        credential_manager.touch("default")
+        return service
 
     raise HTTPException(status_code=401, detail="Not authenticated. Please login.")
 
+def session_key(x_auth_token: Optional[str]) -> str:
+    # Requests without a known token all share the default OAuth service
+    return x_auth_token if x_auth_token and x_auth_token in sessions else "default"
+
+def provider_name(service: EmailService) -> str:
+    return "imap" if isinstance(service, ImapService) else "gmail"
+
+def account_of(service: EmailService) -> Optional[str]:
+    # Gmail asks users.getProfile once per service; IMAP sessions know their address
+    if isinstance(service, GmailApiService):
+        return service.account_address()
+    return getattr(service, "email_address", None)
+
+def details_key(service: EmailService, x_auth_token: Optional[str]) -> str:
+    """
+    Cache/index namespace for message details: ids are only unique per account (and
+    UIDVALIDITY), so every session of an account shares it. Falls back to the session if the
+    Gmail profile can't be read.
+    """
+    if isinstance(service, ImapService):
+        return f"imap:{service.email_address}:{service.uidvalidity}"
+    return f"gmail:{account_of(service) or session_key(x_auth_token)}"
+
+def fetch_details(service: EmailService, key: str):
+    """get_messages_details that also indexes what it fetched (IMAP has no real snippets)."""
+    snippets = provider_name(service) == "gmail"
+    return lambda ids: search_index.add_details(key, service.get_messages_details(ids), snippets)
+
 @app.get("/")
 def read_root():
     return {"message": "Gmail Cleanup API is running"}
 
+@app.get("/api/metrics")
+def get_metrics():
+    """Prometheus text exposition of the in-process metrics registry."""
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/traces/{trace_id}")
+def get_trace(trace_id: str):
+    """Full span tree (and sampling profile, if requested) of a recently traced request."""
+    trace = tracing.get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (only the most recent traces are kept)")
+    return trace
+
 @app.get("/api/health")
 def health_check():
     return {"status": "ok"}
@@ -95,74 +296,456 @@ def check_auth(x_auth_token: Optional[str] = Header(None)):
     return {"authenticated": False}
 
 @app.get("/api/stats")
-def get_stats(service: EmailService = Depends(get_service)):
+def get_stats(request: Request, x_auth_token: Optional[str] = Header(None), service: EmailService = Depends(get_service)):
+    """
+    Unread counts, served from the session's watcher cache.
+    Supports ETag / If-None-Match so repeated polls cost a 304 and no provider call.
+    """
     try:
-        return service.get_unread_count()
+        counts, etag = unread_watchers.get_counts(session_key(x_auth_token), service)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(counts, headers=headers)
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/stats/stream")
+async def stream_stats(request: Request, token: Optional[str] = None, x_auth_token: Optional[str] = Header(None)):
+    """
+    Server-Sent Events push channel for unread counts.
+    EventSource can't send headers, so the session token may also be passed as ?token=
+    """
+    import asyncio
+    import json
+    from starlette.concurrency import run_in_threadpool
+
+    auth_token = x_auth_token or token
+    service = get_service(auth_token)
+    key = session_key(auth_token)
+
+    async def events():
+        last_etag = None
+        idle_ticks = 0
+        while not await request.is_disconnected():
+            counts, etag = await run_in_threadpool(unread_watchers.get_counts, key, service)
+            if etag != last_etag:
+                last_etag = etag
+                idle_ticks = 0
+                yield f"event: stats\ndata: {json.dumps(counts)}\n\n"
+            else:
+                idle_ticks += 1
+                if idle_ticks % 15 == 0:
+                    # Keep proxies from closing the idle stream
+                    yield ": keep-alive\n\n"
+            await asyncio.sleep(1)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.get("/api/emails")
 def get_emails(x_auth_token: Optional[str] = Header(None)):
     try:
         service = get_service(x_auth_token)
-        return service.list_unread_messages()
+        messages = service.list_unread_messages()
+        search_index.add_details(details_key(service, x_auth_token), messages, provider_name(service) == "gmail")
+        return messages
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+def scan_counts(service: EmailService, x_auth_token: Optional[str], q: Optional[str]):
+    """Messages/threads a scan of q covers; the unread counts come from the watcher cache."""
+    if not q or q == "is:unread":
+        counts, _ = unread_watchers.get_counts(session_key(x_auth_token), service)
+        return {"messages": counts.get("messagesUnread", 0), "threads": counts.get("threadsUnread") or None,
+                "exact": True}
+    return service.count_matches(q)
+
+def make_scan_plan(service: EmailService, x_auth_token: Optional[str], q: Optional[str], limit: int, estimates: bool = False):
+    """Cost plan of a whole scan (see scan_planner.py), including what planning itself cost."""
+    provider = provider_name(service)
+    with track_usage() as usage:
+        counts = scan_counts(service, x_auth_token, q)
+    # Only the Gmail scan reuses indexed senders
+    known = search_index.count(details_key(service, x_auth_token)) if provider == "gmail" else 0
+    plan = plan_scan(provider, counts, known, limit, allow_estimates=estimates)
+    plan["query"] = q
+    plan["planningUsage"] = usage_report(usage, provider)
+    return plan
+
+def scan_page(service: EmailService, x_auth_token: Optional[str], limit: int, pageToken: Optional[str], mode: str, q: Optional[str], plan: bool = False):
+    """One checkpointed scan page (see get_senders); ValueError for bad cursors, 403 for another account's scan."""
+    provider = provider_name(service)
+    key = details_key(service, x_auth_token)
+    scan_plan = None
+    if pageToken:
+        cursor = decode_cursor(pageToken)
+        if cursor["p"] != provider:
+            raise ValueError("Scan cursor belongs to a different provider")
+        scan_id, provider_token, page = cursor["scan"], cursor["t"], cursor["n"] + 1
+        q, mode = cursor.get("q"), cursor.get("m") or "messages"
+        # Pages may only be appended to a scan of this account
+        header = scan_checkpoints.header(scan_id)
+        if header is None:
+            raise ValueError("Scan checkpoint not found, restart the scan")
+        check_scan_owner(header, service)
+    else:
+        if plan:
+            scan_plan = make_scan_plan(service, x_auth_token, q, limit, estimates=(mode == "sampled"))
+            if mode == "auto":
+                mode = scan_plan["mode"]
+        elif mode == "auto":
+            mode = make_scan_plan(service, x_auth_token, q, limit)["mode"]
+        scan_id = scan_checkpoints.start(provider, account_of(service), q, mode, scan_plan)
+        provider_token, page = None, 1
+
+    # Limit acts as batch_size here
+    with track_usage() as usage:
+        if mode == "threads":
+            stats, next_token = service.get_thread_sender_stats(limit=limit, page_token=provider_token, query=q)
+        else:
+            stats, next_token = service.get_sender_stats(
+                limit=limit, page_token=provider_token, query=q,
+                known=lambda ids: search_index.known_senders(key, ids),
+                sample_every=SCAN_SAMPLE_EVERY if mode == "sampled" else None)
+
+    next_cursor = encode_cursor(scan_id, provider, next_token, page, q, mode) if next_token else None
+    page_usage = usage_report(usage, provider)
+    search_index.add_senders(key, [s for s in stats if not s.get("estimated")])
+    # Received time per id only matters to the index (date-range actions); rows keep "ages"
+    for s in stats:
+        s.pop("dates", None)
+    scan_checkpoints.record_page(scan_id, page, stats, next_cursor, page_usage)
+    # Thread ids only matter to the checkpoint (thread counts across pages)
+    for s in stats:
+        s.pop("threadIds", None)
+    result = {
+        "stats": stats,
+        "nextPageToken": next_cursor,
+        "scanId": scan_id,
+        "mode": mode,
+        "usage": page_usage
+    }
+    if scan_plan is not None:
+        result["plan"] = scan_plan
+    return result
+
 @app.get("/api/senders")
-def get_senders(x_auth_token: Optional[str] = Header(None), limit: int = 500, pageToken: Optional[str] = None):
+def get_senders(x_auth_token: Optional[str] = Header(None), limit: int = 500, pageToken: Optional[str] = None, mode: str = "messages", q: Optional[str] = None, plan: bool = False):
     """
     Get unread emails aggregated by sender (Paginated).
-    Returns: { "stats": [...], "nextPageToken": "..." }
+    mode=threads aggregates from thread metadata (limit then counts threads, not messages);
+    mode=sampled fetches senders for a sample only (Gmail): rows are marked "estimated" and carry
+    the sampled ids as "sampleIds" with empty "ids", since bulk actions need a full scan;
+    mode=auto lets the scan planner pick the cheapest exact mode (see /api/plan/scan).
+    Messages whose sender is already indexed locally cost no provider call.
+    q is a Gmail search query (default 'is:unread'); IMAP runs it server-side via X-GM-RAW.
+    pageToken is the opaque scan cursor from the previous page; it carries the query and mode,
+    and stays valid across sessions and restarts (see scan_checkpoints.py).
+    plan=true on the first page stores the scan's cost plan with its checkpoint, next to the
+    usage of every page (GET /api/scans/{id}).
+    Returns: { "stats": [...], "nextPageToken": "...", "scanId": "...", "mode": "...",
+               "usage": {calls, apiCalls, quotaUnits, seconds}, "plan": {...} (first page, plan=true) }
     """
     try:
         service = get_service(x_auth_token)
-        # Limit acts as batch_size here
-        stats, next_token = service.get_sender_stats(limit=limit, page_token=pageToken)
-        return {
-            "stats": stats,
-            "nextPageToken": next_token
-        }
+        return scan_page(service, x_auth_token, limit, pageToken, mode, q, plan)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/plan/scan")
+def get_scan_plan(q: Optional[str] = None, limit: int = 500, estimates: bool = False, x_auth_token: Optional[str] = Header(None), service: EmailService = Depends(get_service)):
+    """
+    Estimated API calls, Gmail quota units and wall time of a whole scan of q, per strategy
+    (threads / cached / full / sampled), and the cheapest one ("mode" to pass to /api/senders).
+    estimates=true lets it recommend the sampled scan, whose counts are extrapolated.
+    """
+    try:
+        return make_scan_plan(service, x_auth_token, q, limit, estimates)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+class DateRange(BaseModel):
+    senders: List[str]      # sender names or addresses, as in scan rows
+    olderThanDays: Optional[float] = None
+    newerThanDays: Optional[float] = None
+
+def check_scan_owner(header: dict, service: EmailService):
+    """403 unless a checkpoint (its header) was started by this service's provider and account."""
+    if header.get("provider") != provider_name(service) or header.get("account") != account_of(service):
+        raise HTTPException(status_code=403, detail="Scan belongs to a different account")
+
+def load_owned_scan(scan_id: str, service: EmailService):
+    """The scan's checkpoint; HTTPException unless it exists and belongs to this service's account."""
+    try:
+        scan = scan_checkpoints.load(scan_id)
+    except ValueError:
+        scan = None
+    if scan is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    check_scan_owner(scan, service)
+    return scan
+
+def resolve_date_range(service: EmailService, x_auth_token: Optional[str], match: DateRange, ids: Optional[List[str]] = None, scan_id: Optional[str] = None):
+    """
+    Message ids (oldest first) and per-sender counts of the scanned messages in a date range,
+    from the received times the scans stored in the search index: no provider round trip.
+    The index holds every query's scans (and messages read or moved since), so the range is
+    only resolved within what the client is looking at: the ids it sent and/or the messages of
+    its scan (scan_id), intersected when both are given. Raises ValueError without either or
+    for an empty range.
+    """
+    if match.olderThanDays is None and match.newerThanDays is None:
+        raise ValueError("Date range needs olderThanDays and/or newerThanDays")
+    if not ids and not scan_id:
+        raise ValueError("Date range needs the scan's ids or its scanId")
+    scope = set(ids) if ids else None
+    if scan_id:
+        scan = load_owned_scan(scan_id, service)
+        scanned = {msg_id for row in scan["stats"] for msg_id in row["ids"]}
+        scope = scanned if scope is None else scope & scanned
+    if not scope:
+        return [], {}
+    now = time.time()
+    before = now - match.olderThanDays * 86400 if match.olderThanDays is not None else None
+    after = now - match.newerThanDays * 86400 if match.newerThanDays is not None else None
+    rows = search_index.find_by_age(details_key(service, x_auth_token), match.senders, before, after, scope)
+    breakdown = {}
+    for _, sender in rows:
+        breakdown[sender] = breakdown.get(sender, 0) + 1
+    return [msg_id for msg_id, _ in rows], breakdown
+
+class ActionPlanRequest(BaseModel):
+    action: str     # delete | spam | unsubscribe
+    ids: List[str] = []
+    lists: Optional[int] = None     # unsubscribe: expected number of lists (e.g. senders selected)
+    dateRange: Optional[DateRange] = None   # price /api/emails/by-date instead (ids / scanId scope it)
+    scanId: Optional[str] = None
+
+@app.post("/api/plan/action")
+def get_action_plan(request: ActionPlanRequest, x_auth_token: Optional[str] = Header(None), service: EmailService = Depends(get_service)):
+    """Estimated API calls, quota units and time of a bulk action; the action returns its actual "usage"."""
+    try:
+        ids = request.ids
+        if request.dateRange is not None:
+            ids, _ = resolve_date_range(service, x_auth_token, request.dateRange, request.ids, request.scanId)
+        return plan_action(provider_name(service), request.action, len(set(ids)), request.lists)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/scans/{scan_id}")
+def get_scan(scan_id: str, service: EmailService = Depends(get_service)):
+    """
+    Checkpoint of a (possibly unfinished) scan: merged stats of the completed pages and the
+    cursor to continue from (nextPageToken, null once done), the plan if one was requested and
+    the provider usage of the completed pages.
+    """
+    return load_owned_scan(scan_id, service)
+
+def fanout_key(service: EmailService, token: str) -> str:
+    """Per-account identity for fan-out limits: two sessions on one IMAP mailbox share it."""
+    return f"{provider_name(service)}:{account_of(service) or token}"
+
+def resolve_sessions(tokens: List[str]):
+    """Known sessions among tokens (deduplicated), and errors for the unknown ones."""
+    services, errors = {}, {}
+    for token in dict.fromkeys(tokens):
+        service = sessions.get(token)
+        if service is not None:
+            services[token] = service
+            credential_manager.touch(token)
+        else:
+            errors[token] = {"error": "Not authenticated"}
+    return services, errors
+
+class MultiScanRequest(BaseModel):
+    tokens: List[str]
+    limit: int = 500
+    mode: str = "messages"
+    q: Optional[str] = None
+    # token -> that account's nextPageToken from the previous response; null = account finished
+    cursors: Optional[Dict[str, Optional[str]]] = None
+
+@app.post("/api/accounts/senders")
+def get_multi_account_senders(request: MultiScanRequest):
+    """
+    One scan page of each of several sessions (e.g. a Gmail account and two IMAP accounts), run in
+    parallel: the page takes as long as the slowest account. Accounts that fail or time out are
+    reported in "accounts" without failing the others.
+    Returns: { "stats": [{sender, email, domain, category, count, accounts: [{account, count, ids}]}],
+               "accounts": {token: {provider, account, nextPageToken, scanId, mode, usage, ms} | {error, ms}} }
+    """
+    services, outcomes = resolve_sessions(request.tokens)
+    cursors = request.cursors or {}
+    jobs = {}
+    for token, service in services.items():
+        if token in cursors and cursors[token] is None:
+            continue    # Finished in an earlier page
+        jobs[token] = (fanout_key(service, token), lambda service=service, token=token: scan_page(
+            service, token, request.limit, cursors.get(token), request.mode, request.q))
+
+    pages = {}
+    for token, outcome in account_fanout.run(jobs).items():
+        if "error" in outcome:
+            outcomes[token] = outcome
+            continue
+        page = outcome["result"]
+        pages[token] = page["stats"]
+        service = services[token]
+        outcomes[token] = {"provider": provider_name(service), "account": account_of(service),
+                           "nextPageToken": page["nextPageToken"], "scanId": page["scanId"], "mode": page["mode"],
+                           "usage": page["usage"], "ms": outcome["ms"]}
+    return {"stats": merge_sender_stats(pages), "accounts": outcomes}
+
+class MultiActionRequest(BaseModel):
+    action: str     # delete | spam | unsubscribe
+    ids: Dict[str, List[str]] = {}   # token -> message ids in that account
+    senders: Optional[Dict[str, Dict[str, int]]] = None     # token -> sender breakdown (delete history)
+    dateRange: Optional[DateRange] = None   # resolved per account within its ids and/or scan
+    scans: Optional[Dict[str, str]] = None  # with dateRange: token -> scanId
+    tokens: Optional[List[str]] = None      # with dateRange: accounts to act on (default: keys of ids)
+
+@app.post("/api/accounts/actions")
+def multi_account_action(request: MultiActionRequest):
+    """
+    Runs one bulk action on several accounts concurrently; each account gets its own ids.
+    Returns: { "count": total, "accounts": {token: {count, ..., ms} | {error, ms}} }
+    """
+    if request.action not in ("delete", "spam", "unsubscribe"):
+        raise HTTPException(status_code=400, detail=f"Unknown action: {request.action}")
+    if request.dateRange is not None and request.dateRange.olderThanDays is None and request.dateRange.newerThanDays is None:
+        raise HTTPException(status_code=400, detail="Date range needs olderThanDays and/or newerThanDays")
+    if request.dateRange is None:
+        require_ids([msg_id for ids in request.ids.values() for msg_id in ids])
+    services, outcomes = resolve_sessions(list(request.tokens or request.ids))
+    senders = request.senders or {}
+
+    def run(service, token):
+        if request.dateRange is None:
+            return apply_action(request.action, service, token, request.ids[token], senders.get(token))
+        ids, breakdown = resolve_date_range(service, token, request.dateRange, request.ids.get(token),
+                                            (request.scans or {}).get(token))
+        if not ids:
+            return {"count": 0, "matched": 0}
+        return {**apply_action(request.action, service, token, ids, breakdown), "matched": len(ids)}
+
+    jobs = {token: (fanout_key(service, token), lambda service=service, token=token: run(service, token))
+            for token, service in services.items() if request.dateRange is not None or request.ids.get(token)}
+
+    total = 0
+    for token, outcome in account_fanout.run(jobs).items():
+        if "error" in outcome:
+            outcomes[token] = outcome
+            continue
+        total += outcome["result"]["count"]
+        outcomes[token] = {**outcome["result"], "ms": outcome["ms"]}
+    return {"count": total, "accounts": outcomes}
+
 class DeleteRequest(BaseModel):
     ids: List[str]
     senders: Optional[Dict[str, int]] = {}
 
+def require_ids(ids: List[str]):
+    """Bulk actions need the ids of the messages; rows of a sampled scan ("estimated") have none."""
+    if not ids:
+        raise HTTPException(status_code=400, detail="No message ids given (rows estimated from a sampled scan "
+                                                    "can't be acted on; run a full scan first)")
+
+def apply_action(action: str, service: EmailService, x_auth_token: Optional[str], ids: List[str], senders: Optional[Dict[str, int]] = None):
+    """Runs a bulk action on one account and does the bookkeeping; the result carries its provider usage."""
+    with track_usage() as usage:
+        result = _apply_action(action, service, x_auth_token, ids, senders)
+    result["usage"] = usage_report(usage, provider_name(service))
+    return result
+
+def _apply_action(action: str, service: EmailService, x_auth_token: Optional[str], ids: List[str], senders: Optional[Dict[str, int]] = None):
+    if action == "unsubscribe":
+        report = service.unsubscribe(ids)
+        count = report["count"]
+        manual = sum(1 for l in report["lists"] if l["status"] == "manual")
+        failed = sum(1 for l in report["lists"] if l["status"] in ("failed", "refused"))
+        history_service.log_action("unsubscribe", count,
+                                   f"Unsubscribed from {count} lists ({failed} failed, {manual} need a manual step)")
+        return report
+
+    if action == "delete":
+        count = service.move_to_trash(ids)
+    elif action == "spam":
+        count = service.mark_as_spam(ids)
+    else:
+        raise ValueError(f"Unknown action: {action}")
+    unread_watchers.invalidate(session_key(x_auth_token))
+    details_cache.invalidate(details_key(service, x_auth_token), ids)
+    if action == "delete":
+        history_service.log_action("delete", count, f"Deleted {count} emails", senders)
+    else:
+        history_service.log_action("spam", count, f"Marked {count} emails as spam")
+    return {"count": count}
+
+class DateRangeActionRequest(DateRange):
+    action: str     # delete | spam | unsubscribe
+    ids: Optional[List[str]] = None     # the messages the range applies within (e.g. the rows shown)
+    scanId: Optional[str] = None        # and/or the scan it applies within; one of the two is required
+
+@app.post("/api/emails/by-date")
+def date_range_action(request: DateRangeActionRequest, x_auth_token: Optional[str] = Header(None), service: EmailService = Depends(get_service)):
+    """
+    Bulk action on the scanned messages of some senders in a date range, e.g. everything older
+    than 90 days from these senders. Resolved here from the received times the scan stored,
+    within the given ids and/or scanId only, then run like the id-based actions.
+    Returns the action's result plus "matched" (messages in the range).
+    """
+    if request.action not in ("delete", "spam", "unsubscribe"):
+        raise HTTPException(status_code=400, detail=f"Unknown action: {request.action}")
+    try:
+        ids, breakdown = resolve_date_range(service, x_auth_token, request, request.ids, request.scanId)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not ids:
+        return {"count": 0, "matched": 0}
+    try:
+        return {**apply_action(request.action, service, x_auth_token, ids, breakdown), "matched": len(ids)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/emails/delete-all")
-def delete_all(request: DeleteRequest, service: EmailService = Depends(get_service)):
+def delete_all(request: DeleteRequest, x_auth_token: Optional[str] = Header(None), service: EmailService = Depends(get_service)):
+    require_ids(request.ids)
     try:
-        count = service.move_to_trash(request.ids)
-        history_service.log_action("delete", count, f"Deleted {count} emails", request.senders)
-        return {"count": count}
+        return apply_action("delete", service, x_auth_token, request.ids, request.senders)
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/emails/spam")
-def mark_spam(ids: list[str] = Body(...), service: EmailService = Depends(get_service)):
+def mark_spam(ids: list[str] = Body(...), x_auth_token: Optional[str] = Header(None), service: EmailService = Depends(get_service)):
+    require_ids(ids)
     try:
-        count = service.mark_as_spam(ids)
-        history_service.log_action("spam", count, f"Marked {count} emails as spam")
-        return {"count": count}
+        return apply_action("spam", service, x_auth_token, ids)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
         
 @app.post("/api/emails/unsubscribe")
-def unsubscribe(ids: list[str] = Body(...), service: EmailService = Depends(get_service)):
+def unsubscribe(ids: list[str] = Body(...), x_auth_token: Optional[str] = Header(None), service: EmailService = Depends(get_service)):
+    """
+    One-click unsubscribe (RFC 8058) from the lists of these messages; the messages stay put.
+    Returns: { "count": lists unsubscribed, "messages": n, "skipped": messages without any list,
+               "lists": [{list, sender, messages, method, status, url, httpStatus, error}] }
+    status is ok / failed / refused, or manual (mailto or plain link only) / unsupported.
+    """
+    require_ids(ids)
     try:
-        # Currently just marks as spam in IMAP, placeholder in Gmail
-        count = service.unsubscribe(ids)
-        history_service.log_action("unsubscribe", count, f"Unsubscribed from {count} senders")
-        return {"count": count}
+        return apply_action("unsubscribe", service, x_auth_token, ids)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -170,19 +753,85 @@ def unsubscribe(ids: list[str] = Body(...), service: EmailService = Depends(get_
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/emails/batch")
-def get_email_details(ids: list[str] = Body(...), service: EmailService = Depends(get_service)):
+def get_email_details(ids: list[str] = Body(...), x_auth_token: Optional[str] = Header(None), service: EmailService = Depends(get_service)):
+    """
+    Fetch specific details for a list of email IDs (cached, see details_cache.py).
+    Returns: [{id, sender, subject, date, snippet}, ...] in the order of ids;
+    ids that couldn't be fetched are {id, error}.
+    """
+    try:
+        key = details_key(service, x_auth_token)
+        return details_cache.get_many(key, ids, fetch_details(service, key))
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+class DetailsPageRequest(BaseModel):
+    ids: List[str]
+    cursor: Optional[str] = None
+    limit: int = 50
+
+@app.post("/api/emails/details")
+def get_email_details_page(request: DetailsPageRequest, x_auth_token: Optional[str] = Header(None), service: EmailService = Depends(get_service)):
     """
-    Fetch specific details for a list of email IDs.
-    Returns: [{id, sender, subject, date, snippet}, ...]
+    One page of details over a long id list (e.g. all 20k messages of a sender).
+    Pass nextCursor back to get the following page.
+    Returns: { "items": [...], "nextCursor": "..." | null, "total": n }
     """
     try:
-        details = service.get_messages_details(ids)
-        return details
+        page_ids, next_cursor = paginate(request.ids, request.cursor, min(request.limit, 500))
+        key = details_key(service, x_auth_token)
+        items = details_cache.get_many(key, page_ids, fetch_details(service, key))
+        return {"items": items, "nextCursor": next_cursor, "total": len(request.ids)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/search")
+def search(q: str, limit: int = 1000, x_auth_token: Optional[str] = Header(None), service: EmailService = Depends(get_service)):
+    """
+    Searches the local index of everything already fetched for this account (scans, unread
+    listings, details): sender names and addresses, subjects and, for Gmail, snippets.
+    No provider call; messages never fetched aren't found.
+    Returns: { "ids": [...], "senders": [{sender, email, domain, count, ids, category}], "total": n,
+               "truncated": bool, "tookMs": ms }
+    """
+    start = time.perf_counter()
+    result = search_index.search(details_key(service, x_auth_token), q, limit)
+    if result is None:
+        raise HTTPException(status_code=400, detail="Search query has no searchable terms")
+    result["tookMs"] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+class SenderRef(BaseModel):
+    sender: str
+    email: Optional[str] = ""
+
+class CategoryLookupRequest(BaseModel):
+    senders: List[SenderRef]
+
+@app.post("/api/categories")
+def lookup_categories(request: CategoryLookupRequest):
+    """
+    Current categories for senders of saved scan results (e.g. after the rules changed).
+    Returns: { "version": rules version, "categories": {sender: category} }
+    """
+    categories = {s.sender: sender_categories.classify(s.sender, s.email or "") for s in request.senders}
+    return {"version": sender_categories.version, "categories": categories}
+
+@app.post("/api/categories/reclassify")
+def reclassify_categories():
+    """
+    Brings stored categories up to the current rule set, reclassifying only senders whose
+    category could have changed. Also runs on startup.
+    Returns: { "version", "checked", "changed": [{sender, email, category}], "total" }
+    """
+    return sender_categories.reclassify()
+
 @app.get("/api/history")
 def get_history():
     """Get history logs and stats"""
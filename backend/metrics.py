@@ -0,0 +1,310 @@
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Minimal in-process metrics registry rendered in Prometheus text format (/api/metrics).
+# No external dependency; each metric has its own lock and label sets are stored as tuples,
+# so recording a sample is a dict lookup and an addition.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def mean(self, **labels):
+        """Mean of the observations with these labels (None before the first one)."""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[1] / state[2] if state and state[2] else None
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def add_collector(self, collect):
+        """
+        Registers a callable evaluated at scrape time, for values that already live elsewhere
+        (cache statistics, session counts). It returns a list of
+        (name, type, documentation, [(labels_dict, value), ...]).
+        """
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                logger.warning("Metrics collector failed: %s", e)
+                continue
+            for name, metric_type, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    names = tuple(labels.keys())
+                    lines.append(f"{name}{_format_labels(names, labels.values())} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# name -> callable returning {'hits', 'misses', 'size', ...}; see register_cache()
+_CACHES = {}
+
+
+def register_cache(name, stats):
+    """Exposes a cache's hit/miss counters (read at scrape time) under cache="<name>"."""
+    _CACHES[name] = stats
+
+
+def _collect_caches():
+    hits, misses, ratio, entries = [], [], [], []
+    for name, stats in list(_CACHES.items()):
+        values = stats()
+        labels = {"cache": name}
+        lookups = values["hits"] + values["misses"]
+        hits.append((labels, values["hits"]))
+        misses.append((labels, values["misses"]))
+        ratio.append((labels, round(values["hits"] / lookups, 4) if lookups else 0.0))
+        entries.append((labels, values.get("size", 0)))
+    return [
+        ("cache_hits_total", "counter", "Cache hits by cache", hits),
+        ("cache_misses_total", "counter", "Cache misses by cache", misses),
+        ("cache_hit_ratio", "gauge", "Cache hit ratio by cache", ratio),
+        ("cache_entries", "gauge", "Entries currently held by cache", entries),
+    ]
+
+
+REGISTRY.add_collector(_collect_caches)
+
+# Shared instruments
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route', ('method', 'route', 'status'))
+HTTP_REQUESTS_IN_PROGRESS = REGISTRY.gauge(
+    'http_requests_in_progress', 'HTTP requests currently being handled')
+GMAIL_API_CALLS = REGISTRY.counter(
+    'gmail_api_calls_total', 'Gmail API calls by method and outcome', ('method', 'status'))
+GMAIL_API_SECONDS = REGISTRY.histogram(
+    'gmail_api_call_duration_seconds', 'Gmail API call (or whole batch) latency', ('method',))
+GMAIL_BATCH_SIZE = REGISTRY.histogram(
+    'gmail_batch_size', 'Sub-requests per Gmail batch HTTP request', ('method',), buckets=SIZE_BUCKETS)
+GMAIL_RETRY_ROUNDS = REGISTRY.counter(
+    'gmail_retry_rounds_total', 'Rate-limit retry rounds in batch fetching', ('method',))
+GMAIL_BACKOFF_SECONDS = REGISTRY.counter(
+    'gmail_backoff_seconds_total', 'Seconds slept in rate-limit backoff', ('method',))
+IMAP_COMMANDS = REGISTRY.counter(
+    'imap_commands_total', 'IMAP commands by command and status', ('command', 'status'))
+IMAP_COMMAND_SECONDS = REGISTRY.histogram(
+    'imap_command_duration_seconds', 'IMAP command latency', ('command',))
+HISTORY_WRITE_SECONDS = REGISTRY.histogram(
+    'history_write_duration_seconds', 'Time to update history.json for one action', ('action',))
+UNSUBSCRIBE_REQUESTS = REGISTRY.counter(
+    'unsubscribe_lists_total', 'Unsubscribe attempts per list by outcome', ('outcome',))
+UNSUBSCRIBE_SECONDS = REGISTRY.histogram(
+    'unsubscribe_request_duration_seconds', 'One-click unsubscribe POST latency (incl. host spacing)')
+CREDENTIAL_REFRESHES = REGISTRY.counter(
+    'oauth_refreshes_total', 'OAuth access token refreshes by path (background/request) and outcome',
+    ('path', 'outcome'))
+CREDENTIAL_REFRESH_SECONDS = REGISTRY.histogram(
+    'oauth_refresh_duration_seconds', 'OAuth token endpoint round trip', ('path',))
+SESSION_RESTORES = REGISTRY.counter(
+    'shared_session_restores_total', 'Sessions this worker rebuilt from shared state by provider and outcome',
+    ('provider', 'outcome'))
+
+
+def gmail_status(exception):
+    """Short status label for a Gmail API outcome."""
+    if exception is None:
+        return 'ok'
+    status = getattr(getattr(exception, 'resp', None), 'status', None)
+    if status:
+        return str(status)
+    err_str = str(exception)
+    for code in ('429', '403', '404', '500', '503'):
+        if code in err_str:
+            return code
+    return 'error'
+
+
+# Per-request provider usage: the calls made while a track_usage() block is active in this
+# context (a scan page, a bulk action), next to the process-wide counters above.
+_usage = contextvars.ContextVar('provider_usage', default=None)
+
+
+class ProviderUsage:
+    def __init__(self):
+        self.calls = {}     # method / IMAP command -> count
+        self.started = time.perf_counter()
+        self.seconds = None
+
+    def add(self, method, count=1):
+        self.calls[method] = self.calls.get(method, 0) + count
+
+
+@contextmanager
+def track_usage():
+    usage = ProviderUsage()
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        usage.seconds = time.perf_counter() - usage.started
+        _usage.reset(token)
+
+
+def record_usage(method, count=1):
+    usage = _usage.get()
+    if usage is not None:
+        usage.add(method, count)
+
+
+def count_gmail_call(method, exception=None):
+    """Counts one Gmail API call (a batch sub-request counts on its own) by method and outcome."""
+    GMAIL_API_CALLS.inc(method=method, status=gmail_status(exception))
+    record_usage(method)
+
+
+def execute_gmail(request, method):
+    """Runs request.execute() and records the call, its status and latency."""
+    start = time.perf_counter()
+    try:
+        response = request.execute()
+    except Exception as e:
+        count_gmail_call(method, e)
+        raise
+    finally:
+        GMAIL_API_SECONDS.observe(time.perf_counter() - start, method=method)
+    count_gmail_call(method)
+    return response
@@ -0,0 +1,74 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from keyed_gate import KeyedGate
+from sender_aggregate import merge_ages
+
+# Fan-out of per-account work (scan pages, bulk actions) over several sessions at once.
+# Every account runs on a shared worker pool, so a Gmail account and two IMAP accounts take as
+# long as the slowest of them rather than the sum. Per account at most one job runs at a time
+# (EmailService instances, IMAP connections in particular, aren't thread-safe) and consecutive
+# jobs start FANOUT_ACCOUNT_INTERVAL seconds apart; FANOUT_TIMEOUT bounds the wait for a stuck
+# account, which is then reported as timed out while the others still return.
+
+FANOUT_WORKERS = int(os.environ.get('FANOUT_WORKERS', 16))
+FANOUT_ACCOUNT_INTERVAL = float(os.environ.get('FANOUT_ACCOUNT_INTERVAL', 0))
+FANOUT_TIMEOUT = float(os.environ.get('FANOUT_TIMEOUT', 120))
+
+
+class AccountFanOut:
+    def __init__(self, workers=FANOUT_WORKERS, account_interval=FANOUT_ACCOUNT_INTERVAL, timeout=FANOUT_TIMEOUT):
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fanout')
+        self._gate = KeyedGate(1, account_interval)
+
+    def _call(self, account, job):
+        start = time.perf_counter()
+        with self._gate(account):
+            try:
+                return {"result": job(), "ms": round((time.perf_counter() - start) * 1000, 1)}
+            except Exception as e:
+                detail = getattr(e, 'detail', None) or str(e)
+                return {"error": detail, "ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    def run(self, jobs):
+        """
+        jobs: {key: (account, callable)}. Runs every callable in parallel, serialized per account.
+        Returns {key: {"result": ..., "ms": ...} or {"error": ..., "ms": ...}}.
+        """
+        start = time.perf_counter()
+        futures = {key: self._pool.submit(self._call, account, job) for key, (account, job) in jobs.items()}
+        done, _ = wait(futures.values(), timeout=self.timeout)
+        outcomes = {}
+        for key, future in futures.items():
+            if future in done:
+                outcomes[key] = future.result()
+            else:
+                outcomes[key] = {"error": f"Timed out after {self.timeout:g}s",
+                                 "ms": round((time.perf_counter() - start) * 1000, 1)}
+        return outcomes
+
+
+def merge_sender_stats(pages):
+    """
+    {account key: scan page stats} -> one row per sender across accounts, biggest first.
+    Rows keep the scan shape minus ids; ids are only meaningful per account, so they move to
+    "accounts": [{account, count, ids}].
+    """
+    merged = {}
+    for account, stats in pages.items():
+        for s in stats:
+            row = merged.get(s["sender"])
+            if row is None:
+                row = merged[s["sender"]] = {"sender": s["sender"], "email": s.get("email", ""),
+                                             "domain": s.get("domain", ""), "category": s.get("category"),
+                                             "count": 0, "accounts": []}
+            row["count"] += s["count"]
+            if "threads" in s:
+                row["threads"] = row.get("threads", 0) + s["threads"]
+            if s.get("estimated"):
+                row["estimated"] = True
+            merge_ages(row, s)
+            row["accounts"].append({"account": account, "count": s["count"], "ids": s["ids"]})
+    return sorted(merged.values(), key=lambda r: r["count"], reverse=True)
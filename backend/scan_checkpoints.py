@@ -0,0 +1,168 @@
+import base64
+import json
+import os
+import threading
+import time
+import uuid
+
+from sender_aggregate import merge_ages
+
+# Resumable sender scans.
+# /api/senders hands out opaque cursors instead of the provider's raw page token. A cursor is
+# self-describing (base64url JSON): scan id, provider, query, mode, page number and the provider
+# token ('<UIDVALIDITY>:<last UID>' for IMAP, the messages.list/threads.list pageToken for Gmail).
+# Every page is appended to data/scans/<scan id>.jsonl, so after a backend restart or a browser
+# reload the partial aggregate can be rebuilt (GET /api/scans/{id}) and the scan continues from
+# its last cursor without refetching completed pages.
+
+CHECKPOINT_DIR = "data/scans"
+CHECKPOINT_TTL_SECONDS = 7 * 24 * 3600
+CURSOR_VERSION = 1
+
+
+def encode_cursor(scan_id, provider, provider_token, page, query=None, mode="messages"):
+    payload = {"v": CURSOR_VERSION, "scan": scan_id, "p": provider, "t": provider_token, "n": page,
+               "q": query, "m": mode}
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns the cursor dict; raises ValueError for anything that isn't one of our cursors."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid scan cursor")
+    if not isinstance(payload, dict) or payload.get("v") != CURSOR_VERSION or not payload.get("scan"):
+        raise ValueError("Invalid scan cursor")
+    return payload
+
+
+class ScanCheckpointStore:
+    """Append-only JSON lines per scan: a header line, then one line per page."""
+
+    def __init__(self, directory=CHECKPOINT_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, scan_id):
+        # Scan ids are uuid4 hex; anything else never reaches the filesystem
+        if not scan_id or not all(c in '0123456789abcdef' for c in scan_id):
+            raise ValueError("Invalid scan id")
+        return os.path.join(self.directory, f"{scan_id}.jsonl")
+
+    def _append(self, scan_id, record):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            with open(self._path(scan_id), 'a') as f:
+                f.write(line)
+
+    def start(self, provider, account, query, mode, plan=None):
+        """Creates a checkpoint for a new scan (with its cost plan, if any); returns its id."""
+        os.makedirs(self.directory, exist_ok=True)
+        self.prune()
+        scan_id = uuid.uuid4().hex
+        header = {"scan": scan_id, "provider": provider, "account": account,
+                  "query": query, "mode": mode, "started": time.time()}
+        if plan is not None:
+            header["plan"] = plan
+        self._append(scan_id, header)
+        return scan_id
+
+    def record_page(self, scan_id, page, stats, next_cursor, usage=None):
+        """Appends a finished page. A retried page overwrites the earlier copy when loaded."""
+        record = {"page": page, "stats": stats, "next": next_cursor, "at": time.time()}
+        if usage is not None:
+            record["usage"] = usage
+        self._append(scan_id, record)
+
+    def header(self, scan_id):
+        """The scan's header line (provider, account, query, mode...) or None, without its pages."""
+        try:
+            with open(self._path(scan_id)) as f:
+                return json.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+
+    def load(self, scan_id):
+        """
+        Rebuilds a scan: header fields plus the merged aggregate of its pages, the cursor to
+        continue from and whether it's done. None if there is no such checkpoint.
+        """
+        try:
+            with open(self._path(scan_id)) as f:
+                lines = f.readlines()
+        except (OSError, ValueError):
+            return None
+
+        header, pages = None, {}
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Torn last line from a crash mid-write: that page just gets fetched again
+                continue
+            if "page" in record:
+                pages[record["page"]] = record
+            elif header is None:
+                header = record
+        if header is None:
+            return None
+
+        merged = {}
+        # sender -> distinct thread ids (IMAP X-GM-THRID): a thread spanning pages is one thread.
+        # Rows without ids (Gmail threads mode, whose pages never share a thread) are summed
+        thread_ids = {}
+        messages = 0
+        for page in sorted(pages):
+            for s in pages[page]["stats"]:
+                messages += s["count"]
+                if "threadIds" in s:
+                    thread_ids.setdefault(s["sender"], set()).update(s["threadIds"])
+                entry = merged.get(s["sender"])
+                if entry is None:
+                    merged[s["sender"]] = {**s, "ids": list(s["ids"])}
+                    continue
+                entry["count"] += s["count"]
+                entry["ids"].extend(s["ids"])
+                if "threads" in s:
+                    entry["threads"] = entry.get("threads", 0) + s["threads"]
+                if s.get("estimated"):
+                    entry["estimated"] = True
+                    entry["sampleIds"] = entry.get("sampleIds", []) + s.get("sampleIds", [])
+                merge_ages(entry, s)
+
+        for sender, ids in thread_ids.items():
+            entry = merged[sender]
+            entry.pop("threadIds", None)
+            entry["threads"] = len(ids)
+
+        from scan_planner import merge_usage
+        last = pages[max(pages)] if pages else None
+        stats = sorted(merged.values(), key=lambda s: s["count"], reverse=True)
+        return {
+            **header,
+            "pages": len(pages),
+            "messages": messages,
+            "nextPageToken": last["next"] if last else None,
+            "done": bool(last) and last["next"] is None,
+            "stats": stats,
+            # Provider calls the completed pages actually cost (compare with "plan")
+            "usage": merge_usage([p.get("usage") for p in pages.values()]),
+        }
+
+    def prune(self, max_age=CHECKPOINT_TTL_SECONDS):
+        """Deletes checkpoints not written to for max_age seconds."""
+        cutoff = time.time() - max_age
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith('.jsonl') and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
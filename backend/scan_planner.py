@@ -0,0 +1,192 @@
+import math
+import os
+
+from metrics import GMAIL_API_SECONDS, IMAP_COMMAND_SECONDS, UNSUBSCRIBE_SECONDS
+
+# Cost and time estimates for scans and bulk actions, before running them.
+# Gmail charges quota units per method (per user, per second); a scan is one list call per page
+# plus one messages.get (or threads.get) per message (or thread). From the unread counts and the
+# local cache state the planner prices each way of running a scan:
+#   threads  threads.list + threads.get: 10 units per thread instead of 5 per message
+#   cached   messages whose sender is already in the search index cost no messages.get
+#   full     a messages.get per message (what "cached" is when nothing is known yet)
+#   sampled  messages.get for one in SCAN_SAMPLE_EVERY messages, counts extrapolated (estimate)
+# and recommends the cheapest in quota units (IMAP: in time) among the exact ones, unless
+# estimates are acceptable. Times come from the latencies measured so far (metrics.py), with
+# defaults until there are any, and never beat the quota rate. Actual usage of a scan page or an
+# action is measured with metrics.track_usage and reported in the same shape.
+
+# developers.google.com/gmail/api/reference/quota
+QUOTA_UNITS = {
+    'messages.list': 5, 'messages.get': 5, 'threads.list': 10, 'threads.get': 10, 'labels.get': 1,
+    'history.list': 2, 'messages.batchModify': 50, 'messages.batchDelete': 50, 'users.getProfile': 1,
+}
+GMAIL_QUOTA_PER_SECOND = float(os.environ.get('GMAIL_QUOTA_PER_SECOND', 250))
+SCAN_SAMPLE_EVERY = int(os.environ.get('SCAN_SAMPLE_EVERY', 10))
+
+GMAIL_BATCH = 50            # sub-requests per batch HTTP request (_batch_get_with_retry)
+GMAIL_MODIFY_IDS = 1000     # ids per batchModify
+IMAP_FETCH_UIDS = 100       # UIDs per FETCH
+
+# Seconds per round trip until something has been measured
+DEFAULT_SECONDS = {
+    'messages.list': 0.25, 'threads.list': 0.3, 'batch': 0.6, 'messages.batchModify': 0.4,
+    'UID SEARCH': 0.5, 'UID FETCH': 0.3, 'UID COPY': 0.3, 'UID STORE': 0.3, 'unsubscribe': 1.0,
+}
+
+
+def _latency(provider, method):
+    if method == 'unsubscribe':
+        measured = UNSUBSCRIBE_SECONDS.mean()
+    elif provider == 'imap':
+        measured = IMAP_COMMAND_SECONDS.mean(command=method)
+    else:
+        measured = GMAIL_API_SECONDS.mean(method=method)
+    return measured if measured is not None else DEFAULT_SECONDS[method]
+
+
+def quota_units(calls):
+    return sum(QUOTA_UNITS.get(method, 0) * count for method, count in calls.items())
+
+
+def _estimate(provider, strategy, calls, round_trips, exact, **extra):
+    """One priced option: round_trips is [(latency method, count)] run one after another."""
+    calls = {method: count for method, count in calls.items() if count}
+    seconds = sum(_latency(provider, method) * count for method, count in round_trips)
+    estimate = {"strategy": strategy, "exact": exact, "calls": calls,
+                "apiCalls": sum(count for method, count in calls.items() if method != 'batch')}
+    if provider == 'gmail':
+        units = quota_units(calls)
+        # The per-user quota caps how fast those units can be spent, however fast the API answers
+        seconds = max(seconds, units / GMAIL_QUOTA_PER_SECOND)
+        estimate["quotaUnits"] = units
+    else:
+        estimate["quotaUnits"] = None
+    estimate["seconds"] = round(seconds, 2)
+    estimate.update(extra)
+    return estimate
+
+
+def _gmail_scan_strategies(messages, threads, known, page_size):
+    pages = math.ceil(messages / page_size) if messages else 0
+    unknown = max(0, messages - known)
+    sampled = math.ceil(unknown / SCAN_SAMPLE_EVERY)
+
+    def message_scan(strategy, gets, exact, **extra):
+        batches = math.ceil(gets / GMAIL_BATCH)
+        return _estimate('gmail', strategy, {'messages.list': pages, 'messages.get': gets, 'batch': batches},
+                         [('messages.list', pages), ('batch', batches)], exact, **extra)
+
+    strategies = []
+    if known:
+        strategies.append(message_scan("cached", unknown, True, mode="messages", knownIds=known))
+    strategies.append(message_scan("full", messages, True, mode="messages"))
+    if threads:
+        thread_pages = math.ceil(threads / page_size)
+        batches = math.ceil(threads / GMAIL_BATCH)
+        strategies.append(_estimate('gmail', "threads", {'threads.list': thread_pages, 'threads.get': threads,
+                                                         'batch': batches},
+                                    [('threads.list', thread_pages), ('batch', batches)], True, mode="threads"))
+    if messages > SCAN_SAMPLE_EVERY:
+        strategies.append(message_scan("sampled", sampled, False, mode="sampled", sampleEvery=SCAN_SAMPLE_EVERY))
+    return strategies
+
+
+def _imap_scan_strategies(messages):
+    fetches = math.ceil(messages / IMAP_FETCH_UIDS)
+    return [_estimate('imap', "full", {'UID SEARCH': 1, 'UID FETCH': fetches},
+                      [('UID SEARCH', 1), ('UID FETCH', fetches)], True, mode="messages")]
+
+
+def plan_scan(provider, counts, known=0, page_size=500, allow_estimates=False):
+    """
+    counts: {"messages", "threads" (None if unknown), "exact"} (EmailService.count_matches);
+    known: messages of the account already in the search index.
+    Returns {"kind", "provider", "inputs", "strategies": [...], "recommended", "mode"}.
+    """
+    messages = counts.get("messages") or 0
+    threads = counts.get("threads") or 0
+    page_size = max(1, min(page_size, 500))
+    # Indexed messages needn't all match this query: an upper bound on what the scan can reuse
+    known = min(known, messages)
+    if provider == 'gmail':
+        strategies = _gmail_scan_strategies(messages, threads, known, page_size)
+        cost = lambda s: (s["quotaUnits"], s["seconds"])
+    else:
+        strategies = _imap_scan_strategies(messages)
+        cost = lambda s: (s["seconds"],)
+
+    eligible = [s for s in strategies if s["exact"] or allow_estimates]
+    best = min(eligible, key=cost)
+    return {
+        "kind": "scan",
+        "provider": provider,
+        "inputs": {"messages": messages, "threads": threads or None, "countsExact": counts.get("exact", True),
+                   "knownIds": known, "pageSize": page_size,
+                   "quotaPerSecond": GMAIL_QUOTA_PER_SECOND if provider == 'gmail' else None},
+        "strategies": strategies,
+        "recommended": best["strategy"],
+        "mode": best["mode"],
+    }
+
+
+def plan_action(provider, action, message_count, lists=None):
+    """
+    Cost of a bulk action over message_count messages. lists: how many mailing lists an
+    unsubscribe will contact (defaults to one per message, the worst case).
+    """
+    n = message_count
+    if action in ("delete", "spam"):
+        if provider == 'gmail':
+            calls = math.ceil(n / GMAIL_MODIFY_IDS)
+            estimate = _estimate('gmail', action, {'messages.batchModify': calls},
+                                 [('messages.batchModify', calls)], True)
+        else:
+            # One UID COPY and one UID STORE over all the ids
+            estimate = _estimate('imap', action, {'UID COPY': 1, 'UID STORE': 1} if n else {},
+                                 [('UID COPY', 1), ('UID STORE', 1)] if n else [], True)
+    elif action == "unsubscribe":
+        from unsubscribe_executor import UNSUBSCRIBE_WORKERS
+        lists = n if lists is None else min(lists, n)
+        posts = [('unsubscribe', math.ceil(lists / max(1, UNSUBSCRIBE_WORKERS)))]
+        if provider == 'gmail':
+            batches = math.ceil(n / GMAIL_BATCH)
+            estimate = _estimate('gmail', action, {'messages.get': n, 'batch': batches},
+                                 [('batch', batches)] + posts, True, unsubscribeRequests=lists)
+        else:
+            fetches = math.ceil(n / IMAP_FETCH_UIDS)
+            estimate = _estimate('imap', action, {'UID FETCH': fetches}, [('UID FETCH', fetches)] + posts, True,
+                                 unsubscribeRequests=lists)
+    else:
+        raise ValueError(f"Unknown action: {action}")
+    return {"kind": "action", "provider": provider, "inputs": {"messages": n}, "strategies": [estimate],
+            "recommended": action}
+
+
+def usage_report(usage, provider):
+    """metrics.ProviderUsage -> {"calls", "apiCalls", "quotaUnits", "seconds"}, the plan's shape."""
+    calls = dict(usage.calls)
+    return {
+        "calls": calls,
+        "apiCalls": sum(count for method, count in calls.items() if method != 'batch'),
+        "quotaUnits": quota_units(calls) if provider == 'gmail' else None,
+        "seconds": round(usage.seconds or 0.0, 3),
+    }
+
+
+def merge_usage(reports):
+    """Sum of several usage reports (e.g. every page of a scan); None if there are none."""
+    reports = [r for r in reports if r]
+    if not reports:
+        return None
+    calls = {}
+    for report in reports:
+        for method, count in report["calls"].items():
+            calls[method] = calls.get(method, 0) + count
+    units = [r["quotaUnits"] for r in reports if r.get("quotaUnits") is not None]
+    return {
+        "calls": calls,
+        "apiCalls": sum(r["apiCalls"] for r in reports),
+        "quotaUnits": sum(units) if units else None,
+        "seconds": round(sum(r["seconds"] for r in reports), 3),
+    }
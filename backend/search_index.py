@@ -0,0 +1,285 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from sender_normalizer import normalize_sender
+
+# Local full-text index over what we've already fetched (senders, subjects, snippets).
+# Filled as a side effect of message details, unread listings and scans, so searching a cached
+# mailbox needs no provider round trip. SQLite FTS5 under data/, one row per (account, id):
+#   docs      plain table, the source of truth (external content for the FTS table)
+#   docs_fts  FTS5 index over sender/email/subject/snippet, kept in sync by triggers
+# Rows go away when the details cache is invalidated by an action; an LRU eviction from that cache
+# only forgets the row's subject and snippet (sender and received time stay for scans and
+# date-range actions). Anything not refreshed for INDEX_TTL_SECONDS is pruned.
+# Scans also store each message's received time (internalDate / INTERNALDATE), so date-range
+# actions ("older than 90 days from these senders") resolve to ids here, without the provider.
+
+INDEX_PATH = "data/search.db"
+INDEX_TTL_SECONDS = 7 * 24 * 3600
+MAX_RESULTS = 10000
+
+_TERM_RE = re.compile(r'\w[\w.@+-]*', re.UNICODE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    rowid INTEGER PRIMARY KEY,
+    account TEXT NOT NULL,
+    id TEXT NOT NULL,
+    sender TEXT NOT NULL DEFAULT '',
+    email TEXT NOT NULL DEFAULT '',
+    domain TEXT NOT NULL DEFAULT '',
+    subject TEXT NOT NULL DEFAULT '',
+    snippet TEXT NOT NULL DEFAULT '',
+    date TEXT NOT NULL DEFAULT '',
+    indexed_at REAL NOT NULL,
+    received INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (account, id)
+);
+CREATE INDEX IF NOT EXISTS docs_indexed_at ON docs (indexed_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+    sender, email, subject, snippet,
+    content='docs', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS docs_ai AFTER INSERT ON docs BEGIN
+    INSERT INTO docs_fts (rowid, sender, email, subject, snippet)
+    VALUES (new.rowid, new.sender, new.email, new.subject, new.snippet);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_ad AFTER DELETE ON docs BEGIN
+    INSERT INTO docs_fts (docs_fts, rowid, sender, email, subject, snippet)
+    VALUES ('delete', old.rowid, old.sender, old.email, old.subject, old.snippet);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_au AFTER UPDATE ON docs BEGIN
+    INSERT INTO docs_fts (docs_fts, rowid, sender, email, subject, snippet)
+    VALUES ('delete', old.rowid, old.sender, old.email, old.subject, old.snippet);
+    INSERT INTO docs_fts (rowid, sender, email, subject, snippet)
+    VALUES (new.rowid, new.sender, new.email, new.subject, new.snippet);
+END;
+"""
+
+# Details replace what a scan stored (sender only); an identical row is left alone so the FTS
+# index isn't rewritten on every refetch
+_UPSERT_DETAIL = """
+INSERT INTO docs (account, id, sender, email, domain, subject, snippet, date, indexed_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (account, id) DO UPDATE SET
+    sender = excluded.sender, email = excluded.email, domain = excluded.domain,
+    subject = excluded.subject,
+    snippet = CASE WHEN excluded.snippet = '' THEN docs.snippet ELSE excluded.snippet END,
+    date = CASE WHEN excluded.date = '' THEN docs.date ELSE excluded.date END,
+    indexed_at = excluded.indexed_at
+WHERE docs.sender != excluded.sender OR docs.subject != excluded.subject
+    OR (excluded.snippet != '' AND docs.snippet != excluded.snippet)
+    OR (excluded.date != '' AND docs.date != excluded.date)
+    OR docs.indexed_at < excluded.indexed_at - 3600
+"""
+
+# A scan only knows the sender and received time; never overwrite a row that has its subject already
+_INSERT_SENDER = """
+INSERT INTO docs (account, id, sender, email, domain, indexed_at, received) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (account, id) DO UPDATE SET
+    indexed_at = excluded.indexed_at,
+    received = CASE WHEN excluded.received > 0 THEN excluded.received ELSE docs.received END
+WHERE docs.indexed_at < excluded.indexed_at - 3600 OR (docs.received = 0 AND excluded.received > 0)
+"""
+
+# Indexes created before received times were stored
+_MIGRATIONS = (
+    ('received', "ALTER TABLE docs ADD COLUMN received INTEGER NOT NULL DEFAULT 0"),
+)
+
+
+def fts_query(text):
+    """
+    Turns free text into a safe FTS5 query: every term must match, the last one as a prefix
+    (search-as-you-type). Terms are quoted, so FTS syntax in the input is matched literally.
+    """
+    terms = _TERM_RE.findall(text or '')
+    if not terms:
+        return None
+    quoted = ['"' + term.replace('"', '""') + '"' for term in terms]
+    quoted[-1] += '*'
+    return ' AND '.join(quoted)
+
+
+class SearchIndex:
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        # Opened lazily so importing main doesn't create data/ (same as the history file)
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(docs)")}
+            with conn:
+                for column, sql in _MIGRATIONS:
+                    if column not in columns:
+                        conn.execute(sql)
+                conn.execute("CREATE INDEX IF NOT EXISTS docs_sender_received ON docs (account, email, received)")
+            self._conn = conn
+            self._prune(conn)
+        return self._conn
+
+    def _write(self, sql, rows):
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(sql, rows)
+
+    def add_details(self, account, details, snippets=True):
+        """
+        Indexes message details (get_messages_details / list_unread_messages shape) and returns
+        them unchanged, so it can wrap a fetch. Error entries are skipped. snippets=False for
+        providers whose snippet is a placeholder (IMAP).
+        """
+        now = time.time()
+        rows = []
+        for d in details:
+            if "error" in d or not d.get("id"):
+                continue
+            name, email, domain = normalize_sender(d.get("sender") or "")
+            rows.append((account, str(d["id"]), name, email, domain, d.get("subject") or "",
+                         (d.get("snippet") or "") if snippets else "", d.get("date") or "", now))
+        self._write(_UPSERT_DETAIL, rows)
+        return details
+
+    def add_senders(self, account, stats):
+        """Indexes the message ids of a scan page under their sender (and "dates", if the row has them)."""
+        now = time.time()
+        rows = []
+        for s in stats:
+            dates = s.get("dates") or ()
+            for i, msg_id in enumerate(s["ids"]):
+                received = dates[i] if i < len(dates) else 0
+                rows.append((account, str(msg_id), s["sender"], s.get("email", ""), s.get("domain", ""), now,
+                             received))
+        self._write(_INSERT_SENDER, rows)
+
+    def remove(self, account, message_ids=None):
+        """Drops the given ids (every row of the account if None)."""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                if message_ids is None:
+                    conn.execute("DELETE FROM docs WHERE account = ?", (account,))
+                else:
+                    conn.executemany("DELETE FROM docs WHERE account = ? AND id = ?",
+                                     [(account, str(msg_id)) for msg_id in message_ids])
+
+    def forget_details(self, account, message_ids=None):
+        """Clears subject and snippet of the given ids (of every row of the account if None)."""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                if message_ids is None:
+                    conn.execute("UPDATE docs SET subject = '', snippet = '' WHERE account = ?"
+                                 " AND (subject != '' OR snippet != '')", (account,))
+                else:
+                    conn.executemany("UPDATE docs SET subject = '', snippet = '' WHERE account = ? AND id = ?"
+                                     " AND (subject != '' OR snippet != '')",
+                                     [(account, str(msg_id)) for msg_id in message_ids])
+
+    def known_senders(self, account, message_ids):
+        """
+        {id: (sender, email, domain, received)} for ids indexed with their sender and received
+        time; scans skip fetching those. Rows without a received time are fetched once more.
+        """
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            for i in range(0, len(message_ids), 500):
+                chunk = [str(msg_id) for msg_id in message_ids[i:i + 500]]
+                rows = conn.execute(
+                    f"SELECT id, sender, email, domain, received FROM docs WHERE account = ? AND sender != ''"
+                    f" AND received > 0 AND id IN ({','.join('?' * len(chunk))})", (account, *chunk))
+                found.update((row[0], row[1:]) for row in rows)
+        return found
+
+    def find_by_age(self, account, senders, before=None, after=None, ids=None):
+        """
+        Indexed messages of these senders (names or addresses, as in scan rows) received before
+        / after the given epoch seconds, oldest first, as [(id, sender)]. ids restricts the
+        result to those messages. Messages without a received time never match a range.
+        """
+        names = [s for s in dict.fromkeys(senders or []) if s]
+        if not names:
+            return []
+        conditions, bounds = "", []
+        if before is not None:
+            conditions += " AND received < ?"
+            bounds.append(int(before))
+        if after is not None:
+            conditions += " AND received >= ?"
+            bounds.append(int(after))
+        matches = {}
+        with self._lock:
+            conn = self._connect()
+            for i in range(0, len(names), 250):
+                chunk = names[i:i + 250]
+                marks = ','.join('?' * len(chunk))
+                rows = conn.execute(
+                    f"SELECT id, sender, received FROM docs WHERE account = ? AND received > 0{conditions}"
+                    f" AND (email IN ({marks}) OR sender IN ({marks}))",
+                    (account, *bounds, *[n.casefold() for n in chunk], *chunk))
+                matches.update((msg_id, (received, sender)) for msg_id, sender, received in rows)
+        if ids is not None:
+            wanted = {str(msg_id) for msg_id in ids}
+            matches = {msg_id: m for msg_id, m in matches.items() if msg_id in wanted}
+        return [(msg_id, sender) for msg_id, (received, sender) in sorted(matches.items(), key=lambda m: m[1][0])]
+
+    def count(self, account):
+        """Messages indexed for the account."""
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM docs WHERE account = ?", (account,)).fetchone()[0]
+
+    def search(self, account, text, limit=1000):
+        """
+        Matching ids (best match first) and the same matches grouped by sender, in the shape of
+        a scan page's stats. Returns None if text has no searchable terms.
+        """
+        query = fts_query(text)
+        if query is None:
+            return None
+        limit = max(1, min(limit, MAX_RESULTS))
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT d.id, d.sender, d.email, d.domain FROM docs_fts"
+                " JOIN docs d ON d.rowid = docs_fts.rowid"
+                " WHERE docs_fts MATCH ? AND d.account = ?"
+                " ORDER BY bm25(docs_fts, 4.0, 4.0, 2.0, 1.0) LIMIT ?",
+                (query, account, limit)).fetchall()
+
+        from category_cache import sender_categories
+        ids, groups = [], {}
+        for msg_id, sender, email, domain in rows:
+            ids.append(msg_id)
+            group = groups.get(sender)
+            if group is None:
+                group = groups[sender] = {"sender": sender, "email": email, "domain": domain, "count": 0,
+                                          "ids": [], "category": sender_categories.classify(sender, email)}
+            group["count"] += 1
+            group["ids"].append(msg_id)
+        senders = sorted(groups.values(), key=lambda g: g["count"], reverse=True)
+        return {"ids": ids, "senders": senders, "total": len(ids), "truncated": len(ids) == limit}
+
+    def _prune(self, conn, max_age=INDEX_TTL_SECONDS):
+        with conn:
+            conn.execute("DELETE FROM docs WHERE indexed_at < ?", (time.time() - max_age,))
+
+    def prune(self, max_age=INDEX_TTL_SECONDS):
+        """Drops rows not refreshed for max_age seconds."""
+        with self._lock:
+            self._prune(self._connect(), max_age)
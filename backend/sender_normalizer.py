@@ -0,0 +1,60 @@
+from collections import namedtuple
+from functools import lru_cache
+from email.utils import parseaddr
+
+from header_parser import decode_mime_words
+from metrics import register_cache
+
+# Shared sender normalization for every provider.
+# A mailbox with 100k unread messages typically has only a few hundred distinct From headers,
+# so results are memoized on the raw header string.
+
+CACHE_SIZE = 16384
+
+NormalizedSender = namedtuple('NormalizedSender', ['display_name', 'address', 'domain'])
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_sender(raw):
+    """
+    Returns a canonical NormalizedSender(display_name, address, domain) for a raw From header.
+    - RFC 2047 encoded words in the display name are decoded (all fragments)
+    - Surrounding quotes are removed
+    - The address and domain are case-folded so 'News@Shop.com' and 'news@shop.com' match
+    - If there is no display name, the address is used for display
+    """
+    if not raw:
+        return NormalizedSender("(Unknown)", "", "")
+
+    # Split before decoding, so commas/brackets inside an encoded name can't confuse parseaddr
+    name, address = parseaddr(raw)
+    if not name and not address:
+        decoded = decode_mime_words(raw).strip()
+        return NormalizedSender(decoded or raw, "", "")
+
+    name = decode_mime_words(name).strip().strip('"').strip()
+    address = address.strip()
+    if '@' not in address:
+        # parseaddr returns a bare word (e.g. 'Unknown') as the address
+        return NormalizedSender(name or address or raw, "", "")
+
+    address = address.casefold()
+
+    domain = address.rsplit('@', 1)[1]
+    return NormalizedSender(name or address, address, domain)
+
+
+def cache_stats():
+    """Hit/miss counters for the normalizer cache."""
+    info = normalize_sender.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+        "hit_rate": round(info.hits / lookups, 4) if lookups else 0.0,
+    }
+
+
+register_cache('sender_normalizer', cache_stats)
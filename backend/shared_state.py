@@ -0,0 +1,323 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:     # only needed with SHARED_STATE_KEY
+    Fernet = InvalidToken = None
+
+from metrics import SESSION_RESTORES
+
+# State shared by several uvicorn worker processes (uvicorn main:app --workers N).
+# Without it every worker has its own `sessions` dict, so a token issued by one worker is unknown
+# to the others and the app needs a single worker (or sticky routing). With SHARED_STATE=1:
+#   sessions  token -> provider, account and what's needed to reconnect (Gmail OAuth credentials,
+#             IMAP address + password); each worker rebuilds the live service the first time it
+#             sees a token (see SessionStore)
+#   details   second level behind DetailsCache: message details any worker fetched, with expiry
+#   blobs     small shared values with expiry, e.g. IMAP SEARCH results so the next scan page can
+#             land on any worker without repeating the SEARCH
+# Scan checkpoints (data/scans), the search index and the category table are already on disk.
+# Still per worker: live provider connections, unread watchers, traces and metrics.
+# One SQLite file in WAL mode (readers don't block the writer); it holds credentials, so it's
+# created owner-only like token.json should be. WEB_CONCURRENCY > 1 (uvicorn's env for
+# --workers) turns it on as well.
+# The reconnect state is a Gmail refresh token or an IMAP password: anyone who can read the file
+# (a backup, a copied data/ directory, another user if the mode is changed) can use those accounts.
+# With SHARED_STATE_KEY (any long random string, the same for every worker) the state column is
+# encrypted with Fernet (the `cryptography` package); keep the key out of data/. Without it the
+# app refuses to start, unless SHARED_STATE_ALLOW_PLAINTEXT=1 explicitly accepts plain JSON
+# credentials on disk. Rows written before the key was set are still read and are encrypted the
+# next time they are written; rows encrypted with another key count as unknown sessions (the user
+# logs in again).
+
+SHARED_STATE = os.environ.get(
+    'SHARED_STATE', '1' if int(os.environ.get('WEB_CONCURRENCY', 1)) > 1 else '0') == '1'
+STATE_DB = "data/state.db"
+SESSION_TTL_SECONDS = 30 * 24 * 3600
+SESSION_TOUCH_SECONDS = 60
+SHARED_DETAILS_TTL_SECONDS = 10 * 60
+SHARED_STATE_KEY = os.environ.get('SHARED_STATE_KEY', '')
+SHARED_STATE_ALLOW_PLAINTEXT = os.environ.get('SHARED_STATE_ALLOW_PLAINTEXT', '0') == '1'
+RESTORE_RETRY_SECONDS = 30
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    token TEXT PRIMARY KEY,
+    provider TEXT NOT NULL,
+    account TEXT,
+    state TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS details (
+    account TEXT NOT NULL,
+    id TEXT NOT NULL,
+    detail TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (account, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS blobs (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+# SQLite caps the number of bound parameters per statement
+_CHUNK = 500
+
+
+def _fernet(secret):
+    if not secret:
+        return None
+    if Fernet is None:
+        raise RuntimeError("SHARED_STATE_KEY needs the cryptography package (pip install cryptography)")
+    return Fernet(base64.urlsafe_b64encode(hashlib.sha256(secret.encode()).digest()))
+
+
+class SharedState:
+    def __init__(self, path=STATE_DB, key=SHARED_STATE_KEY, allow_plaintext=SHARED_STATE_ALLOW_PLAINTEXT):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._fernet = _fernet(key)
+        if self._fernet is None:
+            if not allow_plaintext:
+                raise RuntimeError("Shared state stores session credentials: set SHARED_STATE_KEY to encrypt them "
+                                   "(or SHARED_STATE_ALLOW_PLAINTEXT=1 to store them unencrypted)")
+            logger.warning("SHARED_STATE_KEY is not set: session credentials in %s are stored unencrypted", path)
+
+    def _db(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if not os.path.exists(self.path):
+                os.close(os.open(self.path, os.O_CREAT | os.O_WRONLY, 0o600))
+            # Workers start together and all run the schema; wait for each other's locks
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    # Sessions
+
+    def _seal(self, state):
+        text = json.dumps(state)
+        return self._fernet.encrypt(text.encode()).decode() if self._fernet is not None else text
+
+    def _open(self, sealed):
+        if sealed.startswith('{'):
+            return json.loads(sealed)
+        if self._fernet is None:
+            raise ValueError("session state is encrypted and SHARED_STATE_KEY is not set")
+        try:
+            return json.loads(self._fernet.decrypt(sealed.encode()))
+        except InvalidToken:
+            raise ValueError("session state was encrypted with a different SHARED_STATE_KEY") from None
+
+    def save_session(self, token, provider, account, state):
+        now = time.time()
+        with self._lock, self._db() as conn:
+            conn.execute("INSERT OR REPLACE INTO sessions (token, provider, account, state, created_at, last_seen) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", (token, provider, account, self._seal(state), now, now))
+
+    def load_session(self, token):
+        """{"token", "provider", "account", "state", "last_seen"} or None."""
+        with self._lock:
+            row = self._db().execute("SELECT provider, account, state, last_seen FROM sessions WHERE token = ?",
+                                     (token,)).fetchone()
+        if row is None:
+            return None
+        try:
+            state = self._open(row[2])
+        except ValueError as e:
+            logger.warning("Ignoring %s session %s...: %s", row[0], token[:8], e)
+            return None
+        return {"token": token, "provider": row[0], "account": row[1], "state": state, "last_seen": row[3]}
+
+    def update_session_state(self, token, state):
+        """New reconnect state for an existing session, e.g. a refreshed OAuth token."""
+        with self._lock, self._db() as conn:
+            conn.execute("UPDATE sessions SET state = ? WHERE token = ?", (self._seal(state), token))
+
+    def touch_session(self, token):
+        with self._lock, self._db() as conn:
+            conn.execute("UPDATE sessions SET last_seen = ? WHERE token = ?", (time.time(), token))
+
+    def delete_session(self, token):
+        with self._lock, self._db() as conn:
+            conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+
+    def count_sessions(self):
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    # Message details
+
+    def get_details(self, account, message_ids):
+        """{id: detail} for the ids stored and not expired."""
+        found, now = {}, time.time()
+        with self._lock:
+            conn = self._db()
+            for i in range(0, len(message_ids), _CHUNK):
+                chunk = message_ids[i:i + _CHUNK]
+                rows = conn.execute(
+                    f"SELECT id, detail FROM details WHERE account = ? AND expires > ? "
+                    f"AND id IN ({','.join('?' * len(chunk))})", (account, now, *chunk))
+                found.update((msg_id, json.loads(detail)) for msg_id, detail in rows)
+        return found
+
+    def put_details(self, account, details, ttl=SHARED_DETAILS_TTL_SECONDS):
+        expires = time.time() + ttl
+        rows = [(account, d["id"], json.dumps(d), expires) for d in details if "error" not in d]
+        if not rows:
+            return
+        with self._lock, self._db() as conn:
+            conn.executemany("INSERT OR REPLACE INTO details (account, id, detail, expires) VALUES (?, ?, ?, ?)", rows)
+
+    def drop_details(self, account, message_ids=None):
+        with self._lock, self._db() as conn:
+            if message_ids is None:
+                conn.execute("DELETE FROM details WHERE account = ?", (account,))
+                return
+            for i in range(0, len(message_ids), _CHUNK):
+                chunk = message_ids[i:i + _CHUNK]
+                conn.execute(f"DELETE FROM details WHERE account = ? AND id IN ({','.join('?' * len(chunk))})",
+                             (account, *chunk))
+
+    # Blobs
+
+    def get_blob(self, key):
+        with self._lock:
+            row = self._db().execute("SELECT value FROM blobs WHERE key = ? AND expires > ?",
+                                     (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def put_blob(self, key, value, ttl):
+        with self._lock, self._db() as conn:
+            conn.execute("INSERT OR REPLACE INTO blobs (key, value, expires) VALUES (?, ?, ?)",
+                         (key, value, time.time() + ttl))
+
+    def prune(self):
+        """Drops idle sessions and expired details/blobs; returns the number of rows removed."""
+        now = time.time()
+        with self._lock, self._db() as conn:
+            removed = conn.execute("DELETE FROM sessions WHERE last_seen < ?", (now - SESSION_TTL_SECONDS,)).rowcount
+            removed += conn.execute("DELETE FROM details WHERE expires <= ?", (now,)).rowcount
+            removed += conn.execute("DELETE FROM blobs WHERE expires <= ?", (now,)).rowcount
+        return removed
+
+
+class SessionStore:
+    """
+    token -> EmailService, used like the dict it replaces. Without a SharedState it is that dict.
+    With one, new sessions are written through with describe(service) -> (provider, account, state)
+    and a token another worker created is rebuilt here with restore(row) on first use; a token
+    whose restore failed is treated as unknown for RESTORE_RETRY_SECONDS.
+    on_open(token, service) is called for every service this worker adds or restores, and
+    on_close(token) when a session is removed.
+    """
+
+    def __init__(self, shared=None, describe=None, restore=None, on_open=None, on_close=None):
+        self.shared = shared
+        self.describe = describe
+        self.restore = restore
+        self.on_open = on_open
+        self.on_close = on_close
+        self._local = {}
+        self._touched = {}
+        self._failed = {}       # token -> monotonic time of the last failed restore
+        self._lock = threading.Lock()
+
+    def get(self, token, default=None):
+        service = self._local.get(token)
+        if service is not None:
+            self._touch(token)
+            return service
+        if self.shared is None or not token:
+            return default
+        failed = self._failed.get(token)
+        if failed is not None and time.monotonic() - failed < RESTORE_RETRY_SECONDS:
+            return default
+
+        row = self.shared.load_session(token)
+        if row is None:
+            return default
+        # One reconnect per token even if several requests arrive at once
+        with self._lock:
+            service = self._local.get(token)
+            if service is None:
+                try:
+                    service = self.restore(row)
+                except Exception as e:
+                    SESSION_RESTORES.inc(provider=row['provider'], outcome='error')
+                    logger.warning("Could not restore %s session %s...: %s", row['provider'], token[:8], e)
+                    self._failed[token] = time.monotonic()
+                    return default
+                self._failed.pop(token, None)
+                SESSION_RESTORES.inc(provider=row['provider'], outcome='ok')
+                logger.debug("Restored %s session %s... in worker %d", row['provider'], token[:8], os.getpid())
+                self._local[token] = service
+                self._touched[token] = time.monotonic()
+                if self.on_open is not None:
+                    self.on_open(token, service)
+        return service
+
+    def _touch(self, token):
+        if self.shared is None:
+            return
+        now = time.monotonic()
+        if now - self._touched.get(token, 0) > SESSION_TOUCH_SECONDS:
+            self._touched[token] = now
+            self.shared.touch_session(token)
+
+    def __contains__(self, token):
+        # Only a session this worker has or can restore counts: callers key caches and watchers by
+        # the token, and get_service falls back to the default account for anything else. The
+        # restore is kept, so the get() that usually follows is a dict hit
+        return self.get(token) is not None
+
+    def __getitem__(self, token):
+        service = self.get(token)
+        if service is None:
+            raise KeyError(token)
+        return service
+
+    def __setitem__(self, token, service):
+        if self.shared is not None:
+            provider, account, state = self.describe(service)
+            self.shared.save_session(token, provider, account, state)
+            self._touched[token] = time.monotonic()
+        self._failed.pop(token, None)
+        self._local[token] = service
+        if self.on_open is not None:
+            self.on_open(token, service)
+
+    def __delitem__(self, token):
+        self._local.pop(token, None)
+        self._touched.pop(token, None)
+        self._failed.pop(token, None)
+        if self.shared is not None:
+            self.shared.delete_session(token)
+        if self.on_close is not None:
+            self.on_close(token)
+
+    def __len__(self):
+        # Sessions live in this worker; shared.count_sessions() has every worker's
+        return len(self._local)
+
+
+# Process-wide store (None unless SHARED_STATE is on)
+shared_state = SharedState() if SHARED_STATE else None
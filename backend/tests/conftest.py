@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The backend is a flat set of modules run from backend/ (uvicorn main:app); import them the same way.
+# bench/ holds the fake providers and the synthetic mailbox the integration tests run against.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'bench'))
+sys.path.insert(0, BACKEND_DIR)
@@ -0,0 +1,77 @@
+from header_parser import decode_mime_words, parse_fetch_response, parse_header_block, parse_label_list
+
+
+def test_folded_lines_and_first_occurrence():
+    block = b'From: "Shop"\r\n <news@shop.example>\r\nSubject: one\r\nSubject: two\r\nX-Other: x\r\n\r\n'
+    assert parse_header_block(block) == {'from': '"Shop" <news@shop.example>', 'subject': 'one', 'x-other': 'x'}
+    assert parse_header_block(block, wanted={'subject'}) == {'subject': 'one'}
+
+
+def test_eight_bit_latin1_header_kept():
+    block = b'From: Ren\xe9 Dupont <rene@example.fr>\r\nSubject: caf\xc3\xa9\r\n\r\n'
+    assert parse_header_block(block) == {'from': 'René Dupont <rene@example.fr>', 'subject': 'café'}
+
+
+def test_decode_mime_words_every_fragment():
+    assert decode_mime_words('=?utf-8?q?Caf=C3=A9?= =?utf-8?b?IE5ld3M=?=') == 'Café News'
+    assert decode_mime_words('plain') == 'plain'
+    assert decode_mime_words(None) == ''
+    # Unknown charset: kept raw rather than dropped
+    assert decode_mime_words('=?x-unknown?q?abc?=') == '=?x-unknown?q?abc?='
+
+
+def test_fetch_response_with_trailing_items():
+    data = [
+        (b'1 (UID 101 INTERNALDATE "17-Jul-1996 02:44:25 -0700" BODY[HEADER.FIELDS (FROM)] {30}',
+         b'From: =?utf-8?q?Z=C3=BC?= <z@x>\r\n\r\n'),
+        b')',
+        (b'2 (BODY[HEADER.FIELDS (FROM)] {16}', b'From: a@b.c\r\n\r\n'),
+        b' UID 102)',
+    ]
+    first, second = parse_fetch_response(data)
+    assert first['seq'] == '1' and first['uid'] == '101'
+    assert first['headers'] == {'from': 'Zü <z@x>'}
+    assert first['from_raw'] == '=?utf-8?q?Z=C3=BC?= <z@x>'
+    assert first['internal_date'] == 837596665
+    assert second['uid'] == '102' and second['headers'] == {'from': 'a@b.c'}
+
+
+def test_gmail_extension_items():
+    data = [(b'3 (X-GM-MSGID 1278455344230334865 X-GM-THRID 1266894439832287888 '
+             b'X-GM-LABELS (\\Inbox "Two words" Work) UID 9 BODY[HEADER.FIELDS (FROM)] {10}', b'From: x\r\n'), b')']
+    (message,) = parse_fetch_response(data)
+    assert message['gm_msgid'] == '1278455344230334865'
+    assert message['gm_thrid'] == '1266894439832287888'
+    assert message['gm_labels'] == ['\\Inbox', 'Two words', 'Work']
+
+
+def test_label_list_unquotes():
+    assert parse_label_list(b'"a \\"b\\"" c') == ['a "b"', 'c']
+
+
+def test_unicode_line_separators_inside_values():
+    # U+0085, U+2028 and U+2029 are valid in a UTF-8 value and don't end the header line
+    name = 'Café Bar \u0085 Club '
+    block = f'From: {name} <bar@example.com>\r\nSubject: x\r\n'
+    assert parse_header_block(block.encode('utf-8'))['from'] == f'{name} <bar@example.com>'
+    assert parse_header_block(block) == {'from': f'{name} <bar@example.com>', 'subject': 'x'}
+    # Latin-1 0x85 in an 8-bit line isn't a line break either
+    assert parse_header_block(b'From: A\x85B <a@b.c>\r\n') == {'from': 'A\x85B <a@b.c>'}
+
+
+def test_labels_with_parentheses_and_item_names():
+    data = [(b'4 (X-GM-THRID 77 X-GM-LABELS ("Receipts (2024)" "UID 5" "say \\"hi)\\"" \\Inbox) UID 12 '
+             b'X-GM-MSGID 88 BODY[HEADER.FIELDS (FROM)] {10}', b'From: x\r\n'), b')']
+    (message,) = parse_fetch_response(data)
+    assert message['gm_labels'] == ['Receipts (2024)', 'UID 5', 'say "hi)"', '\\Inbox']
+    assert message['uid'] == '12'
+    assert message['gm_msgid'] == '88' and message['gm_thrid'] == '77'
+
+
+def test_empty_and_trailing_label_list():
+    (message,) = parse_fetch_response([(b'5 (X-GM-LABELS () BODY[HEADER.FIELDS (FROM)] {10}', b'From: x\r\n'),
+                                       b' UID 13)'])
+    assert message['gm_labels'] == [] and message['uid'] == '13'
+    (message,) = parse_fetch_response([(b'6 (BODY[HEADER.FIELDS (FROM)] {10}', b'From: x\r\n'),
+                                       b' X-GM-LABELS ("a (b)" c) UID 14)'])
+    assert message['gm_labels'] == ['a (b)', 'c'] and message['uid'] == '14'
@@ -0,0 +1,114 @@
+import os
+
+import pytest
+
+import fake_imap
+import imap_service
+from imap_service import _parse_scan_token, _scan_token
+from scan_checkpoints import ScanCheckpointStore, decode_cursor, encode_cursor
+from synthetic import SyntheticMailbox
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor('abc123', 'imap', '1700:4242', 3, query='from:x', mode='threads')
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == {"v": 1, "scan": 'abc123', "p": 'imap', "t": '1700:4242', "n": 3,
+                                     "q": 'from:x', "m": 'threads'}
+
+
+@pytest.mark.parametrize('cursor', ['', 'not-base64!', encode_cursor('', 'imap', 'x', 1)])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_imap_scan_token():
+    assert _scan_token(1700, 4242) == '1700:4242'
+    assert _parse_scan_token(_scan_token(1700, 4242)) == (1700, 4242)
+    for token in ['1700', '1700:x', '1:2:3', None]:
+        with pytest.raises(ValueError):
+            _parse_scan_token(token)
+
+
+def row(sender, ids, **extra):
+    return {'sender': sender, 'email': '', 'domain': '', 'count': len(ids), 'ids': ids, 'category': 'x', **extra}
+
+
+def test_checkpoint_merge(tmp_path):
+    store = ScanCheckpointStore(str(tmp_path))
+    scan_id = store.start('imap', 'a@example.com', None, 'messages')
+    store.record_page(scan_id, 1, [row('Shop', ['9', '8']), row('Bank', ['7'])], 'cursor-2')
+    # A retried page replaces the earlier copy
+    store.record_page(scan_id, 2, [row('Shop', ['1'])], 'cursor-3')
+    store.record_page(scan_id, 2, [row('Shop', ['6', '5']), row('News', ['4'])], 'cursor-3')
+    with open(os.path.join(str(tmp_path), f"{scan_id}.jsonl"), 'a') as f:
+        f.write('{"page": 3, "stats": [')        # torn write
+
+    scan = store.load(scan_id)
+    assert scan['account'] == 'a@example.com'
+    assert scan['pages'] == 2 and scan['messages'] == 6
+    assert scan['nextPageToken'] == 'cursor-3' and not scan['done']
+    by_sender = {s['sender']: s for s in scan['stats']}
+    assert by_sender['Shop']['ids'] == ['9', '8', '6', '5'] and by_sender['Shop']['count'] == 4
+    assert [s['sender'] for s in scan['stats']][0] == 'Shop'
+    assert store.header(scan_id)['provider'] == 'imap'
+
+
+def test_checkpoint_done_and_sampled(tmp_path):
+    store = ScanCheckpointStore(str(tmp_path))
+    scan_id = store.start('gmail', 'a@example.com', None, 'sampled')
+    store.record_page(scan_id, 1, [row('Shop', [], estimated=True, sampleIds=['a'])], 'next')
+    store.record_page(scan_id, 2, [row('Shop', [], estimated=True, sampleIds=['b'])], None)
+    scan = store.load(scan_id)
+    assert scan['done'] and scan['nextPageToken'] is None
+    (shop,) = scan['stats']
+    assert shop['estimated'] and shop['ids'] == [] and shop['sampleIds'] == ['a', 'b']
+
+
+def test_missing_or_foreign_scan(tmp_path):
+    store = ScanCheckpointStore(str(tmp_path))
+    assert store.load('0' * 32) is None
+    assert store.load('../etc/passwd') is None
+    with pytest.raises(ValueError):
+        store.record_page('../etc/passwd', 1, [], None)
+
+
+def test_imap_scan_resumes_from_token_on_new_connection(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    mailbox = SyntheticMailbox(250, senders=20)
+    server, _, (host, port) = fake_imap.serve(mailbox)
+    monkeypatch.setattr(imap_service, 'IMAP_HOST', host)
+    monkeypatch.setattr(imap_service, 'IMAP_PORT', port)
+    monkeypatch.setattr(imap_service, 'IMAP_SSL', False)
+    try:
+        seen, token = [], None
+        while True:
+            # Every page on a fresh connection: the token alone says where to continue
+            service = imap_service.ImapService()
+            service.authenticate('test@example.com', 'test')
+            stats, token = service.get_sender_stats(limit=60, page_token=token)
+            seen.extend(int(i) for s in stats for i in s['ids'])
+            if token is None:
+                break
+            assert token.startswith(f"{service.uidvalidity}:")
+        expected = [mailbox.uids[i] for i in range(mailbox.size) if mailbox.unread[i]]
+        assert sorted(seen) == sorted(expected) and len(seen) == len(set(seen))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_checkpoint_threads_spanning_pages(tmp_path):
+    store = ScanCheckpointStore(str(tmp_path))
+    scan_id = store.start('imap', 'a@example.com', None, 'messages')
+    store.record_page(scan_id, 1, [row('Shop', ['9', '8', '7'], threads=2, threadIds=['100', '200'])], 'next')
+    store.record_page(scan_id, 2, [row('Shop', ['6', '5'], threads=2, threadIds=['200', '300'])], None)
+    (shop,) = store.load(scan_id)['stats']
+    assert shop['threads'] == 3 and 'threadIds' not in shop
+
+    # Gmail threads mode: pages list disjoint threads and carry counts only
+    scan_id = store.start('gmail', 'a@example.com', None, 'threads')
+    store.record_page(scan_id, 1, [row('Shop', ['a'], threads=1)], 'next')
+    store.record_page(scan_id, 2, [row('Shop', ['b'], threads=1)], None)
+    (shop,) = store.load(scan_id)['stats']
+    assert shop['threads'] == 2
@@ -0,0 +1,61 @@
+import time
+
+from sender_aggregate import IdList, SenderAggregate, merge_ages, sorted_stats
+
+
+def test_idlist_round_trip_decimal():
+    ids = IdList(10)
+    for value in ['1', '42', b'4294967296', '9999999999999999999']:
+        ids.append(value)
+    assert ids.tolist() == ['1', '42', '4294967296', '9999999999999999999']
+    assert ids._strs is None
+    # 20 digits may not fit in 64 bits: the list switches to strings, earlier ids included
+    ids.append('18446744073709551616')
+    assert ids.tolist() == ['1', '42', '4294967296', '9999999999999999999', '18446744073709551616']
+
+
+def test_idlist_round_trip_hex():
+    ids = IdList(16)
+    for value in ['18c0000000000', 'ffffffffffffffff', 'a']:
+        ids.append(value)
+    assert ids.tolist() == ['18c0000000000', 'ffffffffffffffff', 'a']
+    assert len(ids) == 3
+
+
+def test_idlist_keeps_ids_integers_would_change():
+    ids = IdList(16)
+    ids.append('abc')
+    ids.append('0abc')                  # leading zero
+    ids.append('1ffffffffffffffff')     # over 64 bits
+    ids.append('ABC')                   # upper case wouldn't come back the same
+    assert ids.tolist() == ['abc', '0abc', '1ffffffffffffffff', 'ABC']
+
+
+def test_aggregate_to_dict():
+    now = int(time.time())
+    aggregate = SenderAggregate('Shop', 'news@shop.example', 'shop.example', 'Marketing')
+    aggregate.add('7', received=now - 3600)
+    aggregate.add('5', received=now - 40 * 86400)
+    row = aggregate.to_dict()
+    assert row['ids'] == ['7', '5'] and row['count'] == 2
+    assert row['ages'] == [1, 0, 1, 0, 0]
+    assert (row['oldest'], row['newest']) == (now - 40 * 86400, now - 3600)
+    assert row['dates'] == [now - 3600, now - 40 * 86400]
+
+
+def test_estimated_rows_keep_ids_apart():
+    aggregate = SenderAggregate('Shop', '', '', 'Unknown', id_base=16)
+    aggregate.add('abc', weight=10)
+    row = aggregate.to_dict()
+    assert row['estimated'] and row['ids'] == [] and row['sampleIds'] == ['abc'] and row['count'] == 10
+
+
+def test_sorted_stats_and_merge_ages():
+    small, big = SenderAggregate('a', '', '', 'x'), SenderAggregate('b', '', '', 'x')
+    small.add('1')
+    big.add('2')
+    big.add('3')
+    assert [row['sender'] for row in sorted_stats({'a': small, 'b': big})] == ['b', 'a']
+    row = {'ages': [1, 0, 0, 0, 0], 'oldest': 10, 'newest': 20}
+    merge_ages(row, {'ages': [0, 2, 0, 0, 0], 'oldest': 5, 'newest': 15})
+    assert row == {'ages': [1, 2, 0, 0, 0], 'oldest': 5, 'newest': 20}
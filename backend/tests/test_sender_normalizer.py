@@ -0,0 +1,17 @@
+from sender_normalizer import normalize_sender
+
+
+def test_address_and_domain_case_folded():
+    assert normalize_sender('News <News@Shop.Example>') == ('News', 'news@shop.example', 'shop.example')
+    assert normalize_sender('"News" <news@shop.example>') == normalize_sender('News <NEWS@shop.example>')
+
+
+def test_encoded_display_name():
+    sender = normalize_sender('=?utf-8?q?M=C3=BCller=2C_GmbH?= <info@mueller.example>')
+    assert sender == ('Müller, GmbH', 'info@mueller.example', 'mueller.example')
+
+
+def test_address_only_and_missing():
+    assert normalize_sender('alerts@bank.example') == ('alerts@bank.example', 'alerts@bank.example', 'bank.example')
+    assert normalize_sender('') == ('(Unknown)', '', '')
+    assert normalize_sender('Unknown') == ('Unknown', '', '')
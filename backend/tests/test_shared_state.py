@@ -0,0 +1,65 @@
+import sqlite3
+
+import pytest
+
+from shared_state import SessionStore, SharedState
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "state.db")
+
+
+def stored_state(path, token):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT state FROM sessions WHERE token = ?", (token,)).fetchone()[0]
+
+
+def test_refuses_plaintext_without_opt_out(db):
+    with pytest.raises(RuntimeError, match="SHARED_STATE_KEY"):
+        SharedState(db, key='')
+    SharedState(db, key='', allow_plaintext=True)
+
+
+def test_credentials_encrypted_at_rest(db):
+    store = SharedState(db, key='secret')
+    store.save_session('token-1', 'imap', 'a@example.com', {"password": "hunter2"})
+    assert 'hunter2' not in stored_state(db, 'token-1')
+    assert store.load_session('token-1')['state'] == {"password": "hunter2"}
+    # Another key (or none) can't read it: the session is unknown rather than an error
+    assert SharedState(db, key='other').load_session('token-1') is None
+    assert SharedState(db, key='', allow_plaintext=True).load_session('token-1') is None
+
+
+def test_plaintext_rows_reencrypted_on_write(db):
+    SharedState(db, key='', allow_plaintext=True).save_session('token-1', 'imap', 'a', {"password": "old"})
+    store = SharedState(db, key='secret')
+    assert store.load_session('token-1')['state'] == {"password": "old"}
+    store.update_session_state('token-1', {"password": "new"})
+    assert not stored_state(db, 'token-1').startswith('{')
+
+
+def test_membership_means_restorable(db):
+    shared = SharedState(db, key='secret')
+    shared.save_session('good', 'imap', 'a', {"ok": True})
+    shared.save_session('bad', 'imap', 'b', {"ok": False})
+    restored = []
+
+    def restore(row):
+        restored.append(row["token"])
+        if not row["state"]["ok"]:
+            raise ConnectionError("login failed")
+        return object()
+
+    sessions = SessionStore(shared, restore=restore)
+    assert 'good' in sessions
+    assert sessions.get('good') is not None
+    assert 'bad' not in sessions
+    assert 'bad' not in sessions
+    assert 'missing' not in sessions
+    # Restored once, and a failed restore isn't retried on every lookup
+    assert restored == ['good', 'bad']
+    assert len(sessions) == 1
+
+    unreadable = SessionStore(SharedState(db, key='other'), restore=restore)
+    assert 'good' not in unreadable
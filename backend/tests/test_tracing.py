@@ -0,0 +1,37 @@
+import time
+
+import pytest
+
+import tracing
+from tracing import accumulate, end_trace, span, start_trace
+
+
+def test_no_trace_is_a_no_op():
+    with span('fetch') as record:
+        assert record is None
+    with accumulate('parse'):
+        pass
+
+
+def test_accumulated_phase_not_counted_twice():
+    trace, token = start_trace('GET /api/senders')
+    with span('batch_fetch'):
+        time.sleep(0.02)
+        with span('http'):
+            with accumulate('parse'):
+                time.sleep(0.03)
+    with accumulate('classify'):
+        time.sleep(0.01)
+    end_trace(trace, token)
+
+    phases = trace.phase_totals()
+    assert set(phases) == {'batch_fetch', 'parse', 'classify'}
+    batch = next(s for s in trace.spans if s['name'] == 'batch_fetch')
+    # parse ran inside batch_fetch: the span's time is split between the two, not counted in both
+    assert phases['batch_fetch'] + phases['parse'] == pytest.approx(batch['duration'])
+    assert phases['batch_fetch'] >= 0.02 and phases['parse'] >= 0.03
+    assert sum(phases.values()) <= trace.duration
+    header = trace.server_timing()
+    assert header.startswith('batch_fetch;dur=') and 'parse;dur=' in header and header.endswith(
+        f"total;dur={trace.duration * 1000:.1f}")
+    assert tracing.get_trace(trace.id)['accumulated']['parse']['calls'] == 1
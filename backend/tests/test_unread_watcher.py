@@ -0,0 +1,85 @@
+import imaplib
+import socket
+import threading
+import time
+
+import pytest
+
+from metrics import IMAP_COMMANDS
+from unread_watcher import ImapIdleWatcher, UnreadWatcher, WatcherRegistry
+
+
+def scripted_imap(idle_reply):
+    """One-connection IMAP server answering IDLE with idle_reply (bytes) and everything else with OK."""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+
+    def handle():
+        conn, _ = server.accept()
+        reader = conn.makefile('rb')
+        conn.sendall(b'* OK [CAPABILITY IMAP4rev1 IDLE] ready\r\n')
+        while True:
+            line = reader.readline()
+            if not line:
+                break
+            tag, command = line.split()[:2]
+            if command == b'IDLE':
+                conn.sendall(idle_reply.replace(b'TAG', tag))
+                if idle_reply.startswith(b'+'):
+                    reader.readline()       # DONE
+                    conn.sendall(tag + b' OK IDLE terminated\r\n')
+            else:
+                conn.sendall(tag + b' OK done\r\n')
+        conn.close()
+
+    threading.Thread(target=handle, daemon=True).start()
+    mail = imaplib.IMAP4('127.0.0.1', server.getsockname()[1])
+    watcher = ImapIdleWatcher(service=None)
+    watcher.conn = type('Conn', (), {'mail': mail})()
+    return watcher, mail
+
+
+def idle_count(status):
+    return IMAP_COMMANDS._values.get(('IDLE', status), 0)
+
+
+def test_idle_sees_response_sent_with_continuation():
+    # '+ idling' and the EXISTS arrive in one packet: the EXISTS sits in imaplib's buffer, not the socket
+    watcher, mail = scripted_imap(b'+ idling\r\n* 7 EXISTS\r\n')
+    before = idle_count('OK')
+    start = time.monotonic()
+    watcher._idle(5)
+    assert time.monotonic() - start < 0.5
+    assert idle_count('OK') == before + 1
+    assert mail.noop()[0] == 'OK'
+
+
+def test_rejected_idle_counts_status():
+    watcher, _ = scripted_imap(b'TAG NO IDLE not allowed\r\n')
+    before_ok, before_no = idle_count('OK'), idle_count('NO')
+    with pytest.raises(Exception, match='IDLE rejected'):
+        watcher._idle(5)
+    assert idle_count('NO') == before_no + 1
+    assert idle_count('OK') == before_ok
+
+
+class _Failing(UnreadWatcher):
+    def _watch(self):
+        raise RuntimeError("boom")
+
+
+def test_registry_drops_stopped_watchers():
+    registry = WatcherRegistry()
+    stopped = _Failing(object())
+    stopped.stop()
+    running = _Failing(object())
+    running._thread = threading.Thread(target=time.sleep, args=(1,))
+    running._thread.start()
+    registry._watchers.update(stopped=stopped, running=running)
+
+    assert registry.active_count() == 1
+    assert list(registry._watchers) == ['running']
+    registry.remove('running')
+    assert registry.active_count() == 0
+    assert not running.alive
@@ -0,0 +1,172 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from unsubscribe_executor import ONE_CLICK_BODY, UnsubscribeExecutor, group_by_list, list_key, parse_list_unsubscribe
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.posts.append((self.path, body))
+            server.in_flight += 1
+            server.peak = max(server.peak, server.in_flight)
+        time.sleep(server.delay)
+        # Leaves the count before answering: the client frees its gate slot once it has the answer
+        with server.lock:
+            server.in_flight -= 1
+        if self.path.startswith('/redirect'):
+            self.send_response(302)
+            self.send_header('Location', '/ok')
+        elif self.path.startswith('/fail'):
+            self.send_response(500)
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.posts = []
+    httpd.in_flight = httpd.peak = 0
+    httpd.delay = 0.0
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def one_click(msg_id, url, list_id=None):
+    return {"id": msg_id, "sender": f"News <news{msg_id}@example.com>", "list_id": list_id or f"<list{msg_id}.example>",
+            "list_unsubscribe": f"<{url}>", "list_unsubscribe_post": "List-Unsubscribe=One-Click"}
+
+
+def test_parse_list_unsubscribe():
+    value = '<mailto:leave@list.example?subject=unsubscribe>, <https://list.example/u/1>'
+    assert parse_list_unsubscribe(value, 'List-Unsubscribe=One-Click') == {
+        "https": ['https://list.example/u/1'], "mailto": ['mailto:leave@list.example?subject=unsubscribe'],
+        "oneClick": True}
+    # One-click needs the exact Post value and an https URI
+    assert not parse_list_unsubscribe(value, 'yes')["oneClick"]
+    assert not parse_list_unsubscribe('<mailto:leave@list.example>', 'List-Unsubscribe=One-Click')["oneClick"]
+    assert parse_list_unsubscribe(None) == {"https": [], "mailto": [], "oneClick": False}
+
+
+def test_list_key():
+    assert list_key({"list_id": "Weekly News <Weekly.List.Example>"}) == 'list:weekly.list.example'
+    assert list_key({"list_id": "plain-id"}) == 'list:plain-id'
+    assert list_key({"sender": "Shop <News@Shop.Example>"}) == 'sender:news@shop.example'
+    assert list_key({"sender": "", "list_unsubscribe": "<https://u.example/x>"}) == 'uri:https://u.example/x'
+    assert list_key({}) is None
+
+
+def test_group_by_list_prefers_one_click():
+    messages = [
+        {"id": "1", "sender": "a@x.example", "list_id": "<l.example>", "list_unsubscribe": "<mailto:u@l.example>"},
+        {"id": "2", "error": "404"},
+        one_click("3", "https://l.example/u", list_id="<l.example>"),
+        {"id": "4", "sender": "b@x.example", "list_unsubscribe": "<https://b.example/u>"},
+        {"id": "5"},
+    ]
+    groups = group_by_list(messages)
+    assert [(g["list"], g["ids"]) for g in groups] == [('list:l.example', ['1', '3']),
+                                                       ('sender:b@x.example', ['4'])]
+    assert groups[0]["options"]["oneClick"] and groups[0]["sender"] == "a@x.example"
+    assert not groups[1]["options"]["oneClick"]
+
+
+def executor(**kwargs):
+    kwargs.setdefault('host_interval', 0.0)
+    kwargs.setdefault('allow_private', True)
+    return UnsubscribeExecutor(**kwargs)
+
+
+def test_one_click_post(server):
+    outcome, status, error = executor().post_one_click(server.url + '/ok?u=1')
+    assert (outcome, status, error) == ("ok", 200, None)
+    assert server.posts == [('/ok?u=1', ONE_CLICK_BODY)]
+
+
+def test_redirect_is_refused(server):
+    outcome, status, error = executor().post_one_click(server.url + '/redirect')
+    assert (outcome, status) == ("failed", 302)
+    assert "Redirects" in error
+    assert [path for path, _ in server.posts] == ['/redirect']
+
+
+def test_loopback_refused_unless_allowed(server):
+    port = server.server_address[1]
+    strict = executor(allow_private=False)
+    # Plain http is refused before the address is looked at
+    assert strict.post_one_click(server.url + '/ok')[0] == "refused"
+    outcome, status, error = strict.post_one_click(f"https://127.0.0.1:{port}/ok")
+    assert (outcome, status) == ("refused", None)
+    assert "non-public" in error
+    outcome, _, error = strict.post_one_click(f"https://localhost:{port}/ok")
+    assert outcome == "refused" and "non-public" in error
+    assert server.posts == []
+    assert executor(allow_private=True).post_one_click(server.url + '/ok')[0] == "ok"
+
+
+def test_private_address_refused():
+    outcome, _, error = executor(allow_private=False).post_one_click("https://10.1.2.3/unsubscribe")
+    assert outcome == "refused" and "non-public" in error
+
+
+def test_per_host_limit(server):
+    server.delay = 0.05
+    report = executor(workers=8, per_host=2).run([one_click(i, f"{server.url}/ok/{i}") for i in range(12)])
+    assert report["count"] == 12
+    assert server.peak == 2
+
+
+def test_pool_shared_across_runs(server):
+    server.delay = 0.05
+    shared = executor(workers=2, per_host=10)
+    batches = [[one_click(f"{b}-{i}", f"{server.url}/ok/{b}/{i}") for i in range(4)] for b in range(3)]
+    with ThreadPoolExecutor(max_workers=3) as callers:
+        reports = list(callers.map(shared.run, batches))
+    assert [r["count"] for r in reports] == [4, 4, 4]
+    assert server.peak <= 2
+
+
+def test_report_statuses(server):
+    headers = [
+        one_click(1, server.url + '/ok'),
+        one_click(2, server.url + '/ok', list_id='<list1.example>'),      # same list as 1
+        one_click(3, server.url + '/fail'),
+        {"id": 4, "sender": "Shop <shop@example.com>", "list_unsubscribe": "<mailto:leave@example.com>"},
+        {"id": 5, "sender": "Blog <blog@example.com>", "list_unsubscribe": "<https://blog.example/unsub>"},
+        {"id": 6, "sender": "Friend <friend@example.com>"},
+        {"id": 7, "error": "404 Not Found"},
+    ]
+    report = executor().run(headers)
+    by_list = {r["list"]: r for r in report["lists"]}
+    assert by_list["list:list1.example"]["status"] == "ok"
+    assert by_list["list:list1.example"]["messages"] == 2
+    assert by_list["list:list3.example"]["status"] == "failed"
+    assert by_list["list:list3.example"]["httpStatus"] == 500
+    assert by_list["sender:shop@example.com"]["status"] == "manual"
+    assert by_list["sender:shop@example.com"]["url"] == "mailto:leave@example.com"
+    assert by_list["sender:blog@example.com"]["status"] == "manual"
+    assert by_list["sender:blog@example.com"]["url"] == "https://blog.example/unsub"
+    assert by_list["sender:friend@example.com"]["status"] == "unsupported"
+    assert report["count"] == 1
+    assert report["messages"] == 6
+    assert report["skipped"] == 0
+
+    strict = executor(allow_private=False).run([one_click(8, server.url + '/ok')])
+    assert [r["status"] for r in strict["lists"]] == ["refused"]
@@ -0,0 +1,261 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Per-request, opt-in tracing of the scan hot paths.
+# Enable with the `X-Trace: 1` header or `?trace=1` (use `profile` instead of `1` to also capture
+# a sampling profile). Without an active trace, span() is a contextvar lookup and nothing else.
+#
+# Finished traces are kept in a small in-memory ring (GET /api/traces/{id}) and handed to the
+# configured exporters:
+#   TRACE_EXPORT=json             one JSON line per trace on stdout
+#   TRACE_COLLECTOR_URL=http://…  POST each trace as JSON to a local collector
+# Extra exporters can be added with add_exporter(callable).
+
+PROFILE_INTERVAL_SECONDS = 0.005
+MAX_STORED_TRACES = 100
+MAX_PROFILE_STACK_DEPTH = 64
+
+logger = logging.getLogger(__name__)
+# TRACE_EXPORT=json sink: bare JSON lines on stdout whatever the app's logging config is
+_json_log = logging.getLogger(__name__ + '.json')
+_json_log.propagate = False
+_json_log.setLevel(logging.INFO)
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+_exporters = []
+_stored = OrderedDict()
+_stored_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, name, profile=False):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+        self.duration = None
+        self.spans = []
+        self.totals = {}   # name -> [seconds, calls] for accumulated phases (see accumulate())
+        self._nested = {}  # top-level span id -> accumulated seconds spent inside it
+        self.attrs = {}
+        self.profile = None
+        self._lock = threading.Lock()
+        self._thread_ids = set()
+        self._sampler = _Sampler(self) if profile else None
+
+    def _register_thread(self):
+        ident = threading.get_ident()
+        if ident not in self._thread_ids:
+            with self._lock:
+                self._thread_ids.add(ident)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+        if self._sampler:
+            self.profile = self._sampler.stop()
+
+    def phase_totals(self):
+        """
+        {phase: seconds} over top-level spans and accumulated phases. Accumulated time is taken
+        out of the top-level span it ran in (e.g. 'parse' inside 'batch_fetch'), so each second
+        is counted in one phase only.
+        """
+        totals = {}
+        for s in self.spans:
+            if s['parent'] is None:
+                own = s['duration'] - self._nested.get(s['id'], 0.0)
+                totals[s['name']] = totals.get(s['name'], 0.0) + max(own, 0.0)
+        for name, (seconds, _) in self.totals.items():
+            totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def server_timing(self):
+        """Server-Timing header value (milliseconds), shown by browser devtools."""
+        parts = [f"{_token(name)};dur={seconds * 1000:.1f}" for name, seconds in self.phase_totals().items()]
+        parts.append(f"total;dur={(self.duration or 0) * 1000:.1f}")
+        return ', '.join(parts)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "startedAt": self.started_at,
+            "durationMs": round((self.duration or 0) * 1000, 3),
+            "attrs": self.attrs,
+            "phasesMs": {k: round(v * 1000, 3) for k, v in self.phase_totals().items()},
+            "accumulated": {k: {"ms": round(v[0] * 1000, 3), "calls": v[1]} for k, v in self.totals.items()},
+            "spans": [
+                {**s, "startMs": round(s['start'] * 1000, 3), "durationMs": round(s['duration'] * 1000, 3)}
+                for s in self.spans
+            ],
+            "profile": self.profile,
+        }
+
+
+def _token(name):
+    # Server-Timing metric names are HTTP tokens
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+
+
+class _Sampler:
+    """Samples the stacks of the threads working on a trace; results in folded-stack format."""
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.samples = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(PROFILE_INTERVAL_SECONDS):
+            frames = sys._current_frames()
+            for ident in list(self.trace._thread_ids):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_PROFILE_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                key = ';'.join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1)
+        return {
+            "intervalMs": PROFILE_INTERVAL_SECONDS * 1000,
+            "samples": sum(self.samples.values()),
+            # 'a;b;c count' lines, directly usable by flamegraph.pl / speedscope
+            "folded": [f"{k} {v}" for k, v in sorted(self.samples.items(), key=lambda kv: -kv[1])],
+        }
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name, **attrs):
+    """Times a phase of the current request. No-op when the request isn't traced."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    trace._register_thread()
+    record = {"name": name, "parent": _current_span.get(), "attrs": attrs, "start": 0.0, "duration": 0.0}
+    with trace._lock:
+        record["id"] = len(trace.spans)
+        trace.spans.append(record)
+    token = _current_span.set(record["id"])
+    start = time.perf_counter()
+    record["start"] = start - trace.start
+    try:
+        yield record
+    finally:
+        record["duration"] = time.perf_counter() - start
+        _current_span.reset(token)
+
+
+@contextmanager
+def accumulate(name):
+    """
+    For phases made of many tiny calls (e.g. one classify_sender per new sender): adds the time
+    to a per-trace total instead of recording a span per call.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        root = _current_span.get()
+        with trace._lock:
+            entry = trace.totals.setdefault(name, [0.0, 0])
+            entry[0] += elapsed
+            entry[1] += 1
+            if root is not None:
+                while trace.spans[root]['parent'] is not None:
+                    root = trace.spans[root]['parent']
+                trace._nested[root] = trace._nested.get(root, 0.0) + elapsed
+
+
+def start_trace(name, profile=False):
+    """Starts a trace for the current context; returns (trace, token) for end_trace()."""
+    trace = Trace(name, profile=profile)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(trace, token):
+    _current_trace.reset(token)
+    trace.finish()
+    with _stored_lock:
+        _stored[trace.id] = trace
+        while len(_stored) > MAX_STORED_TRACES:
+            _stored.popitem(last=False)
+    for export in list(_exporters):
+        try:
+            export(trace)
+        except Exception as e:
+            logger.warning("Trace exporter failed: %s", e)
+
+
+def get_trace(trace_id):
+    with _stored_lock:
+        trace = _stored.get(trace_id)
+    return trace.to_dict() if trace else None
+
+
+def add_exporter(export):
+    """Registers a callable receiving every finished Trace."""
+    _exporters.append(export)
+
+
+def json_log_exporter(trace):
+    _json_log.info(json.dumps({"trace": trace.to_dict()}))
+
+
+def make_http_exporter(url, timeout=2.0):
+    """Exporter POSTing traces to a local collector, off the request thread."""
+    import urllib.request
+
+    def send(payload):
+        try:
+            req = urllib.request.Request(url, data=payload, headers={"Content-Type": "application/json"})
+            urllib.request.urlopen(req, timeout=timeout).close()
+        except Exception as e:
+            logger.warning("Trace collector unreachable: %s", e)
+
+    def export(trace):
+        payload = json.dumps(trace.to_dict()).encode()
+        threading.Thread(target=send, args=(payload,), daemon=True).start()
+
+    return export
+
+
+def configure_from_env():
+    if os.environ.get('TRACE_EXPORT') == 'json':
+        if not _json_log.handlers:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            _json_log.addHandler(handler)
+        add_exporter(json_log_exporter)
+    collector = os.environ.get('TRACE_COLLECTOR_URL')
+    if collector:
+        add_exporter(make_http_exporter(collector))
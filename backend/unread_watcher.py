@@ -0,0 +1,310 @@
+import hashlib
+import json
+import logging
+import select
+import ssl
+import threading
+import time
+
+from metrics import execute_gmail, IMAP_COMMANDS
+
+# Live unread counters.
+# One watcher per session keeps {'messagesUnread', 'threadsUnread'} current in memory, so
+# /api/stats is answered from cache no matter how many tabs are polling.
+#  - IMAP: IDLE on a dedicated connection (the session's own connection stays free for requests)
+#  - Gmail API: periodic history.list deltas; labels.get only when something changed
+
+IDLE_RENEW_SECONDS = 5 * 60      # Gmail drops IDLE after ~10 min; RFC 2177 says renew before 29
+IMAP_POLL_SECONDS = 60           # Fallback when the server has no IDLE
+GMAIL_POLL_SECONDS = 30
+WATCHER_IDLE_TIMEOUT = 10 * 60   # Stop watching once nobody has asked for 10 minutes
+ERROR_BACKOFF_SECONDS = 30
+MAX_CONSECUTIVE_ERRORS = 5
+
+logger = logging.getLogger(__name__)
+
+
+def make_etag(counts):
+    payload = json.dumps(counts, sort_keys=True).encode()
+    return '"' + hashlib.sha1(payload).hexdigest()[:16] + '"'
+
+
+class UnreadWatcher:
+    """Base watcher: holds the cached counts; subclasses implement _watch()."""
+
+    def __init__(self, service):
+        self.service = service
+        self.counts = None
+        self.etag = None
+        self.last_access = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresh = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._refresh.set()
+
+    @property
+    def alive(self):
+        return self._thread.is_alive() and not self._stop.is_set()
+
+    def get(self):
+        """Returns (counts, etag). Counts are fetched synchronously only if nothing is cached."""
+        self.last_access = time.time()
+        with self._lock:
+            if self.counts is not None:
+                return self.counts, self.etag
+        counts = self.service.get_unread_count()
+        self.update(counts)
+        return counts, make_etag(counts)
+
+    def update(self, counts):
+        with self._lock:
+            self.counts = counts
+            self.etag = make_etag(counts)
+
+    def invalidate(self):
+        """Drops the cached value (e.g. after a bulk action) and wakes the watcher to refresh."""
+        with self._lock:
+            self.counts = None
+            self.etag = None
+        self._refresh.set()
+
+    def _idle_expired(self):
+        return time.time() - self.last_access > WATCHER_IDLE_TIMEOUT
+
+    def _run(self):
+        errors = 0
+        while not self._stop.is_set() and not self._idle_expired():
+            try:
+                self._watch()
+                errors = 0
+            except Exception as e:
+                errors += 1
+                logger.warning("Unread watcher error (%d/%d): %s", errors, MAX_CONSECUTIVE_ERRORS, e)
+                if errors >= MAX_CONSECUTIVE_ERRORS:
+                    break
+                self._close()
+                self._stop.wait(ERROR_BACKOFF_SECONDS)
+        self._close()
+        self._stop.set()
+
+    def _watch(self):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+
+class ImapIdleWatcher(UnreadWatcher):
+    def __init__(self, service):
+        super().__init__(service)
+        self.conn = None
+
+    def _connect(self):
+        from imap_service import ImapService
+        # Dedicated connection: IDLE blocks the connection it runs on
+        self.conn = ImapService()
+        self.conn.authenticate(self.service.email_address, self.service.password)
+        self.conn.mail.select("inbox", readonly=True)
+        self.has_idle = self.conn._has_capability("IDLE")
+
+    def _close(self):
+        if self.conn and self.conn.mail:
+            try:
+                self.conn.mail.logout()
+            except Exception:
+                pass
+        self.conn = None
+
+    def _watch(self):
+        if not self.conn:
+            self._connect()
+
+        self._refresh.clear()
+        self.update(self.conn.get_unread_count())
+
+        if not self.has_idle:
+            self._refresh.wait(IMAP_POLL_SECONDS)
+            return
+        self._idle(IDLE_RENEW_SECONDS)
+
+    def _idle(self, timeout):
+        """Runs one IDLE command until the mailbox changes, a refresh is requested or timeout."""
+        mail = self.conn.mail
+        tag = mail._new_tag()
+        # Counted once IDLE completes with the tagged status; rejected IDLE counts as NO/BAD and a
+        # connection lost or timing out on the way counts as 'error'
+        status = 'error'
+        try:
+            mail.send(tag + b' IDLE\r\n')
+            line = mail.readline()
+            if not line.startswith(b'+'):
+                status = _tagged_status(line, tag) or status
+                raise Exception(f"IDLE rejected: {line!r}")
+            status = self._idle_until_change(mail, tag, timeout)
+        finally:
+            IMAP_COMMANDS.inc(command='IDLE', status=status)
+
+    def _idle_until_change(self, mail, tag, timeout):
+        """Waits in IDLE, then ends it with DONE; returns the status of IDLE's tagged response."""
+        deadline = time.time() + timeout
+        while time.time() < deadline and not self._refresh.is_set() and not self._stop.is_set():
+            if self._idle_expired():
+                break
+            # Short select so stop/refresh requests are noticed within a second. select() only sees
+            # the socket: a response that arrived with the '+' line is already in a buffer
+            if not _buffered(mail):
+                ready, _, _ = select.select([mail.sock], [], [], 1.0)
+                if not ready:
+                    continue
+            line = mail.readline()
+            if not line:
+                raise Exception("IMAP connection closed during IDLE")
+            # '* 12 EXISTS', '* 3 EXPUNGE', '* 5 FETCH (FLAGS (\Seen))' all may change UNSEEN
+            if line.startswith(b'*') and (b'EXISTS' in line or b'EXPUNGE' in line or b'FETCH' in line):
+                break
+
+        mail.send(b'DONE\r\n')
+        # Drain remaining untagged responses up to the IDLE completion
+        while True:
+            line = mail.readline()
+            if not line:
+                raise Exception("IMAP connection closed while ending IDLE")
+            if line.startswith(tag):
+                return _tagged_status(line, tag) or 'error'
+
+
+def _tagged_status(line, tag):
+    """'OK', 'NO' or 'BAD' from a tagged response line of `tag`, None for any other line."""
+    parts = line.split(None, 2)
+    if len(parts) < 2 or parts[0] != tag:
+        return None
+    return parts[1].decode('ascii', errors='replace').upper()
+
+
+def _buffered(mail):
+    """True if data was already read off the socket: decrypted TLS bytes or imaplib's file buffer."""
+    sock = mail.sock
+    if isinstance(sock, ssl.SSLSocket) and sock.pending():
+        return True
+    # peek() returns what's buffered; with the socket non-blocking it never waits for more
+    timeout = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        return bool(mail.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        sock.settimeout(timeout)
+
+
+class GmailHistoryWatcher(UnreadWatcher):
+    def __init__(self, service):
+        super().__init__(service)
+        self.api = None
+        self.history_id = None
+
+    def _watch(self):
+        if not self.api:
+            from gmail_service import GmailApiService
+            # Own client: googleapiclient/httplib2 objects are not thread-safe
+            self.api = GmailApiService(credentials=self.service.creds)
+
+        if self.history_id is None or self._refresh.is_set():
+            self._refresh.clear()
+            self._reseed()
+        else:
+            changed = self._poll_history()
+            if changed:
+                self.update(self.api.get_unread_count())
+
+        self._refresh.wait(GMAIL_POLL_SECONDS)
+
+    def _reseed(self):
+        profile = execute_gmail(self.api.service.users().getProfile(userId='me'), 'users.getProfile')
+        self.history_id = profile.get('historyId')
+        self.update(self.api.get_unread_count())
+
+    def _poll_history(self):
+        """Returns True if anything happened since the last poll (1 cheap call when idle)."""
+        try:
+            response = execute_gmail(self.api.service.users().history().list(
+                userId='me',
+                startHistoryId=self.history_id,
+                maxResults=1
+            ), 'history.list')
+        except Exception as e:
+            # 404: startHistoryId is too old, start over from a fresh snapshot
+            if "404" in str(e):
+                self.history_id = None
+                return False
+            raise
+        self.history_id = response.get('historyId', self.history_id)
+        return bool(response.get('history'))
+
+
+class WatcherRegistry:
+    """session key -> watcher, created lazily on the first /api/stats for that session."""
+
+    def __init__(self):
+        self._watchers = {}
+        self._lock = threading.Lock()
+
+    def _create(self, service):
+        from imap_service import ImapService
+        from gmail_service import GmailApiService
+        if isinstance(service, ImapService):
+            return ImapIdleWatcher(service)
+        if isinstance(service, GmailApiService) and service.creds:
+            return GmailHistoryWatcher(service)
+        return None
+
+    def get_counts(self, key, service):
+        """Returns (counts, etag), starting a watcher for the session if needed."""
+        with self._lock:
+            self._prune()
+            watcher = self._watchers.get(key)
+            if watcher is None or not watcher.alive or watcher.service is not service:
+                if watcher:
+                    watcher.stop()
+                watcher = self._create(service)
+                if watcher is None:
+                    self._watchers.pop(key, None)
+                else:
+                    self._watchers[key] = watcher
+                    watcher.start()
+
+        if watcher is None:
+            counts = service.get_unread_count()
+            return counts, make_etag(counts)
+        return watcher.get()
+
+    def _prune(self):
+        # Watchers stop themselves after WATCHER_IDLE_TIMEOUT or repeated errors; drop them so
+        # they don't keep the session's service (and its connection) referenced
+        for key, watcher in list(self._watchers.items()):
+            if not watcher.alive:
+                del self._watchers[key]
+
+    def remove(self, key):
+        """Stops the session's watcher, e.g. when the session is removed."""
+        with self._lock:
+            watcher = self._watchers.pop(key, None)
+        if watcher:
+            watcher.stop()
+
+    def invalidate(self, key):
+        watcher = self._watchers.get(key)
+        if watcher:
+            watcher.invalidate()
+
+    def active_count(self):
+        with self._lock:
+            self._prune()
+            return len(self._watchers)
@@ -0,0 +1,265 @@
+import http.client
+import ipaddress
+import os
+import re
+import socket
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from keyed_gate import KeyedGate
+from metrics import UNSUBSCRIBE_REQUESTS, UNSUBSCRIBE_SECONDS
+from sender_normalizer import normalize_sender
+
+# RFC 8058 one-click unsubscribe.
+# Input is the List-* headers of the selected messages (EmailService.get_unsubscribe_headers).
+# Messages are grouped by list (List-Id, else the sender address), so 2,000 newsletters from one
+# list cost one request. Lists offering one-click (an https URI in List-Unsubscribe plus
+# "List-Unsubscribe-Post: List-Unsubscribe=One-Click") get a POST of exactly that body:
+#   - bounded pool of UNSUBSCRIBE_WORKERS threads, UNSUBSCRIBE_TIMEOUT seconds per request
+#   - per host at most UNSUBSCRIBE_PER_HOST requests in flight, started UNSUBSCRIBE_HOST_INTERVAL
+#     seconds apart; work is interleaved by host so one big ESP doesn't hold every worker
+#   - redirects are not followed (RFC 8058 forbids them) and hosts resolving to private or
+#     loopback addresses are refused, since the URLs come from arbitrary senders. The POST goes
+#     to the very address that was checked (the hostname is only used for SNI, certificate and
+#     Host), so a second DNS answer can't point it elsewhere; proxy env variables are ignored
+#   - one executor per process: its pool and the per-host limits are shared by concurrent
+#     requests and accounts, so at most UNSUBSCRIBE_WORKERS POSTs run at once in total
+# Lists with only a mailto: or a plain https link need the user (sending mail needs another OAuth
+# scope; a plain link is usually a landing page) and are reported as "manual" with the link.
+# UNSUBSCRIBE_ALLOW_PRIVATE=1 lifts the address and https checks for local test servers.
+
+UNSUBSCRIBE_WORKERS = int(os.environ.get('UNSUBSCRIBE_WORKERS', 8))
+UNSUBSCRIBE_TIMEOUT = float(os.environ.get('UNSUBSCRIBE_TIMEOUT', 10))
+UNSUBSCRIBE_PER_HOST = int(os.environ.get('UNSUBSCRIBE_PER_HOST', 2))
+UNSUBSCRIBE_HOST_INTERVAL = float(os.environ.get('UNSUBSCRIBE_HOST_INTERVAL', 0.25))
+UNSUBSCRIBE_ALLOW_PRIVATE = os.environ.get('UNSUBSCRIBE_ALLOW_PRIVATE', '0') == '1'
+
+ONE_CLICK_BODY = b'List-Unsubscribe=One-Click'
+USER_AGENT = 'gmail-cleanup-unsubscribe/1.0'
+
+_URI_RE = re.compile(r'<\s*([^>\s]+)\s*>')
+
+
+def parse_list_unsubscribe(value, post_value=None):
+    """
+    List-Unsubscribe (+ List-Unsubscribe-Post) -> {"https": [...], "mailto": [...], "oneClick": bool}.
+    oneClick needs the exact RFC 8058 Post value and at least one https URI.
+    """
+    https, mailto = [], []
+    for uri in _URI_RE.findall(value or ''):
+        scheme = uri.split(':', 1)[0].lower()
+        if scheme in ('https', 'http'):
+            https.append(uri)
+        elif scheme == 'mailto':
+            mailto.append(uri)
+    one_click = (post_value or '').strip().lower() == 'list-unsubscribe=one-click'
+    return {"https": https, "mailto": mailto, "oneClick": one_click and bool(https)}
+
+
+def list_key(headers):
+    """Which list a message belongs to: List-Id, else the sender address, else its first URI."""
+    list_id = (headers.get('list_id') or '').strip()
+    if list_id:
+        # 'Some Name <list.example.com>': the part in brackets identifies the list
+        match = _URI_RE.search(list_id)
+        return 'list:' + (match.group(1) if match else list_id).lower()
+    _, email, _ = normalize_sender(headers.get('sender') or '')
+    if email:
+        return 'sender:' + email.lower()
+    uris = _URI_RE.findall(headers.get('list_unsubscribe') or '')
+    return 'uri:' + uris[0] if uris else None
+
+
+def group_by_list(messages):
+    """
+    Headers of many messages -> one target per list, in first-seen order (newest first for scan
+    order), keeping the first message that advertises one-click, else the first one at all.
+    """
+    targets = {}
+    for headers in messages:
+        if 'error' in headers:
+            continue
+        key = list_key(headers)
+        if key is None:
+            continue
+        options = parse_list_unsubscribe(headers.get('list_unsubscribe'), headers.get('list_unsubscribe_post'))
+        target = targets.get(key)
+        if target is None:
+            target = targets[key] = {"list": key, "sender": headers.get('sender'), "ids": [],
+                                     "options": options}
+        elif options["oneClick"] and not target["options"]["oneClick"]:
+            target["options"] = options
+        target["ids"].append(headers['id'])
+    return list(targets.values())
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    """Connects to a checked address instead of resolving the hostname again."""
+
+    def __init__(self, host, address=None, **kwargs):
+        super().__init__(host, **kwargs)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address or self.host, self.port), self.timeout)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """Like _PinnedHTTPConnection; TLS (SNI, certificate check) still uses the hostname."""
+
+    def __init__(self, host, address=None, **kwargs):
+        super().__init__(host, **kwargs)
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address or self.host, self.port), self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+class _PinnedHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(lambda host, **kw: _PinnedHTTPConnection(host, req.pinned_address, **kw), req)
+
+
+class _PinnedHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(lambda host, **kw: _PinnedHTTPSConnection(host, req.pinned_address, **kw), req,
+                            context=self._context)
+
+
+def _check_destination(url, allow_private):
+    """Returns the address to connect to; raises ValueError for URLs we won't POST to."""
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme != 'https' and not (allow_private and parsed.scheme == 'http'):
+        raise ValueError("One-click URI is not https")
+    if not parsed.hostname:
+        raise ValueError("One-click URI has no host")
+    try:
+        infos = socket.getaddrinfo(parsed.hostname, parsed.port or 443, proto=socket.IPPROTO_TCP)
+    except socket.gaierror as e:
+        raise ValueError(f"Cannot resolve {parsed.hostname}: {e}")
+    if not infos:
+        raise ValueError(f"Cannot resolve {parsed.hostname}")
+    if not allow_private:
+        for info in infos:
+            address = ipaddress.ip_address(info[4][0].split('%')[0])
+            if not address.is_global:
+                raise ValueError(f"{parsed.hostname} resolves to a non-public address")
+    return infos[0][4][0]
+
+
+def _interleave_by_host(targets):
+    """Round-robin over hosts, so the pool works on many hosts at once."""
+    queues = {}
+    for target in targets:
+        host = urllib.parse.urlsplit(target["url"]).hostname or ''
+        queues.setdefault(host, []).append(target)
+    ordered = []
+    while queues:
+        for host in list(queues):
+            ordered.append(queues[host].pop(0))
+            if not queues[host]:
+                del queues[host]
+    return ordered
+
+
+class UnsubscribeExecutor:
+    def __init__(self, workers=UNSUBSCRIBE_WORKERS, timeout=UNSUBSCRIBE_TIMEOUT, per_host=UNSUBSCRIBE_PER_HOST,
+                 host_interval=UNSUBSCRIBE_HOST_INTERVAL, allow_private=UNSUBSCRIBE_ALLOW_PRIVATE):
+        self.workers = workers
+        self.timeout = timeout
+        self.allow_private = allow_private
+        self._gate = KeyedGate(per_host, host_interval)
+        # Shared by every run(): concurrent requests queue here instead of each starting threads
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='unsubscribe')
+        # No proxies from the environment: the request must reach the address checked below
+        self._opener = urllib.request.build_opener(urllib.request.ProxyHandler({}), _NoRedirect,
+                                                   _PinnedHTTPHandler, _PinnedHTTPSHandler)
+
+    def post_one_click(self, url):
+        """One RFC 8058 POST; returns (outcome, http status or None, error or None)."""
+        try:
+            address = _check_destination(url, self.allow_private)
+        except ValueError as e:
+            return "refused", None, str(e)
+
+        request = urllib.request.Request(url, data=ONE_CLICK_BODY, method='POST', headers={
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'User-Agent': USER_AGENT,
+        })
+        request.pinned_address = address
+        with self._gate(urllib.parse.urlsplit(url).hostname):
+            try:
+                with self._opener.open(request, timeout=self.timeout) as response:
+                    response.read(65536)
+                    return "ok", response.status, None
+            except urllib.error.HTTPError as e:
+                reason = "Redirects are not allowed" if 300 <= e.code < 400 else (e.reason or "HTTP error")
+                return "failed", e.code, str(reason)
+            except (urllib.error.URLError, OSError) as e:
+                reason = getattr(e, 'reason', e)
+                return "failed", None, str(reason)
+
+    def _run_one(self, target):
+        start = time.perf_counter()
+        outcome, status, error = self.post_one_click(target["url"])
+        elapsed = time.perf_counter() - start
+        UNSUBSCRIBE_REQUESTS.inc(outcome=outcome)
+        UNSUBSCRIBE_SECONDS.observe(elapsed)
+        result = {**target, "status": outcome, "httpStatus": status, "ms": round(elapsed * 1000, 1)}
+        if error:
+            result["error"] = error
+        return result
+
+    def run(self, message_headers):
+        """
+        Unsubscribes from every list found in message_headers.
+        Returns {"count": lists unsubscribed, "messages": n, "skipped": n, "lists": [per list outcome]}.
+        """
+        lists = group_by_list(message_headers)
+        results, work = [], []
+        for target in lists:
+            options = target.pop("options")
+            entry = {"list": target["list"], "sender": target["sender"], "messages": len(target["ids"])}
+            if options["oneClick"]:
+                entry["method"] = "one-click"
+                entry["url"] = next((u for u in options["https"] if u.lower().startswith('https:')), options["https"][0])
+                work.append(entry)
+            elif options["https"] or options["mailto"]:
+                entry.update(method="manual", status="manual", url=(options["https"] or options["mailto"])[0])
+                UNSUBSCRIBE_REQUESTS.inc(outcome="manual")
+                results.append(entry)
+            else:
+                entry.update(method="none", status="unsupported")
+                UNSUBSCRIBE_REQUESTS.inc(outcome="unsupported")
+                results.append(entry)
+
+        if work:
+            results.extend(self._pool.map(self._run_one, _interleave_by_host(work)))
+
+        messages = sum(1 for h in message_headers if 'error' not in h)
+        return {
+            "count": sum(1 for r in results if r["status"] == "ok"),
+            "messages": messages,
+            # Neither list headers nor a sender address: nothing to unsubscribe from
+            "skipped": messages - sum(r["messages"] for r in results),
+            "lists": results,
+        }
+
+
+# Shared by every request and account, so UNSUBSCRIBE_WORKERS / _PER_HOST / _HOST_INTERVAL hold
+# process-wide
+unsubscribe_executor = UnsubscribeExecutor()
+
+
+def unsubscribe_messages(message_headers):
+    """Runs the shared executor over the List-* headers of some messages."""
+    return unsubscribe_executor.run(message_headers)
@@ -52,7 +52,8 @@ export default function CategoryTable({ senders, onAction, processing }: Categor
                                 const ids = group.senders.flatMap(s => s.ids);
                                 onAction('delete', ids);
                             }}
-                            className="ml-4 px-3 py-1 bg-red-100 text-red-600 rounded-md hover:bg-red-200 text-sm font-medium transition-colors"
+                            disabled={processing || group.senders.some(s => s.estimated)}
+                            className="ml-4 px-3 py-1 bg-red-100 text-red-600 rounded-md hover:bg-red-200 text-sm font-medium transition-colors disabled:opacity-50"
                         >
                             Delete All
                         </button>
@@ -1,5 +1,5 @@
 import { useEffect, useState, useRef } from 'react';
-import { getStats, getSenderStats, deleteAll, markAsSpam, unsubscribe, Stats, SenderStat } from '../lib/api';
+import { getStats, getSenderStats, getScanCheckpoint, getCategories, deleteAll, markAsSpam, unsubscribe, Stats, SenderStat } from '../lib/api';
 import StatsCard from './StatsCard';
 import SenderTable from './SenderTable';
 import CategoryTable from './CategoryTable';
@@ -20,6 +20,7 @@ function mergeSenderStats(existing: SenderStat[], incoming: SenderStat[]): Sende
         if (map.has(s.sender)) {
             const current = map.get(s.sender)!;
             current.count += s.count;
+            if (s.estimated) current.estimated = true;
             // Merge IDs unique
             const idSet = new Set([...current.ids, ...s.ids]);
             current.ids = Array.from(idSet);
@@ -31,6 +32,16 @@ function mergeSenderStats(existing: SenderStat[], incoming: SenderStat[]): Sende
     return Array.from(map.values());
 }
 
+// In-progress scan, so a reload can resume it from the server-side checkpoint
+const SCAN_PROGRESS_KEY = 'gmail-cleanup-scan';
+
+interface ScanResume {
+    scanId: string;
+    cursor: string;
+    senders: SenderStat[];
+    scannedCount: number;
+}
+
 export default function Dashboard({ token, onLogout }: { token: string; onLogout: () => void }) {
     const { showToast, success, error } = useToast();
     const [confirmState, setConfirmState] = useState<{
@@ -84,6 +95,7 @@ export default function Dashboard({ token, onLogout }: { token: string; onLogout
                     setLastUpdated(new Date(parsed.timestamp));
                     // Adjust scanned count check to be approximate or just hide if cached
                     setScannedCount(parsed.scannedCount || 0);
+                    refreshCategories(parsed.senders);
                 }
             } catch (e) {
                 console.error("Failed to load cache", e);
@@ -93,6 +105,18 @@ export default function Dashboard({ token, onLogout }: { token: string; onLogout
         // eslint-disable-next-line react-hooks/exhaustive-deps
     }, []);
 
+    // Cached results keep the categories of their scan; re-label them if the rules changed since
+    const refreshCategories = async (cachedSenders: SenderStat[]) => {
+        try {
+            const { categories } = await getCategories(cachedSenders);
+            if (cachedSenders.some(s => categories[s.sender] && categories[s.sender] !== s.category)) {
+                setSenders(prev => prev.map(s => categories[s.sender] ? { ...s, category: categories[s.sender] } : s));
+            }
+        } catch (e) {
+            console.warn("Failed to refresh categories", e);
+        }
+    };
+
     // Save to cache when senders or isScanning changes
     useEffect(() => {
         if (!isScanning && senders.length > 0) {
@@ -110,16 +134,17 @@ export default function Dashboard({ token, onLogout }: { token: string; onLogout
         }
     }, [senders, isScanning, scannedCount]);
 
-    const startScan = async () => {
+    const startScan = async (resume?: ScanResume) => {
         // If we have data and user clicks Scan, we treat it as a "Refresh" - clear cache
         localStorage.removeItem('gmail-cleanup-cache');
+        if (!resume) localStorage.removeItem(SCAN_PROGRESS_KEY);
         setLastUpdated(null);
 
         stopSignalRef.current = false;
         setIsScanning(true);
         setLoading(true); // Keep loading true for initial spinner
-        setScannedCount(0);
-        setSenders([]);
+        setScannedCount(resume ? resume.scannedCount : 0);
+        setSenders(resume ? resume.senders : []);
 
         try {
             const globalStats = await getStats(token);
@@ -127,14 +152,14 @@ export default function Dashboard({ token, onLogout }: { token: string; onLogout
 
             // ... rest of function ...
 
-            let pageToken: string | undefined = undefined;
+            let pageToken: string | undefined = resume?.cursor;
             // ... (rest is same, but I need to make sure I don't cut off)
             // Wait, I cannot use "rest of function" comment in replacement.
             // I need to provide the full content or carefully match blocks.
             // Since this is inserting logic at the top of startScan, I'll match the start.
 
-            let totalFetched = 0;
-            let currentSenders: SenderStat[] = [];
+            let totalFetched = resume ? resume.scannedCount : 0;
+            let currentSenders: SenderStat[] = resume ? resume.senders : [];
 
             const batchSize = 500;
             const target = scanLimit === -1 ? Number.MAX_SAFE_INTEGER : scanLimit;
@@ -154,10 +179,17 @@ export default function Dashboard({ token, onLogout }: { token: string; onLogout
                 totalFetched += batchSize;
 
                 pageToken = res.nextPageToken;
+                if (pageToken && res.scanId) {
+                    localStorage.setItem(SCAN_PROGRESS_KEY, JSON.stringify({
+                        scanId: res.scanId, cursor: pageToken, scannedCount: totalFetched
+                    }));
+                }
                 await new Promise(r => setTimeout(r, 50)); // Breath
 
                 if (!pageToken) break;
             }
+            // Finished or stopped on purpose: nothing to resume
+            localStorage.removeItem(SCAN_PROGRESS_KEY);
         } catch (e) {
             console.error(e);
             if ((e as Error).message.includes('401')) onLogout();
@@ -167,6 +199,29 @@ export default function Dashboard({ token, onLogout }: { token: string; onLogout
         }
     };
 
+    // Picks an interrupted scan back up: completed pages come from the server checkpoint
+    const resumeScan = async (progress: { scanId: string; cursor: string; scannedCount: number }) => {
+        try {
+            const checkpoint = await getScanCheckpoint(token, progress.scanId);
+            if (checkpoint.done || !checkpoint.nextPageToken) {
+                localStorage.removeItem(SCAN_PROGRESS_KEY);
+                setSenders(checkpoint.stats);
+                setScannedCount(checkpoint.messages);
+                setLoading(false);
+                return;
+            }
+            await startScan({
+                scanId: progress.scanId,
+                cursor: checkpoint.nextPageToken,
+                senders: checkpoint.stats,
+                scannedCount: progress.scannedCount,
+            });
+        } catch (e) {
+            console.warn("Could not resume scan, starting over", e);
+            await startScan();
+        }
+    };
+
     const fetchLifetimeStats = async () => {
         try {
             const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'}/api/history`);
@@ -192,7 +247,10 @@ export default function Dashboard({ token, onLogout }: { token: string; onLogout
         // Let's rely on the user to click Scan if cache is empty to be safe? 
         // Or check if cache key exists before starting?
         const hasCache = !!localStorage.getItem('gmail-cleanup-cache');
-        if (!hasCache && scanLimit === 500) {
+        const progress = localStorage.getItem(SCAN_PROGRESS_KEY);
+        if (!hasCache && progress) {
+            resumeScan(JSON.parse(progress));
+        } else if (!hasCache && scanLimit === 500) {
             startScan();
         }
         // eslint-disable-next-line react-hooks/exhaustive-deps
@@ -272,7 +330,14 @@ export default function Dashboard({ token, onLogout }: { token: string; onLogout
                     })).filter(s => s.count > 0));
                 }
                 if (action === 'spam') await markAsSpam(ids, token);
-                if (action === 'unsubscribe') await unsubscribe(ids, token);
+                if (action === 'unsubscribe') {
+                    const report = await unsubscribe(ids, token);
+                    const manual = report.lists.filter(l => l.status === 'manual').length;
+                    const failed = report.lists.filter(l => l.status === 'failed' || l.status === 'refused').length;
+                    showToast(`Unsubscribed from ${report.count} of ${report.lists.length} lists`
+                        + (manual ? `, ${manual} need a manual step` : '')
+                        + (failed ? `, ${failed} failed` : ''), failed ? 'error' : 'info');
+                }
             }
         });
     };
@@ -336,7 +401,7 @@ export default function Dashboard({ token, onLogout }: { token: string; onLogout
                                 </span>
                             )}
                             <button
-                                onClick={startScan}
+                                onClick={() => startScan()}
                                 className="flex items-center space-x-2 px-3 py-2 rounded-lg text-gray-500 hover:text-blue-600 hover:bg-gray-100 dark:hover:bg-gray-700 transition-colors"
                                 title={lastUpdated ? "Refresh Data" : "Start Scan"}
                             >
@@ -1,5 +1,7 @@
 import { useEffect, useState } from 'react';
-import { getBatchEmailDetails, EmailDetail } from '../lib/api';
+import { getEmailDetailsPage, EmailDetail } from '../lib/api';
+
+const PAGE_SIZE = 50;
 
 interface SenderDetailsModalProps {
     isOpen: boolean;
@@ -12,6 +14,8 @@ interface SenderDetailsModalProps {
 export default function SenderDetailsModal({ isOpen, onClose, sender, ids, token }: SenderDetailsModalProps) {
     const [details, setDetails] = useState<EmailDetail[]>([]);
     const [loading, setLoading] = useState(true);
+    const [loadingMore, setLoadingMore] = useState(false);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
     const [error, setError] = useState('');
 
     useEffect(() => {
@@ -21,11 +25,10 @@ export default function SenderDetailsModal({ isOpen, onClose, sender, ids, token
             setLoading(true);
             setError('');
             try {
-                // Fetch only first 20 if too many, to avoid overwhelming UI/User
-                // Or maybe the backend handles batching, but for a popup 20 is a good preview.
-                const targetIds = ids.slice(0, 50);
-                const data = await getBatchEmailDetails(targetIds, token);
-                setDetails(data);
+                // First page only; the rest is loaded on demand (senders can have 20k+ emails)
+                const page = await getEmailDetailsPage(ids, token, null, PAGE_SIZE);
+                setDetails(page.items);
+                setNextCursor(page.nextCursor);
             } catch (err) {
                 setError('Failed to load email details');
             } finally {
@@ -36,6 +39,20 @@ export default function SenderDetailsModal({ isOpen, onClose, sender, ids, token
         fetchDetails();
     }, [isOpen, ids, token]);
 
+    const loadMore = async () => {
+        if (!nextCursor) return;
+        setLoadingMore(true);
+        try {
+            const page = await getEmailDetailsPage(ids, token, nextCursor, PAGE_SIZE);
+            setDetails(prev => [...prev, ...page.items]);
+            setNextCursor(page.nextCursor);
+        } catch (err) {
+            setError('Failed to load more emails');
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     if (!isOpen) return null;
 
     return (
@@ -76,7 +93,13 @@ export default function SenderDetailsModal({ isOpen, onClose, sender, ids, token
                                     </tr>
                                 </thead>
                                 <tbody className="divide-y divide-gray-100 dark:divide-gray-700">
-                                    {details.map((email) => (
+                                    {details.map((email) => email.error ? (
+                                        <tr key={email.id}>
+                                            <td colSpan={4} className="py-3 px-2 text-xs text-red-400">
+                                                Could not load email {email.id}: {email.error}
+                                            </td>
+                                        </tr>
+                                    ) : (
                                         <tr key={email.id} className="hover:bg-gray-50 dark:hover:bg-gray-700/50">
                                             <td className="py-3 px-2 text-gray-500 whitespace-nowrap text-xs">
                                                 {email.date ? new Date(email.date).toLocaleDateString() : 'N/A'}
@@ -94,10 +117,21 @@ export default function SenderDetailsModal({ isOpen, onClose, sender, ids, token
                                     ))}
                                 </tbody>
                             </table>
-                            {ids.length > 50 && (
-                                <p className="text-center text-xs text-gray-400 mt-4">
-                                    Showing first 50 of {ids.length} emails.
-                                </p>
+                            {ids.length > PAGE_SIZE && (
+                                <div className="text-center mt-4">
+                                    <p className="text-xs text-gray-400">
+                                        Showing {details.length} of {ids.length} emails.
+                                    </p>
+                                    {nextCursor && (
+                                        <button
+                                            onClick={loadMore}
+                                            disabled={loadingMore}
+                                            className="mt-2 px-4 py-1.5 text-sm rounded-lg bg-gray-100 hover:bg-gray-200 dark:bg-gray-700 dark:hover:bg-gray-600 dark:text-gray-200 disabled:opacity-50"
+                                        >
+                                            {loadingMore ? 'Loading...' : 'Load more'}
+                                        </button>
+                                    )}
+                                </div>
                             )}
                         </div>
                     )}
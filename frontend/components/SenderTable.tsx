@@ -97,15 +97,18 @@ export default function SenderTable({ senders, onAction, processing, sortColumn,
                                     )}
                                 </td>
                                 <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-500 dark:text-gray-300">
-                                    <span className="inline-flex items-center px-2.5 py-0.5 rounded-full text-xs font-medium bg-gray-100 text-gray-800 dark:bg-gray-800 dark:text-gray-200 border border-gray-200 dark:border-gray-600">
-                                        {stat.count}
+                                    <span
+                                        className="inline-flex items-center px-2.5 py-0.5 rounded-full text-xs font-medium bg-gray-100 text-gray-800 dark:bg-gray-800 dark:text-gray-200 border border-gray-200 dark:border-gray-600"
+                                        title={stat.estimated ? 'Estimated from a sample; run a full scan to act on this sender' : undefined}
+                                    >
+                                        {stat.estimated ? '~' : ''}{stat.count}
                                     </span>
                                 </td>
                                 <td className="px-6 py-4 whitespace-nowrap text-right text-sm font-medium space-x-2">
                                     <div className="flex justify-end space-x-3">
                                         <button
                                             onClick={() => onAction('delete', stat.ids)}
-                                            disabled={processing}
+                                            disabled={processing || stat.estimated}
                                             className="text-red-500 hover:text-red-700 dark:text-red-400 dark:hover:text-red-300 disabled:opacity-50 transition-colors"
                                             title="Delete All"
                                         >
@@ -113,7 +116,7 @@ export default function SenderTable({ senders, onAction, processing, sortColumn,
                                         </button>
                                         <button
                                             onClick={() => onAction('spam', stat.ids)}
-                                            disabled={processing}
+                                            disabled={processing || stat.estimated}
                                             className="text-orange-500 hover:text-orange-700 dark:text-orange-400 dark:hover:text-orange-300 disabled:opacity-50 transition-colors"
                                             title="Mark as Spam"
                                         >
@@ -121,7 +124,7 @@ export default function SenderTable({ senders, onAction, processing, sortColumn,
                                         </button>
                                         <button
                                             onClick={() => onAction('unsubscribe', stat.ids)}
-                                            disabled={processing}
+                                            disabled={processing || stat.estimated}
                                             className="text-gray-500 hover:text-gray-700 dark:text-gray-400 dark:hover:text-gray-200 disabled:opacity-50 transition-colors"
                                             title="Unsubscribe (Attempt)"
                                         >
@@ -67,15 +67,85 @@ export async function markAsSpam(ids: string[], token?: string) {
     return res.json();
 }
 
+export interface ProviderUsage {
+    calls: Record<string, number>;
+    apiCalls: number;
+    quotaUnits: number | null;  // Gmail only
+    seconds: number;
+}
+
+export interface CostEstimate extends ProviderUsage {
+    strategy: string;
+    exact: boolean;
+    mode?: ScanMode;
+}
+
+export interface CostPlan {
+    kind: 'scan' | 'action';
+    provider: string;
+    inputs: Record<string, any>;
+    strategies: CostEstimate[];
+    recommended: string;
+    mode?: ScanMode;
+}
+
+export type ScanMode = 'messages' | 'threads' | 'sampled' | 'auto';
+
 export interface PaginatedSenderStats {
     stats: SenderStat[];
     nextPageToken?: string;
+    scanId?: string;
+    mode?: ScanMode;
+    usage?: ProviderUsage;
+    plan?: CostPlan;
+}
+
+export interface ScanCheckpoint {
+    scan: string;
+    pages: number;
+    messages: number;
+    nextPageToken?: string;
+    done: boolean;
+    stats: SenderStat[];
+    plan?: CostPlan;
+    usage?: ProviderUsage;
 }
 
-export async function getSenderStats(token: string, limit: number = 500, pageToken?: string): Promise<PaginatedSenderStats> {
+// Completed pages of an interrupted scan, to resume from nextPageToken
+export async function getScanCheckpoint(token: string, scanId: string): Promise<ScanCheckpoint> {
+    const res = await fetch(`${API_URL}/api/scans/${scanId}`, {
+        headers: { 'x-auth-token': token },
+    });
+    if (!res.ok) throw new Error(`Failed to fetch scan checkpoint: ${res.status}`);
+    return res.json();
+}
+
+// Estimated calls, quota units and time of a scan, per strategy, before running it
+export async function getScanPlan(token: string, limit: number = 500, estimates: boolean = false): Promise<CostPlan> {
+    const params = new URLSearchParams({ limit: limit.toString() });
+    if (estimates) params.append('estimates', 'true');
+    const res = await fetch(`${API_URL}/api/plan/scan?${params.toString()}`, {
+        headers: { 'x-auth-token': token },
+    });
+    if (!res.ok) throw new Error(`Failed to plan scan: ${res.status}`);
+    return res.json();
+}
+
+export async function getActionPlan(token: string, action: 'delete' | 'spam' | 'unsubscribe', ids: string[], lists?: number): Promise<CostPlan> {
+    const res = await fetch(`${API_URL}/api/plan/action`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'x-auth-token': token },
+        body: JSON.stringify({ action, ids, lists }),
+    });
+    if (!res.ok) throw new Error(`Failed to plan action: ${res.status}`);
+    return res.json();
+}
+
+export async function getSenderStats(token: string, limit: number = 500, pageToken?: string, mode: ScanMode = 'messages'): Promise<PaginatedSenderStats> {
     const params = new URLSearchParams();
     params.append('limit', limit.toString());
     if (pageToken) params.append('pageToken', pageToken);
+    if (mode !== 'messages') params.append('mode', mode);
 
     const res = await fetch(`${API_URL}/api/senders?${params.toString()}`, {
         headers: { 'x-auth-token': token },
@@ -84,6 +154,80 @@ export async function getSenderStats(token: string, limit: number = 500, pageTok
     return res.json();
 }
 
+export interface SearchResult {
+    ids: string[];
+    senders: SenderStat[];
+    total: number;
+    truncated: boolean;
+    tookMs: number;
+}
+
+// Searches the backend's local index of already fetched messages (no Gmail/IMAP round trip)
+export async function searchLocal(token: string, q: string, limit: number = 1000): Promise<SearchResult> {
+    const params = new URLSearchParams({ q, limit: limit.toString() });
+    const res = await fetch(`${API_URL}/api/search?${params.toString()}`, {
+        headers: { 'x-auth-token': token },
+    });
+    if (!res.ok) throw new Error(`Search failed: ${res.status}`);
+    return res.json();
+}
+
+export interface CategoryLookup {
+    version: string;
+    categories: Record<string, string>;
+}
+
+// Current categories for senders of saved results (they change when the backend's rules change)
+export async function getCategories(senders: SenderStat[]): Promise<CategoryLookup> {
+    const res = await fetch(`${API_URL}/api/categories`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ senders: senders.map(s => ({ sender: s.sender, email: s.email || '' })) }),
+    });
+    if (!res.ok) throw new Error(`Failed to fetch categories: ${res.status}`);
+    return res.json();
+}
+
+// Several logged-in accounts at once (one token each); pages run in parallel on the backend
+export interface AccountSenderStat extends Omit<SenderStat, 'ids'> {
+    accounts: { account: string; count: number; ids: string[] }[];
+}
+
+export interface AccountOutcome {
+    provider?: 'gmail' | 'imap';
+    account?: string | null;
+    nextPageToken?: string | null;
+    scanId?: string;
+    count?: number;
+    ms?: number;
+    error?: string;
+}
+
+export interface MultiAccountSenderStats {
+    stats: AccountSenderStat[];
+    accounts: Record<string, AccountOutcome>;
+}
+
+export async function getMultiAccountSenderStats(tokens: string[], limit: number = 500, cursors?: Record<string, string | null>): Promise<MultiAccountSenderStats> {
+    const res = await fetch(`${API_URL}/api/accounts/senders`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ tokens, limit, cursors }),
+    });
+    if (!res.ok) throw new Error(`Failed to fetch sender stats: ${res.status}`);
+    return res.json();
+}
+
+export async function multiAccountAction(action: 'delete' | 'spam' | 'unsubscribe', idsByToken: Record<string, string[]>): Promise<{ count: number; accounts: Record<string, AccountOutcome> }> {
+    const res = await fetch(`${API_URL}/api/accounts/actions`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ action, ids: idsByToken }),
+    });
+    if (!res.ok) throw new Error(`Failed to ${action}: ${res.status}`);
+    return res.json();
+}
+
 // Basic types
 export interface Email {
     id: string;
@@ -98,6 +242,34 @@ export interface SenderStat {
     count: number;
     ids: string[];
     category?: string;
+    email?: string;
+    domain?: string;
+    threads?: number;
+    estimated?: boolean;    // count extrapolated from a sampled scan: ids is empty, no bulk actions
+    sampleIds?: string[];   // the sampled messages of an estimated row
+    ages?: number[];        // messages per AGE_BUCKETS_DAYS bucket: <7, 7-30, 30-90, 90-365, 365+ days
+    oldest?: number;        // received, epoch seconds
+    newest?: number;
+}
+
+export const AGE_BUCKETS_DAYS = [7, 30, 90, 365];
+
+export interface DateRange {
+    senders: string[];      // sender names or addresses, as in SenderStat
+    olderThanDays?: number;
+    newerThanDays?: number;
+}
+
+// e.g. delete everything older than 90 days from some senders; resolved by the backend within
+// the given ids and/or scan (one of them is required)
+export async function actionByDate(token: string, action: 'delete' | 'spam' | 'unsubscribe', range: DateRange, scope: { ids?: string[]; scanId?: string }) {
+    const res = await fetch(`${API_URL}/api/emails/by-date`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'x-auth-token': token },
+        body: JSON.stringify({ action, ...range, ids: scope.ids, scanId: scope.scanId }),
+    });
+    if (!res.ok) throw new Error(`Failed to run ${action} by date: ${res.status}`);
+    return res.json();
 }
 
 export interface Stats {
@@ -105,7 +277,25 @@ export interface Stats {
     threadsUnread: number;
 }
 
-export async function unsubscribe(ids: string[], token?: string) {
+export interface UnsubscribeOutcome {
+    list: string;
+    sender: string | null;
+    messages: number;
+    method: 'one-click' | 'manual' | 'none';
+    status: 'ok' | 'failed' | 'refused' | 'manual' | 'unsupported';
+    url?: string;
+    httpStatus?: number | null;
+    error?: string;
+}
+
+export interface UnsubscribeReport {
+    count: number;
+    messages: number;
+    skipped: number;
+    lists: UnsubscribeOutcome[];
+}
+
+export async function unsubscribe(ids: string[], token?: string): Promise<UnsubscribeReport> {
     const headers: any = { 'Content-Type': 'application/json' };
     if (token) headers['x-auth-token'] = token;
 
@@ -133,6 +323,13 @@ export interface EmailDetail {
     subject: string;
     date: string;
     snippet: string;
+    error?: string; // Set (and the other fields absent) when this message couldn't be fetched
+}
+
+export interface EmailDetailsPage {
+    items: EmailDetail[];
+    nextCursor: string | null;
+    total: number;
 }
 
 export async function getBatchEmailDetails(ids: string[], token?: string): Promise<EmailDetail[]> {
@@ -148,6 +345,20 @@ export async function getBatchEmailDetails(ids: string[], token?: string): Promi
     return res.json();
 }
 
+// Page through the details of a long id list; pass nextCursor back for the next page
+export async function getEmailDetailsPage(ids: string[], token?: string, cursor?: string | null, limit: number = 50): Promise<EmailDetailsPage> {
+    const headers: any = { 'Content-Type': 'application/json' };
+    if (token) headers['x-auth-token'] = token;
+
+    const res = await fetch(`${API_URL}/api/emails/details`, {
+        method: 'POST',
+        headers,
+        body: JSON.stringify({ ids, cursor, limit }),
+    });
+    if (!res.ok) throw new Error(`Failed to fetch email details: ${res.status}`);
+    return res.json();
+}
+
 export interface HistoryLog {
     timestamp: number;
     date: string;